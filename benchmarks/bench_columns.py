@@ -0,0 +1,232 @@
+# ==============================================================
+# Plugin QGIS : iNaturalist Import
+# Script     : benchmarks/bench_columns.py
+# Rôle       : Micro-benchmark observation → attributs (lignes/s)
+#              avant : chaîne if/elif par observation
+#              après : liste d'extracteurs figée (yd_columns)
+#
+# Exemples (depuis la racine du dépôt) :
+#   python benchmarks/bench_columns.py
+#   python benchmarks/bench_columns.py --rows 500000 --photo-mode all
+#   python benchmarks/bench_columns.py --payload reponse_observations.json
+#   python benchmarks/bench_columns.py --cache ~/.yd_iNaturalist_Import/yd_cache_api.sqlite
+#
+# Avec le Python de QGIS, date_obs est un QDateTime (comme dans le plugin) ;
+# sinon un datetime Python pour les deux variantes.
+# ==============================================================
+
+import argparse
+import json
+import os
+import sqlite3
+import sys
+import time
+import zlib
+from datetime import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from iNaturalist_Import.yd_columns import yd_compile_columns, yd_large_photo_url  # noqa: E402
+
+BASE_ORDER = [
+    "inat_id", "date_obs", "scientific_name", "vernacular_name_FR", "latitude",
+    "longitude", "place_guess", "taxon_id", "taxon_rank", "url_obs", "url_taxon",
+    "observateur_id", "observateur_name", "quality_grade", "precision",
+]
+SAMPLE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data",
+                      "observations_sample.json")
+
+try:
+    from qgis.PyQt.QtCore import Qt, QDateTime
+
+    def make_datetime(*parts):
+        return QDateTime(*parts)
+
+    def now():
+        return QDateTime.currentDateTime()
+
+    def parse_iso(text):
+        d = QDateTime.fromString(text, Qt.ISODate)
+        return d if d.isValid() else None
+
+    DATES = "QDateTime"
+except ImportError:
+    make_datetime = datetime
+    now = datetime.now
+
+    def parse_iso(text):
+        try:
+            return datetime.fromisoformat(text.replace('Z', '+00:00'))
+        except ValueError:
+            return None
+
+    DATES = "datetime"
+
+
+def _large_url_legacy(url):
+    return url.replace('square.jpg', 'large.jpg') \
+              .replace('square.jpeg', 'large.jpeg') \
+              .replace('square.png', 'large.png')
+
+
+def legacy_attributes(obs, ordered_fields, photo_mode, max_photos=0):
+    """Version d'origine (chaîne if/elif, date et URL recalculées à chaque ligne)."""
+    coords = obs['geojson']['coordinates']
+    lon, lat_obs = coords[0], coords[1]
+
+    taxon = obs.get('taxon', {}) or {}
+    user = obs.get('user', {}) or {}
+    photos = obs.get('photos', []) or []
+
+    date_py = obs.get('time_observed_at') or obs.get('observed_on')
+    date_qt = None
+    if date_py:
+        if isinstance(date_py, str):
+            date_qt = parse_iso(date_py)
+        else:
+            date_qt = make_datetime(date_py.year, date_py.month, date_py.day,
+                                    date_py.hour, date_py.minute, date_py.second)
+    if date_qt is None:
+        date_qt = now()
+
+    sci = taxon.get('name')
+    vern_fr = taxon.get('preferred_common_name')
+    precision_val = obs.get('positional_accuracy')
+    place_val = obs.get('place_guess')
+
+    attrs = []
+    for champ in ordered_fields:
+        if champ == "inat_id":
+            attrs.append(obs.get('id'))
+        elif champ == "date_obs":
+            attrs.append(date_qt)
+        elif champ == "scientific_name":
+            attrs.append(sci)
+        elif champ == "vernacular_name_FR":
+            attrs.append(vern_fr)
+        elif champ == "latitude":
+            attrs.append(lat_obs)
+        elif champ == "longitude":
+            attrs.append(lon)
+        elif champ == "place_guess":
+            attrs.append(place_val)
+        elif champ == "taxon_id":
+            attrs.append(taxon.get('id'))
+        elif champ == "taxon_rank":
+            attrs.append(taxon.get('rank'))
+        elif champ == "url_obs":
+            attrs.append(f"https://www.inaturalist.org/observations/{obs.get('id')}")
+        elif champ == "url_taxon":
+            attrs.append(
+                f"https://www.inaturalist.org/taxa/{taxon.get('id')}"
+                if taxon.get('id') else None
+            )
+        elif champ == "observateur_id":
+            attrs.append(user.get('login'))
+        elif champ == "observateur_name":
+            attrs.append(user.get('name'))
+        elif champ == "quality_grade":
+            attrs.append(obs.get('quality_grade'))
+        elif champ == "precision":
+            attrs.append(precision_val)
+
+    if photo_mode == "one":
+        p = photos[0] if photos else None
+        attrs.append(_large_url_legacy(p['url']) if p and p.get('url') else None)
+    elif photo_mode == "all":
+        photo_urls = [
+            _large_url_legacy(p['url']) if p and p.get('url') else None
+            for p in photos
+        ]
+        photo_urls += [None] * (max_photos - len(photo_urls))
+        attrs.append(len(photos))
+        attrs.extend(photo_urls)
+    elif photo_mode == "table":
+        attrs.append(len(photos))
+    return attrs
+
+
+def load_payload(path):
+    with open(path, encoding="utf-8") as f:
+        data = json.load(f)
+    return data.get("results", []) if isinstance(data, dict) else data
+
+
+def load_cache(path):
+    """Observations des réponses enregistrées dans le cache API du plugin."""
+    conn = sqlite3.connect(path)
+    observations = {}
+    for (value,) in conn.execute("SELECT value FROM responses"):
+        resp = json.loads(zlib.decompress(value).decode("utf-8"))
+        for obs in (resp.get("results") or []) if isinstance(resp, dict) else []:
+            if isinstance(obs, dict) and obs.get("geojson") and "quality_grade" in obs:
+                observations[obs.get("id")] = obs
+    conn.close()
+    return list(observations.values())
+
+
+def bench(label, build, observations, rows):
+    n = 0
+    t0 = time.perf_counter()
+    while n < rows:
+        for obs in observations:
+            build(obs)
+            n += 1
+            if n >= rows:
+                break
+    dt = time.perf_counter() - t0
+    print(f"{label:<22} {n / dt:>12,.0f} lignes/s  ({dt:.2f} s)")
+    return n / dt
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Micro-benchmark observation → attributs")
+    parser.add_argument("--payload", help="réponse /observations enregistrée (JSON)")
+    parser.add_argument("--cache", help="cache API du plugin (yd_cache_api.sqlite)")
+    parser.add_argument("--rows", type=int, default=200000)
+    parser.add_argument("--photo-mode", default="all", choices=("none", "one", "all", "table"))
+    args = parser.parse_args(argv)
+
+    if args.cache:
+        observations = load_cache(args.cache)
+    else:
+        observations = load_payload(args.payload or SAMPLE)
+    observations = [o for o in observations if (o.get("geojson") or {}).get("coordinates")]
+    if not observations:
+        print("Aucune observation géolocalisée dans les données.")
+        return 1
+
+    fields = BASE_ORDER
+    mode = args.photo_mode
+    max_photos = max(len(o.get("photos") or []) for o in observations) if mode == "all" else 0
+    print(f"{len(observations)} observations, {args.rows} lignes, "
+          f"mode photo {mode}, dates {DATES}")
+
+    # Mêmes valeurs des deux côtés (hors date de repli « maintenant »)
+    row = yd_compile_columns(fields, mode, make_datetime, now)
+    for obs in observations:
+        coords = obs["geojson"]["coordinates"]
+        a = legacy_attributes(obs, fields, mode, max_photos)
+        b = row(obs, (coords[0], coords[1]), max_photos)
+        if obs.get("time_observed_at") or obs.get("observed_on"):
+            assert len(a) == len(b) and a[2:] == b[2:] and a[0] == b[0], obs.get("id")
+
+    before = bench("avant (if/elif)",
+                   lambda obs: legacy_attributes(obs, fields, mode, max_photos),
+                   observations, args.rows)
+
+    # Plan compilé une fois, caches vidés pour ne pas favoriser la mesure
+    yd_large_photo_url.cache_clear()
+    row = yd_compile_columns(fields, mode, make_datetime, now)
+
+    def compiled(obs):
+        coords = obs["geojson"]["coordinates"]
+        return row(obs, (coords[0], coords[1]), max_photos)
+
+    after = bench("après (extracteurs)", compiled, observations, args.rows)
+    print(f"gain : x{after / before:.2f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
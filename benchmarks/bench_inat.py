@@ -0,0 +1,349 @@
+# ==============================================================
+# Plugin QGIS : iNaturalist Import
+# Script     : benchmarks/bench_inat.py
+# Rôle       : Benchmark hors ligne des chaînes Script 1 et Script 2 contre
+#              le serveur local benchmarks/stub_inat.py (aucun réseau)
+#              fetch    : pagination /observations seule (pages/s, obs/s)
+#              import   : Script 1 complet → GPKG (pages/s, entités/s)
+#              taxonomy : Script 2 sur ce GPKG (taxons/s, entités/s)
+#              + pic mémoire (RSS) de chaque scénario
+#
+# Exemples (depuis la racine du dépôt) :
+#   python benchmarks/bench_inat.py
+#   python benchmarks/bench_inat.py --sizes 10k,100k,1M --json resultats.json
+#   python benchmarks/bench_inat.py --sizes 100k --latency-ms 80 --p429 0.02
+#   python benchmarks/bench_inat.py --baseline resultats.json --tolerance 0.2
+#   python benchmarks/bench_inat.py --replay benchmarks/data/replay
+#
+# Le serveur et chaque taille tournent dans des processus séparés : le pic
+# mémoire mesuré est celui du plugin seul. import et taxonomy demandent le
+# Python de QGIS (qgis.core, sans affichage) ; fetch se contente de requests.
+# Code de sortie 1 si --baseline détecte une régression.
+# ==============================================================
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from urllib.request import urlopen
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+STUB = os.path.join(HERE, "stub_inat.py")
+SCENARIOS = ("fetch", "import", "taxonomy")
+# Cercle couvrant tout le jeu synthétique (cf. stub_inat.CENTER)
+CENTER = (45.19, 5.72)
+RADIUS_M = 80000
+# Débits comparés à --baseline (plus haut = meilleur)
+RATES = ("pages_s", "obs_s", "features_s", "taxa_s")
+
+
+# ==============================================================
+# Processus de mesure (une taille, tous les scénarios)
+# ==============================================================
+
+def _setup(url, rate):
+    from iNaturalist_Import import yd_api
+    from iNaturalist_Import.yd_ratelimit import yd_LIMITEUR
+
+    yd_api.API_V2_OBSERVATIONS = url + "/v2/observations"
+    # Limiteur partagé : débit du benchmark (le serveur peut imposer ses 429)
+    yd_LIMITEUR.rate = yd_LIMITEUR.max_rate = float(rate)
+    yd_LIMITEUR.burst = max(4.0, float(rate) / 10.0)
+    yd_LIMITEUR.reset_stats()
+
+
+def _stub_get_taxa(url):
+    # Équivalent de pyinaturalist get_taxa_by_id(taxon_id=[...]) vers le serveur local
+    from iNaturalist_Import.yd_api import TIMEOUT_S, _session
+
+    def get_taxa_by_id(taxon_id=None, **params):
+        ids = taxon_id if isinstance(taxon_id, (list, tuple)) else [taxon_id]
+        resp = _session().get(f"{url}/v1/taxa/{','.join(str(t) for t in ids)}",
+                              params=params, timeout=TIMEOUT_S)
+        resp.raise_for_status()
+        return resp.json()
+    return get_taxa_by_id
+
+
+def _rates(result, seconds, **counts):
+    result["seconds"] = round(seconds, 3)
+    for name, n in counts.items():
+        result[name] = n
+        key = {"pages": "pages_s", "observations": "obs_s", "features": "features_s",
+               "taxa": "taxa_s"}.get(name)
+        if key:
+            result[key] = round(n / seconds, 1) if seconds > 0 else 0.0
+    return result
+
+
+def worker(args):
+    """Toutes les mesures d'une taille ; résultat JSON sur la dernière ligne."""
+    from iNaturalist_Import.yd_metrics import yd_Metrics, yd_peak_rss_mb
+
+    _setup(args.url, args.rate)
+    out = {"size": args.size, "scenarios": {}}
+    scenarios = args.scenarios.split(",")
+
+    # ---------- fetch : pagination seule (requests, sans QGIS) ----------
+    if "fetch" in scenarios:
+        from iNaturalist_Import.yd_api import yd_get_observations_v2
+        from iNaturalist_Import.yd_fetch import yd_fetch_pages
+
+        metrics = yd_Metrics(run={"scenario": "fetch"}, profile=False)
+        # Comme yd_engine : projection commune par défaut (API_FIELDS_ALL)
+        params = {"lat": CENTER[0], "lng": CENTER[1], "radius": RADIUS_M / 1000.0}
+        pages = n_obs = 0
+        t0 = time.perf_counter()
+        for results in yd_fetch_pages(yd_get_observations_v2, params, metrics=metrics):
+            pages += 1
+            n_obs += len(results)
+        res = _rates({}, time.perf_counter() - t0, pages=pages, observations=n_obs)
+        api = metrics.summary()["stages"].get("api:yd_get_observations_v2", {})
+        res["mb"] = round(api.get("bytes", 0) / 1048576.0, 1)
+        res["api_p95_ms"] = round(api.get("p95_s", 0) * 1000, 1)
+        res["peak_rss_mb"] = round(yd_peak_rss_mb(), 1)
+        out["scenarios"]["fetch"] = res
+
+    if not {"import", "taxonomy"} & set(scenarios):
+        return out
+    try:
+        from qgis.core import QgsApplication, QgsVectorLayer
+    except ImportError:
+        out["skipped"] = "qgis.core absent : import / taxonomy non mesurés"
+        return out
+
+    qgs = QgsApplication([], False)
+    qgs.initQgis()
+    from iNaturalist_Import.yd_api import yd_get_observations_v2
+    from iNaturalist_Import.yd_engine import (
+        yd_build_params, yd_import_observations, yd_layer_name, yd_ordered_fields
+    )
+    from iNaturalist_Import.yd_ratelimit import yd_LIMITEUR
+    from iNaturalist_Import.yd_taxonomy import (
+        yd_add_taxonomy_fields, yd_build_taxonomy, yd_unique_taxa,
+        yd_write_taxonomy_gpkg
+    )
+
+    def quiet(msg):
+        if args.verbose:
+            print(msg, file=sys.stderr)
+
+    tmp = tempfile.mkdtemp(prefix="yd_bench_")
+    layer_name = yd_layer_name(f"bench_{args.size}", RADIUS_M)
+    gpkg_path = os.path.join(tmp, f"{layer_name}.gpkg")
+
+    # ---------- import : Script 1 (moteur complet → GPKG) ----------
+    metrics = yd_Metrics(run={"scenario": "import", "size": args.size}, profile=args.profile)
+    params = yd_build_params(CENTER[0], CENTER[1], RADIUS_M)
+    ordered_fields = yd_ordered_fields(args.fields.split(","))
+    yd_LIMITEUR.reset_stats()
+    t0 = time.perf_counter()
+    result = yd_import_observations(
+        yd_get_observations_v2, params, ordered_fields, args.photo_mode, layer_name,
+        gpkg_path=gpkg_path, log=quiet, metrics=metrics,
+    )
+    summary = metrics.summary()
+    api = summary["stages"].get("api:yd_get_observations_v2", {})
+    res = _rates({}, time.perf_counter() - t0, pages=api.get("n", 0),
+                 observations=result["n_obs"], features=result["n_feats"])
+    res["mb"] = round(api.get("bytes", 0) / 1048576.0, 1)
+    res["throttles"] = yd_LIMITEUR.throttles
+    res["peak_rss_mb"] = summary["peak_rss_mb"]
+    if args.keep:
+        res["metrics"] = metrics.path
+    out["scenarios"]["import"] = res
+
+    # ---------- taxonomy : Script 2 (sur le GPKG importé) ----------
+    if "taxonomy" in scenarios and result["n_feats"]:
+        vl = QgsVectorLayer(f"{gpkg_path}|layername={layer_name}", layer_name, "ogr")
+        metrics = yd_Metrics(run={"scenario": "taxonomy", "size": args.size},
+                             profile=args.profile)
+        yd_LIMITEUR.reset_stats()
+        t0 = time.perf_counter()
+        with metrics.stage("unique_taxa"):
+            taxa = sorted(yd_unique_taxa(vl))
+        t_build = time.perf_counter()
+        taxo_map, errors = yd_build_taxonomy(_stub_get_taxa(args.url), taxa, log=quiet,
+                                             metrics=metrics)
+        t_build = time.perf_counter() - t_build
+        yd_add_taxonomy_fields(vl, log=quiet)
+        t_write = time.perf_counter()
+        commit_ok, n_updated, _ = yd_write_taxonomy_gpkg(gpkg_path, layer_name, taxo_map,
+                                                         log=quiet, metrics=metrics)
+        t_write = time.perf_counter() - t_write
+        summary = metrics.summary()
+        api = summary["stages"].get("api:get_taxa_by_id", {})
+        res = _rates({}, time.perf_counter() - t0, taxa=len(taxa), features=n_updated)
+        res["taxa_s"] = round(len(taxa) / t_build, 1) if t_build > 0 else 0.0
+        res["features_s"] = round(n_updated / t_write, 1) if t_write > 0 else 0.0
+        res["api_calls"] = api.get("n", 0)
+        res["errors"] = errors
+        res["commit_ok"] = commit_ok
+        res["throttles"] = yd_LIMITEUR.throttles
+        res["peak_rss_mb"] = summary["peak_rss_mb"]
+        out["scenarios"]["taxonomy"] = res
+
+    if not args.keep:
+        import shutil
+        shutil.rmtree(tmp, ignore_errors=True)
+    qgs.exitQgis()
+    return out
+
+
+# ==============================================================
+# Pilote : serveur local + une mesure par taille
+# ==============================================================
+
+def start_stub(args, size):
+    cmd = [sys.executable, STUB, "--size", size, "--port", "0",
+           "--latency-ms", str(args.latency_ms), "--jitter-ms", str(args.jitter_ms),
+           "--p429", str(args.p429), "--rps", str(args.rps),
+           "--retry-after", str(args.retry_after)]
+    if args.replay:
+        cmd += ["--replay", args.replay]
+    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, text=True)
+    line = proc.stdout.readline()
+    if not line.startswith("PORT "):
+        proc.kill()
+        raise RuntimeError("serveur local non démarré")
+    return proc, f"http://127.0.0.1:{int(line.split()[1])}"
+
+
+def run_size(args, size):
+    """
+    fetch, puis import + taxonomy (le second lit le GPKG du premier), chacun
+    dans son processus : pic mémoire distinct pour fetch, cumulé pour taxonomy.
+    """
+    wanted = args.scenarios.split(",")
+    groups = [g for g in (["fetch"], ["import", "taxonomy"]) if set(g) & set(wanted)]
+    stub, url = start_stub(args, size)
+    out = {"size": size, "scenarios": {}}
+    try:
+        for group in groups:
+            cmd = [sys.executable, os.path.abspath(__file__), "--worker", "--url", url,
+                   "--size", size, "--scenarios", ",".join(s for s in group if s in wanted),
+                   "--rate", str(args.rate), "--photo-mode", args.photo_mode,
+                   "--fields", args.fields]
+            for flag in ("profile", "keep", "verbose"):
+                if getattr(args, flag):
+                    cmd.append(f"--{flag}")
+            proc = subprocess.run(cmd, stdout=subprocess.PIPE, text=True)
+            lines = proc.stdout.strip().splitlines()
+            if proc.returncode != 0 or not lines:
+                return {"size": size, "error": f"{'+'.join(group)} : code {proc.returncode}"}
+            part = json.loads(lines[-1])
+            out["scenarios"].update(part["scenarios"])
+            if part.get("skipped"):
+                out["skipped"] = part["skipped"]
+        with urlopen(f"{url}/_stats", timeout=10) as resp:
+            out["server"] = json.load(resp)
+        return out
+    finally:
+        stub.terminate()
+        stub.wait()
+
+
+def print_report(results):
+    print(f"{'taille':<7} {'scénario':<9} {'pages/s':>9} {'obs/s':>10} {'entités/s':>10} "
+          f"{'taxons/s':>9} {'RSS Mo':>8} {'durée s':>8}")
+    for out in results:
+        if "error" in out:
+            print(f"{out['size']:<7} ❌ {out['error']}")
+            continue
+        for name in SCENARIOS:
+            res = out["scenarios"].get(name)
+            if res is None:
+                continue
+            cols = [f"{res[k]:>{w},.1f}" if k in res else f"{'-':>{w}}"
+                    for k, w in (("pages_s", 9), ("obs_s", 10), ("features_s", 10),
+                                 ("taxa_s", 9), ("peak_rss_mb", 8), ("seconds", 8))]
+            print(f"{out['size']:<7} {name:<9} " + " ".join(cols))
+        if out.get("skipped"):
+            print(f"{out['size']:<7} ℹ️ {out['skipped']}")
+        server = out.get("server") or {}
+        if server:
+            print(f"{'':<7} serveur : {server['requests']} requêtes, "
+                  f"{server['http_429']} × 429, {server['bytes'] / 1048576.0:.1f} Mo")
+
+
+def compare(results, baseline_path, tolerance):
+    """Régressions (débit < (1 - tolerance) × référence) ; liste de textes."""
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = {out["size"]: out for out in json.load(f)["results"]}
+    regressions = []
+    for out in results:
+        ref = baseline.get(out["size"])
+        if ref is None or "error" in out:
+            continue
+        for name, res in out["scenarios"].items():
+            ref_res = ref.get("scenarios", {}).get(name, {})
+            for key in RATES:
+                if key in res and ref_res.get(key):
+                    ratio = res[key] / ref_res[key]
+                    if ratio < 1.0 - tolerance:
+                        regressions.append(f"{out['size']} {name} {key} : {res[key]:,.1f} "
+                                           f"(référence {ref_res[key]:,.1f}, x{ratio:.2f})")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark hors ligne Script 1 / Script 2")
+    parser.add_argument("--sizes", default="10k,100k", help="ex. 10k,100k,1M")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS))
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--jitter-ms", type=float, default=0.0)
+    parser.add_argument("--p429", type=float, default=0.0)
+    parser.add_argument("--rps", type=float, default=0.0,
+                        help="débit max du serveur avant 429 ; 0 = illimité")
+    parser.add_argument("--retry-after", type=int, default=1)
+    parser.add_argument("--rate", type=float, default=500.0,
+                        help="débit du limiteur du plugin (req/s)")
+    parser.add_argument("--replay", help="réponses enregistrées (stub_inat.py --record)")
+    parser.add_argument("--photo-mode", default="all", choices=("none", "one", "all", "table"))
+    parser.add_argument("--fields", default="date_obs,scientific_name,vernacular_name_FR,"
+                        "latitude,longitude,place_guess,taxon_rank,url_obs,url_taxon,"
+                        "observateur_id,observateur_name,quality_grade,precision",
+                        help="champs de sortie (hors inat_id / taxon_id)")
+    parser.add_argument("--json", help="résultats écrits dans ce fichier")
+    parser.add_argument("--baseline", help="résultats de référence (--json d'un run précédent)")
+    parser.add_argument("--tolerance", type=float, default=0.15)
+    parser.add_argument("--profile", action="store_true", help="cProfile + tracemalloc")
+    parser.add_argument("--keep", action="store_true", help="garder les GPKG et métriques")
+    parser.add_argument("--verbose", action="store_true")
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--url", help=argparse.SUPPRESS)
+    parser.add_argument("--size", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.worker:
+        print(json.dumps(worker(args)))
+        return 0
+
+    results = []
+    for size in args.sizes.split(","):
+        print(f"⏳ {size} observations…", flush=True)
+        results.append(run_size(args, size.strip()))
+    print_report(results)
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"date": time.strftime("%Y-%m-%d %H:%M:%S"), "args": vars(args),
+                       "results": results}, f, indent=2)
+        print(f"📄 Résultats : {args.json}")
+    if args.baseline:
+        regressions = compare(results, args.baseline, args.tolerance)
+        for text in regressions:
+            print(f"❌ Régression {text}")
+        if regressions:
+            return 1
+        print(f"✅ Aucune régression (tolérance {args.tolerance:.0%})")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,485 @@
+# ==============================================================
+# Plugin QGIS : iNaturalist Import
+# Script     : benchmarks/stub_inat.py
+# Rôle       : Serveur HTTP local imitant l'API iNaturalist, sans réseau
+#              GET /v2/observations : jeu synthétique (10k / 100k / 1M obs)
+#                filtres cercle (lat, lng, radius) ou bbox, quality_grade,
+#                per_page=0, page, order_by=id + id_above, fields (clés)
+#              GET /v1/taxa/<id[,id...]> : arbre taxonomique synthétique
+#              (ancestor_ids comme l'API)
+#              Latence et 429 (Retry-After) injectables ; réponses
+#              enregistrées (--record) puis rejouées (--replay)
+#              GET /_stats : compteurs du serveur (requêtes, 429, octets)
+#
+# Exemples (depuis la racine du dépôt) :
+#   python benchmarks/stub_inat.py --size 100k --port 8765
+#   python benchmarks/stub_inat.py --size 1M --latency-ms 80 --jitter-ms 40 --p429 0.02
+#   python benchmarks/stub_inat.py --size 10k --rps 1 --retry-after 2
+#   python benchmarks/stub_inat.py --record benchmarks/data/replay   (réseau requis)
+#   python benchmarks/stub_inat.py --replay benchmarks/data/replay
+#
+# Bibliothèque standard uniquement. Le port choisi est affiché sur la
+# première ligne de la sortie : « PORT <n> » (--port 0 = port libre).
+# ==============================================================
+
+import argparse
+import bisect
+import hashlib
+import json
+import math
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+from array import array
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.error import HTTPError
+from urllib.parse import parse_qsl, urlencode, urlsplit
+from urllib.request import Request, urlopen
+
+# PARAMÈTRES
+SIZES = {"10k": 10000, "100k": 100000, "1M": 1000000}
+CENTER = (45.19, 5.72)       # lat, lon du centre du nuage de points
+SPREAD_DEG = 0.12            # écart type (degrés) des foyers d'observations
+HOTSPOTS = 25                # foyers (densités très inégales, comme le réel)
+GRID_DEG = 0.01              # maille de l'index spatial
+FIRST_ID = 1000000
+PER_PAGE_DEFAULT = 30
+PER_PAGE_MAX = 200
+OFFSET_MAX = 10000           # au-delà, l'API exige id_above
+QUERY_CACHE = 64             # requêtes (zone + filtres) gardées en mémoire
+QUALITY = ["research"] * 7 + ["needs_id"] * 2 + ["casual"]
+REAL_API = "https://api.inaturalist.org"
+SAMPLE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data",
+                      "observations_sample.json")
+
+# Rangs synthétiques : (rang, rank_level, diviseur de l'indice d'espèce)
+# Les diviseurs sont multiples les uns des autres : l'arbre est emboîté.
+RANKS = [
+    ("kingdom", 70, 8192), ("phylum", 60, 2048), ("subphylum", 57, 1024),
+    ("class", 50, 512), ("order", 40, 128), ("superfamily", 33, 64),
+    ("family", 30, 32), ("subfamily", 27, 16), ("tribe", 25, 8),
+    ("genus", 20, 4), ("species", 10, 1),
+]
+LIFE_ID = 48460
+
+
+# ==============================================================
+# Jeu de données synthétique
+# ==============================================================
+
+class Dataset:
+    """
+    n observations déterministes (graine) : id croissants, coordonnées en
+    foyers gaussiens, taxons tirés selon une loi très inégale. Les
+    observations JSON sont construites à la demande (pages) à partir des
+    modèles de benchmarks/data/observations_sample.json.
+    """
+
+    def __init__(self, n, seed=1, templates=None):
+        self.n = n
+        rnd = random.Random(seed)
+        self.n_species = max(50, min(20000, n // 50))
+        self.templates = templates or [{}]
+
+        hotspots = [(rnd.gauss(CENTER[0], SPREAD_DEG), rnd.gauss(CENTER[1], SPREAD_DEG * 1.4),
+                     rnd.uniform(0.005, 0.05)) for _ in range(HOTSPOTS)]
+        weights = [rnd.paretovariate(1.2) for _ in hotspots]
+        cum = [sum(weights[:k + 1]) for k in range(len(weights))]
+        self.lat = array("d")
+        self.lon = array("d")
+        self.taxon_code = array("l")
+        for _ in range(n):
+            h_lat, h_lon, sigma = rnd.choices(hotspots, cum_weights=cum)[0]
+            self.lat.append(h_lat + rnd.gauss(0, sigma))
+            self.lon.append(h_lon + rnd.gauss(0, sigma * 1.4))
+            r = rnd.random()
+            if r < 0.02:
+                self.taxon_code.append(-1)                      # sans taxon
+            else:
+                sp = int(self.n_species * rnd.random() ** 3)
+                self.taxon_code.append(-2 - sp if r < 0.12 else sp)  # < -1 : genre seul
+
+        self.grid = {}
+        for i in range(n):
+            key = (int(math.floor(self.lat[i] / GRID_DEG)), int(math.floor(self.lon[i] / GRID_DEG)))
+            cell = self.grid.get(key)
+            if cell is None:
+                self.grid[key] = cell = array("l")
+            cell.append(i)
+        self._queries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def obs_id(i):
+        return FIRST_ID + i * 3 + (i % 2)
+
+    @staticmethod
+    def obs_index(obs_id):
+        return (obs_id - FIRST_ID) // 3
+
+    # ---------- requêtes ----------
+    def _candidates(self, s, w, n, e):
+        rows = range(int(math.floor(s / GRID_DEG)), int(math.floor(n / GRID_DEG)) + 1)
+        cols = range(int(math.floor(w / GRID_DEG)), int(math.floor(e / GRID_DEG)) + 1)
+        out = []
+        if len(rows) * len(cols) > len(self.grid):
+            # Très grande zone : parcours des seules mailles occupées
+            for (iy, ix), cell in self.grid.items():
+                if iy in rows and ix in cols:
+                    out.extend(cell)
+            return out
+        for iy in rows:
+            for ix in cols:
+                cell = self.grid.get((iy, ix))
+                if cell is not None:
+                    out.extend(cell)
+        return out
+
+    def query(self, params):
+        """Indices (triés, donc par id croissant) des observations filtrées."""
+        key = tuple(sorted((k, params[k]) for k in (
+            "lat", "lng", "radius", "swlat", "swlng", "nelat", "nelng", "quality_grade")
+            if k in params))
+        with self._lock:
+            hit = self._queries.get(key)
+            if hit is not None:
+                self._queries.move_to_end(key)
+                return hit
+
+        lat, lon = self.lat, self.lon
+        if "swlat" in params:
+            s, w = float(params["swlat"]), float(params["swlng"])
+            n, e = float(params["nelat"]), float(params["nelng"])
+            idx = [i for i in self._candidates(s, w, n, e)
+                   if s <= lat[i] <= n and w <= lon[i] <= e]
+        elif "lat" in params:
+            c_lat, c_lon = float(params["lat"]), float(params["lng"])
+            r_km = float(params.get("radius") or 10)
+            d_lat = r_km / 111.32
+            d_lon = d_lat / max(0.01, math.cos(math.radians(c_lat)))
+            k_lat = 111.32
+            k_lon = 111.32 * math.cos(math.radians(c_lat))
+            r2 = r_km * r_km
+            idx = [i for i in self._candidates(c_lat - d_lat, c_lon - d_lon,
+                                               c_lat + d_lat, c_lon + d_lon)
+                   if ((lat[i] - c_lat) * k_lat) ** 2 + ((lon[i] - c_lon) * k_lon) ** 2 <= r2]
+        else:
+            idx = range(self.n)
+        grades = set((params.get("quality_grade") or "").split(",")) - {""}
+        if grades:
+            idx = [i for i in idx if QUALITY[i % len(QUALITY)] in grades]
+        idx = array("l", sorted(idx))
+
+        with self._lock:
+            self._queries[key] = idx
+            while len(self._queries) > QUERY_CACHE:
+                self._queries.popitem(last=False)
+        return idx
+
+    # ---------- observations ----------
+    def taxon(self, code):
+        """Taxon résumé d'une observation (champ taxon de /observations)."""
+        if code == -1:
+            return None
+        if code < -1:
+            t = self.taxon_record("genus", (-2 - code) // 4)
+        else:
+            t = self.taxon_record("species", code)
+        return {k: t[k] for k in ("id", "name", "rank", "rank_level", "preferred_common_name",
+                                  "iconic_taxon_name")}
+
+    def observation(self, i):
+        tpl = self.templates[i % len(self.templates)]
+        obs_id = self.obs_id(i)
+        when = datetime(2015, 1, 1, 8, 0, 0) + timedelta(minutes=(i * 7919) % 5000000)
+        user_id = 1000 + (i * 31) % 4999
+        photos = []
+        for k, p in enumerate((tpl.get("photos") or [])[:i % 5]):
+            photos.append({
+                "id": obs_id * 10 + k,
+                "license_code": p.get("license_code"),
+                "url": f"https://inaturalist-open-data.s3.amazonaws.com/photos/"
+                       f"{obs_id * 10 + k}/square.jpg",
+                "attribution": p.get("attribution"),
+            })
+        return {
+            "id": obs_id,
+            "uuid": str(uuid.UUID(int=obs_id)),
+            "quality_grade": QUALITY[i % len(QUALITY)],
+            "observed_on": when.strftime("%Y-%m-%d"),
+            "time_observed_at": when.strftime("%Y-%m-%dT%H:%M:%S+01:00") if i % 6 else None,
+            "place_guess": tpl.get("place_guess"),
+            "positional_accuracy": (i * 13) % 250 if i % 4 else None,
+            "geojson": {"type": "Point", "coordinates": [round(self.lon[i], 6),
+                                                         round(self.lat[i], 6)]},
+            "user": {"id": user_id, "login": f"observateur_{user_id}",
+                     "name": f"Observateur {user_id}"},
+            "photos": photos,
+            "taxon": self.taxon(self.taxon_code[i]),
+        }
+
+    # ---------- taxons ----------
+    def taxon_record(self, rank, idx):
+        level = [r[0] for r in RANKS].index(rank)
+        name, rank_level, div = RANKS[level]
+        tid = (level + 1) * 1000000 + idx
+        species = idx * div
+        ancestors = [LIFE_ID] + [(lv + 1) * 1000000 + species // RANKS[lv][2]
+                                 for lv in range(level)]
+        if rank == "species":
+            sci = f"Genus{idx // 4} species{idx}"
+        else:
+            sci = f"{rank.capitalize()}{idx}"
+        return {
+            "id": tid,
+            "name": sci,
+            "rank": rank,
+            "rank_level": rank_level,
+            "ancestor_ids": ancestors + [tid],
+            "preferred_common_name": f"{rank} {idx}" if idx % 3 else None,
+            "iconic_taxon_name": "Insecta" if species % 2 else "Plantae",
+            "is_active": True,
+        }
+
+    def taxon_by_id(self, tid):
+        if tid == LIFE_ID:
+            return {"id": LIFE_ID, "name": "Life", "rank": "stateofmatter", "rank_level": 100,
+                    "ancestor_ids": [LIFE_ID], "is_active": True}
+        level, idx = divmod(tid, 1000000)
+        if not 1 <= level <= len(RANKS):
+            return None
+        rank, _, div = RANKS[level - 1]
+        if idx * div >= self.n_species:
+            return None
+        return self.taxon_record(rank, idx)
+
+
+def _keep_fields(obs, fields):
+    # Projection RISON (yd_api) réduite aux clés de premier niveau citées
+    if not fields:
+        return obs
+    return {k: v for k, v in obs.items() if f"{k}:" in fields}
+
+
+# ==============================================================
+# Serveur
+# ==============================================================
+
+class Stub:
+    """État partagé du serveur : jeu de données, pannes injectées, compteurs."""
+
+    def __init__(self, dataset, latency_ms=0.0, jitter_ms=0.0, p429=0.0, rps=0.0,
+                 retry_after=1, record=None, replay=None, seed=1):
+        self.data = dataset
+        self.latency_s = latency_ms / 1000.0
+        self.jitter_s = jitter_ms / 1000.0
+        self.p429 = p429
+        self.rps = rps
+        self.retry_after = retry_after
+        self.record = record
+        self.replay = replay
+        self._rnd = random.Random(seed)
+        self._lock = threading.Lock()
+        self._tokens = max(1.0, rps)
+        self._last = time.monotonic()
+        self.stats = {"requests": 0, "observations": 0, "taxa": 0, "http_429": 0,
+                      "replayed": 0, "bytes": 0}
+
+    def count(self, key, n=1):
+        with self._lock:
+            self.stats[key] += n
+
+    def delay(self):
+        with self._lock:
+            jitter = self._rnd.uniform(-self.jitter_s, self.jitter_s) if self.jitter_s else 0.0
+        if self.latency_s + jitter > 0:
+            time.sleep(self.latency_s + jitter)
+
+    def throttle(self):
+        """True si la requête doit recevoir un 429 (tirage ou débit dépassé)."""
+        with self._lock:
+            if self.p429 and self._rnd.random() < self.p429:
+                return True
+            if self.rps:
+                now = time.monotonic()
+                self._tokens = min(max(1.0, self.rps),
+                                   self._tokens + (now - self._last) * self.rps)
+                self._last = now
+                if self._tokens < 1.0:
+                    return True
+                self._tokens -= 1.0
+        return False
+
+
+def _fixture_path(folder, path, query):
+    norm = path + "?" + urlencode(sorted(query))
+    digest = hashlib.sha1(norm.encode("utf-8")).hexdigest()[:16]
+    endpoint = path.strip("/").split("/")[1] if path.count("/") > 1 else "root"
+    return os.path.join(folder, f"{endpoint}_{digest}.json")
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    stub = None
+
+    def log_message(self, fmt, *args):
+        pass
+
+    def _send(self, status, body, headers=None):
+        payload = body if isinstance(body, bytes) else json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(payload)))
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(payload)
+        self.stub.count("bytes", len(payload))
+
+    def do_GET(self):
+        stub = self.stub
+        url = urlsplit(self.path)
+        query = parse_qsl(url.query, keep_blank_values=True)
+        if url.path == "/_stats":
+            return self._send(200, stub.stats)
+
+        stub.count("requests")
+        stub.delay()
+        if stub.throttle():
+            stub.count("http_429")
+            return self._send(429, {"error": "Too Many Requests", "status": 429},
+                              {"Retry-After": str(stub.retry_after)})
+
+        if stub.record:
+            return self._record(url.path, query)
+        if stub.replay:
+            fixture = _fixture_path(stub.replay, url.path, query)
+            if os.path.exists(fixture):
+                with open(fixture, encoding="utf-8") as f:
+                    saved = json.load(f)
+                stub.count("replayed")
+                return self._send(saved["status"], saved["body"])
+
+        params = dict(query)
+        if url.path.rstrip("/") in ("/v2/observations", "/v1/observations"):
+            return self._observations(params)
+        if url.path.startswith("/v1/taxa/") or url.path.startswith("/v2/taxa/"):
+            return self._taxa(url.path.rsplit("/", 1)[-1].split(","))
+        if url.path.rstrip("/") in ("/v1/taxa", "/v2/taxa") and params.get("id"):
+            return self._taxa(params["id"].split(","))
+        return self._send(404, {"error": "Not found", "status": 404})
+
+    def _observations(self, params):
+        data = self.stub.data
+        idx = data.query(params)
+        per_page = min(PER_PAGE_MAX, int(params.get("per_page", PER_PAGE_DEFAULT)))
+        page = max(1, int(params.get("page", 1)))
+        if params.get("id_above"):
+            id_above = int(params["id_above"])
+            first = max(0, data.obs_index(id_above))
+            if data.obs_id(first) <= id_above:
+                first += 1
+            start = bisect.bisect_left(idx, first)
+            total = len(idx) - start
+        else:
+            start = (page - 1) * per_page
+            total = len(idx)
+            if start + per_page > OFFSET_MAX and per_page:
+                return self._send(422, {
+                    "error": f"Result window is too large, page * per_page must be "
+                             f"less than or equal to {OFFSET_MAX}", "status": 422})
+        if params.get("order") == "desc":
+            return self._send(422, {"error": "stub : order=desc non géré", "status": 422})
+
+        fields = params.get("fields")
+        results = [_keep_fields(data.observation(i), fields)
+                   for i in idx[start:start + per_page]] if per_page else []
+        self.stub.count("observations", len(results))
+        return self._send(200, {"total_results": total, "page": page,
+                                "per_page": per_page, "results": results})
+
+    def _taxa(self, ids):
+        results = []
+        for raw in ids:
+            try:
+                t = self.stub.data.taxon_by_id(int(raw))
+            except ValueError:
+                t = None
+            if t is not None:
+                results.append(t)
+        self.stub.count("taxa", len(results))
+        if not results:
+            return self._send(404, {"error": "Not found", "status": 404})
+        return self._send(200, {"total_results": len(results), "page": 1,
+                                "per_page": len(results), "results": results})
+
+    def _record(self, path, query):
+        # Relais vers l'API réelle, réponse enregistrée pour --replay
+        target = REAL_API + path + ("?" + urlencode(query) if query else "")
+        req = Request(target, headers={"User-Agent": "iNaturalist_Import (benchmark record)"})
+        try:
+            with urlopen(req, timeout=60) as resp:
+                status, body = resp.status, resp.read()
+        except HTTPError as e:
+            status, body = e.code, e.read()
+        os.makedirs(self.stub.record, exist_ok=True)
+        with open(_fixture_path(self.stub.record, path, query), "w", encoding="utf-8") as f:
+            json.dump({"path": path, "query": query, "status": status,
+                       "body": json.loads(body.decode("utf-8") or "null")}, f)
+        return self._send(status, body)
+
+
+def load_templates(path=SAMPLE):
+    try:
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return None
+    results = data.get("results", []) if isinstance(data, dict) else data
+    return [o for o in results if isinstance(o, dict)] or None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serveur local imitant l'API iNaturalist")
+    parser.add_argument("--size", default="10k",
+                        help="observations : 10k, 100k, 1M ou un entier")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=0, help="0 = port libre")
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--jitter-ms", type=float, default=0.0)
+    parser.add_argument("--p429", type=float, default=0.0,
+                        help="probabilité d'un 429 par requête")
+    parser.add_argument("--rps", type=float, default=0.0,
+                        help="débit max accepté (req/s) avant 429 ; 0 = illimité")
+    parser.add_argument("--retry-after", type=int, default=1, help="en-tête Retry-After (s)")
+    parser.add_argument("--record", help="relayer vers l'API réelle et enregistrer ici")
+    parser.add_argument("--replay", help="rejouer les réponses enregistrées de ce dossier")
+    args = parser.parse_args(argv)
+
+    n = SIZES.get(args.size) or int(args.size)
+    t0 = time.perf_counter()
+    dataset = Dataset(n, args.seed, load_templates())
+    Handler.stub = Stub(dataset, args.latency_ms, args.jitter_ms, args.p429, args.rps,
+                        args.retry_after, args.record, args.replay, args.seed)
+    server = ThreadingHTTPServer((args.host, args.port), Handler)
+    server.daemon_threads = True
+    print(f"PORT {server.server_address[1]}", flush=True)
+    print(f"{n} observations, {dataset.n_species} espèces, générées en "
+          f"{time.perf_counter() - t0:.1f}s", file=sys.stderr, flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
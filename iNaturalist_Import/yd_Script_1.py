@@ -2,30 +2,40 @@
 # Plugin QGIS : iNaturalist Import
 # Script     : yd_Script_1
 # Version    : 1.0.0
-# Rôle       : Import de données iNaturalist depuis une zone circulaire
-# Remarque   : Script original encapsulé pour usage plugin
+# Rôle       : Import de données iNaturalist depuis une zone circulaire :
+#              dialogues (cercle, filtres, champs, photos, synthèse par
+#              mailles), pré-scan de la zone, puis import en tâche de fond
+#              (QgsTask) par le moteur yd_engine (tuiles, cache, limiteur,
+#              écriture GPKG, journal de reprise)
 # QGIS       : 3.40 (Bratislava)
 # ==============================================================
 
-# ==============================================================
-# yd_Script_1_plugin.py
-# Plugin-safe encapsulation of yd_Script_1_INITIAL.py
-#
-#*** NO INTERNAL MODIFICATION OF ORIGINAL CODE
-#*** Original script is encapsulated verbatim
 #*** Entry point for plugin: yd_run(iface)
-# ==============================================================
 
 from qgis.PyQt import QtWidgets
 
+from .yd_aggregate import AGG_SIZES_M
+from .yd_cache import yd_cache_partage
+from .yd_engine import (
+    yd_build_params, yd_ordered_fields, yd_layer_name, yd_import_observations
+)
+from .yd_api import yd_get_observations_v2
+from .yd_fetch import yd_call_retry
+from .yd_metrics import yd_Metrics
+from .yd_layers import yd_load_gpkg_layers
+from .yd_photos import YD_HARVEST_TOOLTIP, yd_harvest_photos
+
 _yd_iface = None
 
+# Tâches d'import en cours (références à garder pour QgsTask.fromFunction)
+_yd_tasks = []
+
 def yd_run(iface):
     """Plugin entry point"""
     run_original_script(iface)
 
 # ==============================================================
-#*** ORIGINAL SCRIPT — UNCHANGED (ENCAPSULATED)
+#*** IMPORT : DIALOGUES PUIS TÂCHE DE FOND (yd_engine)
 # ==============================================================
 
 def run_original_script(iface):
@@ -72,15 +82,16 @@ def run_original_script(iface):
     #from pyinaturalist.node_api import get_observations
     
     from qgis.core import (
-        QgsProject, QgsWkbTypes, QgsFeature, QgsGeometry, QgsPointXY,
+        QgsProject, QgsWkbTypes, QgsFeature, QgsGeometry,
         QgsCoordinateReferenceSystem, QgsCoordinateTransform, QgsDistanceArea,
         QgsVectorLayer, QgsVectorFileWriter,
         QgsFillSymbol, QgsMarkerSymbol, QgsSingleSymbolRenderer,
-        QgsGeometryGeneratorSymbolLayer, QgsFields, QgsField, Qgis
+        QgsGeometryGeneratorSymbolLayer, Qgis,
+        QgsTask, QgsApplication
     )
     from qgis.gui import QgsMapTool, QgsRubberBand
     from qgis.utils import iface
-    from qgis.PyQt.QtCore import Qt, QVariant, QDateTime
+    from qgis.PyQt.QtCore import Qt, QCoreApplication
     from qgis.PyQt.QtWidgets import (
         QDialog, QVBoxLayout, QLabel, QLineEdit, QComboBox,
         QDialogButtonBox, QRadioButton, QCheckBox, QInputDialog, QMessageBox
@@ -194,6 +205,11 @@ def run_original_script(iface):
         quality_combo = QComboBox()
         quality_combo.addItems(["tous", "research", "needs_id", "casual"])
         layout.addWidget(quality_combo)
+
+        bypass_check = QCheckBox(
+            "Bypass cache (re-download) / Ignorer le cache (tout retélécharger)"
+        )
+        layout.addWidget(bypass_check)
     
         # ---------- Pré-scan des user_login et taxons (page 1) ----------
         presets_params = {
@@ -204,8 +220,13 @@ def run_original_script(iface):
             'page': 1,
             'captive': False,
         }
+        cache = yd_cache_partage()
+        # Mesures par étape : écrites à côté du GPKG par le moteur d'import
+        metrics = yd_Metrics(run={"script": "Script 1", "lat": lat, "lng": lng, "rayon_m": rayon_m})
         try:
-            resp_preset = get_observations(**presets_params)
+            with metrics.stage("prescan"):
+                resp_preset = yd_call_retry(get_observations, cache=cache, metrics=metrics,
+                                            **presets_params)
             results_preset = resp_preset.get('results', [])
         except Exception as e:
             print(f"⚠️ Impossible de précharger user_login/taxons : {e}")
@@ -248,54 +269,18 @@ def run_original_script(iface):
         user_login = user_combo.currentText()
         taxon_nom = taxon_combo.currentText()
         quality_grade = quality_combo.currentText()
+        bypass_cache = bypass_check.isChecked()
     
         print(
             f"🔍 Filtres : {d1_str or 'tout'}→{d2_str or 'tout'} "
             f"user={user_login or 'tous'} taxon={taxon_nom or 'tous'} quality={quality_grade}"
+            f"{' (cache ignoré)' if bypass_cache else ''}"
         )
     
-        # ---------- PAGINATION iNat ----------
-        all_obs = []
-        page = 1
-    
-        while True:
-            params = {
-                'lat': lat,
-                'lng': lng,
-                'radius': rayon_km,
-                'per_page': 200,
-                'page': page,
-                'captive': False,
-                'locale': 'fr',             # noms vernaculaires en français
-                'preferred_place_id': 6753  # ex: France
-            }
-    
-            if d1_str.strip():
-                params['d1'] = d1_str.strip()
-            if d2_str.strip():
-                params['d2'] = d2_str.strip()
-            if user_login.strip():
-                params['user_login'] = user_login.strip()
-            if taxon_nom.strip():
-                params['taxon_name'] = taxon_nom.strip()
-            if quality_grade == "research":
-                params['quality_grade'] = "research"
-            if quality_grade == "needs_id":
-                params['quality_grade'] = "needs_id"
-            if quality_grade == "casual":
-                params['quality_grade'] = "casual"
-    
-            resp = get_observations(**params)
-            results = resp.get('results', [])
-            if not results:
-                break
-    
-            all_obs.extend(results)
-            page += 1
-    
-        print(f"{len(all_obs)} observations récupérées.")
-        max_photos = max((len(obs.get('photos', [])) for obs in all_obs), default=0)
-        print(f"Maximum {max_photos} photos.")
+        # ---------- PARAMÈTRES DE REQUÊTE iNat ----------
+        params = yd_build_params(
+            lat, lng, rayon_m, d1_str, d2_str, user_login, taxon_nom, quality_grade
+        )
     
         # ---------- DIALOGUE 2 : CHAMPS + MODE PHOTOS ----------
         champs_dialog = QDialog()
@@ -329,11 +314,30 @@ def run_original_script(iface):
         radio_aucune = QRadioButton("Aucune photo")
         radio_une = QRadioButton("La première (ou seule) photo")
         radio_toutes = QRadioButton("Toutes les photos de l'observation")
+        radio_table = QRadioButton("Toutes les photos, dans une table liée (inat_id, position, url, license)")
         radio_toutes.setChecked(True)
     
         champs_layout.addWidget(radio_aucune)
         champs_layout.addWidget(radio_une)
         champs_layout.addWidget(radio_toutes)
+        champs_layout.addWidget(radio_table)
+
+        harvest_check = QCheckBox(
+            "Download the photos for offline use / Télécharger les photos (consultation hors ligne)"
+        )
+        harvest_check.setToolTip(YD_HARVEST_TOOLTIP)
+        harvest_check.setEnabled(not radio_aucune.isChecked())
+        radio_aucune.toggled.connect(lambda checked: harvest_check.setEnabled(not checked))
+        champs_layout.addWidget(harvest_check)
+
+        champs_layout.addWidget(QLabel(
+            "Summary layers (GPKG) / Couches de synthèse par mailles (GPKG) :"
+        ))
+        agg_combo = QComboBox()
+        agg_combo.addItem("None / Aucune", None)
+        agg_combo.addItem("Hexagons / Hexagones", "hex")
+        agg_combo.addItem("Square grid / Grille carrée", "grid")
+        champs_layout.addWidget(agg_combo)
     
         champs_buttons = QDialogButtonBox(QDialogButtonBox.Ok | QDialogButtonBox.Cancel)
         champs_buttons.accepted.connect(champs_dialog.accept)
@@ -357,286 +361,157 @@ def run_original_script(iface):
             photo_mode = "none"
         elif radio_une.isChecked():
             photo_mode = "one"
+        elif radio_table.isChecked():
+            photo_mode = "table"
         else:
             photo_mode = "all"
     
         print(f"📋 Champs sélectionnés ({len(champs_selectionnes)}) : {champs_selectionnes}")
         print(f"📸 Mode photos choisi : {photo_mode}")
-    
-        # ---------- DÉFINITION DES CHAMPS ----------
-        fields = QgsFields()
-    
-        champ_defs = {
-            "inat_id": (QVariant.Int, None),
-            "date_obs": (QVariant.DateTime, None),
-            "scientific_name": (QVariant.String, 100),
-            "vernacular_name_FR": (QVariant.String, 150),
-            "latitude": (QVariant.Double, None),
-            "longitude": (QVariant.Double, None),
-            "place_guess": (QVariant.String, 200),
-            "taxon_id": (QVariant.Int, None),
-            "taxon_rank": (QVariant.String, 30),
-            "url_obs": (QVariant.String, 200),
-            "url_taxon": (QVariant.String, 150),
-            "observateur_id": (QVariant.String, 50),
-            "observateur_name": (QVariant.String, 100),
-            "quality_grade": (QVariant.String, 20),
-            "precision": (QVariant.Int, None)
-        }
-    
-        # Champs obligatoires toujours présents
-        if "inat_id" not in champs_selectionnes:
-            champs_selectionnes.append("inat_id")
-        if "taxon_id" not in champs_selectionnes:
-            champs_selectionnes.append("taxon_id")
-    
-        # Ordre global de référence
-        base_order = [
-            "inat_id",
-            "date_obs",
-            "scientific_name",
-            "vernacular_name_FR",
-            "latitude",
-            "longitude",
-            "place_guess",
-            "taxon_id",
-            "taxon_rank",
-            "url_obs",
-            "url_taxon",
-            "observateur_id",
-            "observateur_name",
-            "quality_grade",
-            "precision",
-        ]
-    
-        # Ordered_fields = intersection base_order ∩ champs_selectionnes
-        ordered_fields = [c for c in base_order if c in champs_selectionnes]
-    
-        # Création des champs non-photo dans l'ordre défini
-        for champ in ordered_fields:
-            var_type, length = champ_defs[champ]
-            if length:
-                fields.append(QgsField(champ, var_type, len=length))
-            else:
-                fields.append(QgsField(champ, var_type))
-    
-        # Champs photo à la fin
-        if photo_mode == "one":
-            fields.append(QgsField("url_photo1", QVariant.String, len=250))
-        elif photo_mode == "all":
-            fields.append(QgsField("nb_photos", QVariant.Int))
-            for i in range(1, max_photos + 1):
-                fields.append(QgsField(f"url_photo{i}", QVariant.String, len=250))
-    
-        # Nom final de la couche iNat
-        vl_name = f"iNat_{layer_name}_Ray={int(rayon_m)}m"
-        vl = QgsVectorLayer("Point?crs=EPSG:4326", vl_name, "memory")
-        pr = vl.dataProvider()
-        pr.addAttributes(fields)
-        vl.updateFields()
-    
-        # ---------- FEATURES ----------
-        features = []
-    
-        for obs in all_obs:
-            coords = obs.get('geojson', {}).get('coordinates')
-            if not coords:
-                continue
-            lon, lat_obs = coords
-    
-            feat_out = QgsFeature(fields)
-            feat_out.setGeometry(QgsGeometry.fromPointXY(QgsPointXY(lon, lat_obs)))
-    
-            taxon = obs.get('taxon', {}) or {}
-            user = obs.get('user', {}) or {}
-            photos = obs.get('photos', []) or []
-    
-            date_py = obs.get('time_observed_at') or obs.get('observed_on')
-            date_qt = QDateTime()
-            if date_py:
-                if isinstance(date_py, str):
-                    date_qt = QDateTime.fromString(date_py, Qt.ISODate)
-                else:
-                    date_qt = QDateTime(
-                        date_py.year, date_py.month, date_py.day,
-                        date_py.hour, date_py.minute, date_py.second
-                    )
-            if not date_qt.isValid():
-                date_qt = QDateTime.currentDateTime()
-    
-            sci = taxon.get('name')
-            vern_fr = taxon.get('preferred_common_name')
-            precision_val = obs.get('positional_accuracy')
-            place_val = obs.get('place_guess')
-    
-            attrs = []
-            for champ in ordered_fields:
-                if champ == "inat_id":
-                    attrs.append(obs.get('id'))
-                elif champ == "date_obs":
-                    attrs.append(date_qt)
-                elif champ == "scientific_name":
-                    attrs.append(sci)
-                elif champ == "vernacular_name_FR":
-                    attrs.append(vern_fr)
-                elif champ == "latitude":
-                    attrs.append(lat_obs)
-                elif champ == "longitude":
-                    attrs.append(lon)
-                elif champ == "place_guess":
-                    attrs.append(place_val)
-                elif champ == "taxon_id":
-                    attrs.append(taxon.get('id'))
-                elif champ == "taxon_rank":
-                    attrs.append(taxon.get('rank'))
-                elif champ == "url_obs":
-                    attrs.append(f"https://www.inaturalist.org/observations/{obs.get('id')}")
-                elif champ == "url_taxon":
-                    attrs.append(
-                        f"https://www.inaturalist.org/taxa/{taxon.get('id')}"
-                        if taxon.get('id') else None
-                    )
-                elif champ == "observateur_id":
-                    attrs.append(user.get('login'))
-                elif champ == "observateur_name":
-                    attrs.append(user.get('name'))
-                elif champ == "quality_grade":
-                    attrs.append(obs.get('quality_grade'))
-                elif champ == "precision":
-                    attrs.append(precision_val)
-    
-            if photo_mode == "one":
-                if photos:
-                    p = photos[0]
-                    if p and p.get('url'):
-                        url = p['url']
-                        url = url.replace('square.jpg', 'large.jpg') \
-                                 .replace('square.jpeg', 'large.jpeg') \
-                                 .replace('square.png', 'large.png')
-                        attrs.append(url)
-                    else:
-                        attrs.append(None)
-                else:
-                    attrs.append(None)
-    
-            elif photo_mode == "all":
-                nb = len(photos)
-                photo_urls = []
-                for p in photos:
-                    if p and p.get('url'):
-                        pu = p['url']
-                        pu = pu.replace('square.jpg', 'large.jpg') \
-                               .replace('square.jpeg', 'large.jpeg') \
-                               .replace('square.png', 'large.png')
-                        photo_urls.append(pu)
-                    else:
-                        photo_urls.append(None)
-                photo_urls += [None] * (max_photos - len(photo_urls))
-                attrs.append(nb)
-                attrs.extend(photo_urls)
-    
-            feat_out.setAttributes(attrs)
-            features.append(feat_out)
-    
-        pr.addFeatures(features)
-        QgsProject.instance().addMapLayer(vl)
-        iface.zoomToActiveLayer()
-        print(f"✅ ETAPE 7 : {len(features)} obs (mode {photo_mode}, {len(champs_selectionnes)} champs non-photo)")
-        iface.messageBar().pushSuccess("ETAPE 7", f"{len(features)} obs - {photo_mode}")
-    
-        # ---------- ETAPE 8 : enregistrement GPKG ----------
+        harvest_photos = harvest_check.isChecked() and photo_mode != "none"
+        if harvest_photos:
+            print("📷 Photos téléchargées après l'import (cache iNat_photos du dossier du projet)")
+        aggregates = agg_combo.currentData()
+        if aggregates:
+            print(f"🔷 Couches de synthèse : {aggregates} ({', '.join(str(s) for s in AGG_SIZES_M)} m)")
+    
+        # ---------- DÉFINITION DES CHAMPS (ordre de référence) ----------
+        ordered_fields = yd_ordered_fields(champs_selectionnes)
+    
+        # Nom final de la couche iNat (+ GPKG de sortie, dans le dossier du projet)
+        layer_name_out = yd_layer_name(layer_name, rayon_m)
         project_path_out = QgsProject.instance().fileName()
+        gpkg_path_out = None
         if project_path_out:
-            proj_dir = os.path.dirname(project_path_out)
-            layer_name_out = vl.name()
             safe_name = layer_name_out.replace(" ", "_")
-            gpkg_path_out = os.path.join(proj_dir, f"{safe_name}.gpkg")
-    
-            options = QgsVectorFileWriter.SaveVectorOptions()
-            options.driverName = "GPKG"
-            options.layerName = layer_name_out
-            options.fileEncoding = "UTF-8"
-    
-            error, _ = QgsVectorFileWriter.writeAsVectorFormatV2(
-                vl,
-                gpkg_path_out,
-                QgsProject.instance().transformContext(),
-                options
+            gpkg_path_out = os.path.join(os.path.dirname(project_path_out), f"{safe_name}.gpkg")
+
+        # ==============================================================
+        # ETAPES 7/8 EN TÂCHE DE FOND (QgsTask) : récupération, entités, GPKG
+        # Aucun accès à l'interface (iface, dialogues, projet) dans run_import.
+        # ==============================================================
+
+        def run_import(task):
+            result = yd_import_observations(
+                yd_get_observations_v2, params, ordered_fields, photo_mode, layer_name_out,
+                gpkg_path=gpkg_path_out, cache=cache, refresh=bypass_cache,
+                progress=task.setProgress, is_canceled=task.isCanceled, metrics=metrics,
+                aggregates=aggregates,
             )
-    
-            if error == QgsVectorFileWriter.NoError:
-                msg = f"GPKG enregistré : {gpkg_path_out}"
-                print("💾", msg)
-                iface.messageBar().pushSuccess("ETAPE 8", msg)
+            if (harvest_photos and gpkg_path_out and not result["canceled"]
+                    and result["error"] == QgsVectorFileWriter.NoError):
+                # Récolte des photos : GPKG déjà fermé par l'import
+                task.setProgress(0)
+                result["photos"] = yd_harvest_photos(
+                    gpkg_path_out, layer_name_out, photo_mode,
+                    progress=task.setProgress, is_canceled=task.isCanceled,
+                )
+            if not gpkg_path_out:
+                # Pas de GPKG : les couches mémoire seront ajoutées au projet
+                # depuis le fil principal (import_finished)
+                print("ℹ️ Projet non enregistré : GPKG non créé (enregistrer le projet d'abord).")
+                main_thread = QCoreApplication.instance().thread()
+                for vl_mem in (result["vl_memory"], result["vl_photos_memory"]):
+                    if vl_mem is not None:
+                        vl_mem.moveToThread(main_thread)
+            return result
+
+        # ==============================================================
+        # FIN DE TÂCHE (fil principal) : chargement, style, message final
+        # ==============================================================
+
+        def import_finished(exception, result=None):
+            if task_ref in _yd_tasks:
+                _yd_tasks.remove(task_ref)
+
+            if exception is not None or result is None or result["canceled"]:
+                if exception is not None:
+                    print(f"❌ Import interrompu : {exception}")
+                    if gpkg_path_out:
+                        print("ℹ️ Reprise possible : yd Script 4 – Reprendre le dernier import")
+                iface.messageBar().pushWarning(
+                    "ETAPE 7", f"Import {layer_name_out} interrompu / annulé"
+                )
+                restore_crs()
+                return
+
+            n_feats = result["n_feats"]
+            error = result["error"]
+            iface.messageBar().pushSuccess("ETAPE 7", f"{n_feats} obs - {photo_mode}")
+
+            if not gpkg_path_out:
+                iface.messageBar().pushMessage(
+                    "ETAPE 8",
+                    "Projet non enregistré : impossible de créer le GPKG dans le dossier du projet.",
+                    level=Qgis.Warning
+                )
+                QgsProject.instance().addMapLayer(result["vl_memory"])
+                if result["vl_photos_memory"] is not None:
+                    QgsProject.instance().addMapLayer(result["vl_photos_memory"])
+                iface.zoomToActiveLayer()
+            elif error == QgsVectorFileWriter.NoError:
+                iface.messageBar().pushSuccess("ETAPE 8", f"GPKG enregistré : {gpkg_path_out}")
+                photos = result.get("photos")
+                if photos is not None:
+                    iface.messageBar().pushInfo(
+                        "ETAPE 8", f"Photos locales : {photos['n_downloaded']} téléchargées, "
+                        f"{photos['n_cached']} en cache, {photos['n_errors']} erreurs"
+                    )
+                    if photos.get("lost"):
+                        # Éviction LRU : d'autres couches du dossier ont perdu des photos
+                        iface.messageBar().pushWarning(
+                            "ETAPE 8", "Cache photos plein, photos locales retirées de : "
+                            + ", ".join(f"{table} ({n})" for (_, table), n in photos["lost"].items())
+                            + " — relancer leur récolte (Script 3)"
+                        )
             else:
-                print(f"❌ Erreur enregistrement GPKG (code {error})")
                 iface.messageBar().pushWarning("ETAPE 8", f"Erreur GPKG (code {error})")
-        else:
-            print("ℹ️ Projet non enregistré : GPKG non créé (enregistrer le projet d'abord).")
-            iface.messageBar().pushMessage(
-                "ETAPE 8",
-                "Projet non enregistré : impossible de créer le GPKG dans le dossier du projet.",
-                level=Qgis.Warning
+
+            # ---------- ETAPE 8 bis : charger la couche GPKG ----------
+            if gpkg_path_out and error == QgsVectorFileWriter.NoError:
+                yd_load_gpkg_layers(iface, gpkg_path_out, layer_name_out, photo_mode)
+
+            # ---------- Message final + retour SCR initial ----------
+            msg = QMessageBox(iface.mainWindow())
+            msg.setIcon(QMessageBox.Information)
+            msg.setWindowTitle("iNaturalist Import – Finished / Terminé")
+
+            msg.setText(
+                "Processing finished.\n"
+                f"You now have a new permanent layer \"{layer_name_out}\" with all iNaturalist "
+                "information in its attribute table.\n\n"
+                "Have fun!\n\n"
+                "------------------------------------------------------------\n"
+                "Traitement terminé.\n"
+                f"Vous disposez maintenant d'une nouvelle couche permanente \"{layer_name_out}\" "
+                "avec toutes les informations iNaturalist dans sa table d'attributs.\n\n"
+                "Amusez-vous bien !"
             )
-    
-        # ---------- ETAPE 8 bis : remplacer la couche mémoire par la couche GPKG ----------
-        if project_path_out and 'error' in locals() and error == QgsVectorFileWriter.NoError:
-            proj_local2 = QgsProject.instance()
-    
-            # Retirer la couche mémoire iNat
-            if vl.id() in proj_local2.mapLayers():
-                proj_local2.removeMapLayer(vl.id())
-    
-            # Recharger la couche iNat depuis le GPKG
-            uri_inat = f"{gpkg_path_out}|layername={layer_name_out}"
-            vl_perm = QgsVectorLayer(uri_inat, layer_name_out, "ogr")
-    
-            if vl_perm.isValid():
-                proj_local2.addMapLayer(vl_perm)
-                iface.setActiveLayer(vl_perm)
-                print("✅ Couche iNat permanente chargée depuis le GPKG")
-    
-                # ---- Style simple : point jaune bordure rouge, 4 mm ----
-                marker = QgsMarkerSymbol.createSimple({
-                    "name": "circle",
-                    "color": "255,255,0,255",          # jaune
-                    "outline_color": "255,0,0,255",    # rouge
-                    "outline_width": "0.4",
-                    "outline_width_unit": "MM",
-                    "size": "4",
-                    "size_unit": "MM"
-                })
-                renderer = QgsSingleSymbolRenderer(marker)
-                vl_perm.setRenderer(renderer)
-                vl_perm.triggerRepaint()
-                print("✅ Style iNat appliqué (point jaune, bordure rouge, 4 mm)")
-            else:
-                print("❌ Impossible de recharger la couche iNat depuis le GPKG")
-    
-        # ---------- Message final + retour SCR initial ----------
-        msg = QMessageBox(iface.mainWindow())
-        msg.setIcon(QMessageBox.Information)
-        msg.setWindowTitle("iNaturalist Import – Finished / Terminé")
-    
-        msg.setText(
-            "Processing finished.\n"
-            f"You now have a new permanent layer \"{layer_name_out}\" with all iNaturalist "
-            "information in its attribute table.\n\n"
-            "Have fun!\n\n"
-            "------------------------------------------------------------\n"
-            "Traitement terminé.\n"
-            f"Vous disposez maintenant d'une nouvelle couche permanente \"{layer_name_out}\" "
-            "avec toutes les informations iNaturalist dans sa table d'attributs.\n\n"
-            "Amusez-vous bien !"
+            msg.setStandardButtons(QMessageBox.Ok)
+            msg.exec_()
+
+            restore_crs()
+
+        def restore_crs():
+            proj.setCrs(initial_crs)
+            canvas.setDestinationCrs(initial_crs)
+            canvas.refresh()
+            print(f"[DEBUG] Project CRS restored to initial: {initial_crs.authid()}")
+            print(f"✅ SCR DU PROJET RESTAURÉ AU SCR INITIAL : {initial_crs.authid()}")
+
+        task_ref = QgsTask.fromFunction(
+            f"iNaturalist Import – {layer_name_out}",
+            run_import,
+            on_finished=import_finished,
+        )
+        # Référence conservée tant que la tâche tourne (sinon collectée par Python)
+        _yd_tasks.append(task_ref)
+        QgsApplication.taskManager().addTask(task_ref)
+        print(f"⏳ Import lancé en tâche de fond : {layer_name_out}")
+        iface.messageBar().pushInfo(
+            "ETAPE 7",
+            f"Import {layer_name_out} running in background / en tâche de fond"
         )
-        msg.setStandardButtons(QMessageBox.Ok)
-        msg.exec_()
-    
-        proj.setCrs(initial_crs)
-        canvas.setDestinationCrs(initial_crs)
-        canvas.refresh()
-        print(f"[DEBUG] Project CRS restored to initial: {initial_crs.authid()}")
-        print(f"✅ SCR DU PROJET RESTAURÉ AU SCR INITIAL : {initial_crs.authid()}")
     
     # ==============================================================
     # 6) TOOL DE CERCLE EN 2154
@@ -3,31 +3,105 @@
 # Script     : yd_Script_2
 # Version    : 1.0.0
 # Rôle       : Ajout de la taxonomie (7 niveaux) aux données importées dans la couche ACTIVE
-# Dépendance : pyinaturalist (pré-requis géré par Script 1)
+# Dépendance : pyinaturalist (pré-requis géré par Script 1), sauf en mode
+#              hors ligne (taxonomie DwC-A importée localement)
 # QGIS       : 3.40 (Bratislava)
 # ==============================================================
 
-from qgis.core import QgsVectorLayer, QgsField
-from qgis.PyQt.QtCore import QVariant, Qt
-from qgis.PyQt.QtWidgets import QProgressDialog, QMessageBox, QApplication
+from qgis.core import QgsVectorLayer
+from qgis.PyQt.QtCore import Qt
+from qgis.PyQt.QtWidgets import QProgressDialog, QMessageBox, QApplication, QFileDialog
 from qgis.utils import iface
 
-#from pyinaturalist.node_api import get_taxa
+#from pyinaturalist.node_api import get_taxa_by_id
 
-import csv
 import os
-import time
 from datetime import datetime
-from requests.exceptions import HTTPError
 
-# PARAMÈTRES
-taxon_field = "taxon_id"
-TAX_FIELDS = ["kingdom", "phylum", "class", "order", "family", "genus", "species"]
+from .yd_taxonomy import (
+    taxon_field, yd_unique_taxa, yd_write_taxa_csv, yd_write_taxo_csv, yd_build_taxonomy,
+    yd_build_taxonomy_offline, yd_add_taxonomy_fields, yd_write_taxonomy_gpkg
+)
+from .yd_metrics import yd_FileLog, yd_Metrics, yd_metrics_path
+from .yd_taxo_store import yd_taxo_store_partage
+
+
+def yd_import_dwca_dialog(store):
+    """Choix de l'archive DwC-A puis import dans le référentiel ; True si importée."""
+    zip_path, _ = QFileDialog.getOpenFileName(
+        iface.mainWindow(),
+        "iNaturalist taxonomy archive (DwC-A) / Archive taxonomique iNaturalist (DwC-A)",
+        "",
+        "DwC-A (*.zip)",
+    )
+    if not zip_path:
+        return False
+
+    progress = QProgressDialog("", "Cancel / Annuler", 0, 0, iface.mainWindow())
+    progress.setWindowTitle("iNaturalist taxonomy – Import DwC-A")
+    progress.setWindowModality(Qt.WindowModal)
+    progress.setMinimumDuration(0)
+
+    def on_rows(n):
+        progress.setLabelText(
+            f"Importing taxonomy... {n} taxa\n"
+            f"Import de la taxonomie... {n} taxons"
+        )
+        QApplication.processEvents()
+
+    on_rows(0)
+    try:
+        n = store.import_dwca(zip_path, progress=on_rows, is_canceled=progress.wasCanceled)
+    except Exception as e:
+        progress.close()
+        QMessageBox.critical(
+            iface.mainWindow(),
+            "iNaturalist Taxonomy - Import DwC-A",
+            f"Import failed / Échec de l'import :\n{e}"
+        )
+        return False
+    progress.close()
+    return n is not None
+
+
+def yd_choose_mode(store):
+    """'online', 'offline' ou None (annulé) ; propose l'import de l'archive DwC-A."""
+    while True:
+        info = store.offline_info()
+        if info:
+            state = (f"{info.get('source')} — {info.get('n_taxa')} taxa / taxons "
+                     f"({info.get('imported')})")
+        else:
+            state = "none / aucune"
+
+        box = QMessageBox(iface.mainWindow())
+        box.setIcon(QMessageBox.Question)
+        box.setWindowTitle("iNaturalist Taxonomy - Mode")
+        box.setText(
+            "Resolve the taxonomy online (iNaturalist API) or offline "
+            "(local copy of the iNaturalist taxonomy archive)?\n\n"
+            "------------------------------------------------------------\n"
+            "Résoudre la taxonomie en ligne (API iNaturalist) ou hors ligne "
+            "(copie locale de l'archive taxonomique iNaturalist) ?\n\n"
+            f"Offline taxonomy / Taxonomie hors ligne : {state}"
+        )
+        btn_online = box.addButton("Online / En ligne", QMessageBox.AcceptRole)
+        btn_offline = box.addButton("Offline / Hors ligne", QMessageBox.AcceptRole)
+        btn_offline.setEnabled(bool(info))
+        btn_import = box.addButton("Import DwC-A…", QMessageBox.ActionRole)
+        box.addButton("Cancel / Annuler", QMessageBox.RejectRole)
+        box.exec_()
+
+        clicked = box.clickedButton()
+        if clicked == btn_online:
+            return "online"
+        if clicked == btn_offline:
+            return "offline"
+        if clicked == btn_import:
+            yd_import_dwca_dialog(store)
+            continue
+        return None
 
-# Throttling
-SLEEP_BETWEEN_CALLS = 0.5
-SLEEP_ON_429 = 60
-MAX_RETRIES_429 = 3
 
 def etape9_all_in_one_reload():
 
@@ -76,45 +150,45 @@ def etape9_all_in_one_reload():
         has_empty_kingdom = any(True for _ in active.getFeatures(req))
 
         # --- CAS 3 : champ kingdom existe MAIS au moins une valeur vide / NULL ---
+        # (observations ajoutées ou ré-identifiées par la mise à jour, Script 3,
+        # ou traitement interrompu) : la taxonomie de toute la couche est
+        # recalculée, les taxons déjà connus sont lus dans le référentiel
         if has_empty_kingdom:
-            QMessageBox.warning(
+            answer = QMessageBox.question(
                 iface.mainWindow(),
-                "iNaturalist Taxonomy - ATTENTION !",     
-                "The active layer appears to be corrupted and to have undergone"
-                "an aborted process with this program.\n\n"
-                "Please start from a clean situation by deleting this layer "
-                "and running a new import (RECOMMENDED), "
-                "or open the layer's attribute table in Edit mode, and manually delete "
-                "all FIELDS between 'kingdom' (inclusive) and 'species' (inclusive).\n\n"
-                "Then run this program again.\n\n"
+                "iNaturalist Taxonomy - Incomplete / Incomplète",
+                "The taxonomy fields of the active layer are only partly filled "
+                "(observations added or re-identified by a refresh, or an interrupted run).\n\n"
+                "Complete the taxonomy of the layer now?\n\n"
                 "------------------------------------------------------------\n"
-                "La couche active semble corrompue et avoir fait l'objet "
-                "d'un traitement avorté avec ce programme.\n\n"
-                "Veuillez repartir d'une base saine en supprimant cette couche "
-                "et en relancant une nouvelle importation (CONSEILLÉ), "
-                "ou alors ouvrir la table d'attributs de la couche en mode Édition, et supprimer "
-                "manuellement tous les CHAMPS entre 'kingdom' (compris) et 'species' (compris).\n\n"
-                "Puis relancer ce programme."
+                "Les champs de taxonomie de la couche active ne sont que partiellement remplis "
+                "(observations ajoutées ou ré-identifiées par une mise à jour, ou traitement "
+                "interrompu).\n\n"
+                "Compléter maintenant la taxonomie de la couche ?",
+                QMessageBox.Yes | QMessageBox.No,
+                QMessageBox.Yes,
             )
-            return
+            if answer != QMessageBox.Yes:
+                return
 
         # --- CAS 4 : champ kingdom existe ET 100 % rempli ---
-        QMessageBox.warning(
-            iface.mainWindow(),
-            "iNaturalist Taxonomy - ATTENTION !", 
-            "The active layer has already been processed, and the taxonomy fields are already present and populated. "
-            "Therefore, the program is complete.\n\n"
-            "You can select another import layer of iNaturalist observations "
-            "(not yet taxonomically processed) and restart this program.\n\n"
-            "------------------------------------------------------------\n"
-            "La couche active est déjà traitée et les champs de taxonomie sont déjà présents et remplis. "
-            "Donc, fin du programme.\n\n"
-            "Vous pouvez sélectionner une autre couche d'importation d'observations iNaturalist "
-            "(non tratée en taxonomie) et relancer ce programme."
-        )
-        return
+        else:
+            QMessageBox.warning(
+                iface.mainWindow(),
+                "iNaturalist Taxonomy - ATTENTION !", 
+                "The active layer has already been processed, and the taxonomy fields are already present and populated. "
+                "Therefore, the program is complete.\n\n"
+                "You can select another import layer of iNaturalist observations "
+                "(not yet taxonomically processed) and restart this program.\n\n"
+                "------------------------------------------------------------\n"
+                "La couche active est déjà traitée et les champs de taxonomie sont déjà présents et remplis. "
+                "Donc, fin du programme.\n\n"
+                "Vous pouvez sélectionner une autre couche d'importation d'observations iNaturalist "
+                "(non tratée en taxonomie) et relancer ce programme."
+            )
+            return
 
-    # --- CAS 5 : champ kingdom absent, on continue ---
+    # --- CAS 5 : champ kingdom absent (ou couche à compléter, CAS 3), on continue ---
     # (aucune action, poursuite normale du script)
 
     # ==============================================================
@@ -122,13 +196,21 @@ def etape9_all_in_one_reload():
     # ==============================================================
      
     start_time = datetime.now()
+
+    # Référentiel persistant : taxons déjà résolus (autres couches, sessions
+    # précédentes) et taxonomie hors ligne importée (archive DwC-A)
+    store = yd_taxo_store_partage()
+    mode = yd_choose_mode(store)
+    if mode is None:
+        return
     
     # ==============================================================
-    # === CONTROLE DEPENDANCE pyinaturalist ========================
+    # === CONTROLE DEPENDANCE pyinaturalist (mode en ligne) ========
     # ==============================================================
 
     try:
-        from pyinaturalist.node_api import get_taxa
+        if mode == "online":
+            from pyinaturalist.node_api import get_taxa_by_id
     except ImportError:
         QMessageBox.critical(
             iface.mainWindow(),
@@ -167,26 +249,19 @@ def etape9_all_in_one_reload():
         return
 
     gpkg_path = parts[0]
-    layer_name = parts[1]  # nom interne dans le GPKG
+    # Nom interne dans le GPKG, sans les options de la source (|subset=…)
+    layer_name = parts[1].split("|")[0]
 
     base_dir = os.path.dirname(gpkg_path)
     taxa_csv_out = os.path.join(base_dir, "iNat_ETAPE9_taxa_ids.csv")
     taxo_csv_out = os.path.join(base_dir, "iNat_ETAPE9_taxonomie.csv")
     log_path = os.path.join(base_dir, "iNat_ETAPE9_all_in_one_RELOAD.log")
 
-    # --- LOG ---
-    with open(log_path, "w", encoding="utf-8") as lf:
-        lf.write(
-            f"[{start_time.strftime('%Y-%m-%d %H:%M:%S')}] "
-            "=== ETAPE 9 (tout-en-un, reload) : début ===\n"
-        )
-
-    def log(msg):
-        ts = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        line = f"[{ts}] {msg}"
-        print(line)
-        with open(log_path, "a", encoding="utf-8") as lf2:
-            lf2.write(line + "\n")
+    # --- LOG (fichier ouvert une seule fois) + mesures par étape ---
+    log = yd_FileLog(log_path, "=== ETAPE 9 (tout-en-un, reload) : début ===")
+    metrics = yd_Metrics(yd_metrics_path(gpkg_path), run={"layer_name": layer_name,
+                                                          "step": "taxonomy", "mode": mode})
+    metrics.profile_begin()
 
     # 1) Charger la couche GPKG (version fichier)
     if not os.path.exists(gpkg_path):
@@ -216,86 +291,24 @@ def etape9_all_in_one_reload():
     # 2) Extraire taxon_id uniques
     log("🔍 Extraction des taxon_id uniques...")
 
-    taxon_set = {}
-    sci_index = vl.fields().indexOf("scientific_name")
-    sci_idx = sci_index if sci_index != -1 else -1
-
-    for f in vl.getFeatures():
-        tid = f[taxon_idx]
-        if tid is None:
-            continue
-        try:
-            tid_int = int(tid)
-        except (TypeError, ValueError):
-            continue
-        if tid_int not in taxon_set:
-            sci = f[sci_idx] if sci_idx != -1 else None
-            taxon_set[tid_int] = sci
-
+    with metrics.stage("unique_taxa") as m:
+        taxon_set = yd_unique_taxa(vl)
+        m["items"] = len(taxon_set)
     taxa = sorted(taxon_set.keys())
     log(f"✅ {len(taxa)} taxon_id uniques extraits")
 
     # 3) CSV taxon_id (optionnel)
     try:
-        with open(taxa_csv_out, "w", newline="", encoding="utf-8") as f:
-            writer = csv.writer(f, delimiter=";")
-            writer.writerow(["taxon_id", "scientific_name"])
-            for tid in taxa:
-                writer.writerow([tid, taxon_set[tid] or ""])
+        yd_write_taxa_csv(taxa_csv_out, taxa, taxon_set)
         log(f"💾 CSV taxon_id écrit : {taxa_csv_out}")
     except Exception as e:
         log(f"⚠️ Impossible d'écrire {taxa_csv_out} (continuation quand même) : {e}")
 
-    # 4) Construction taxonomie (API + cache + throttling)
-    log("🌳 Construction de la taxonomie via l'API iNaturalist (avec throttling)...")
-
-    taxon_cache = {}  # id -> {"rank": r, "name": n, "ancestor_ids": [...]}
-
-    def safe_get_taxa(tid):
-        retries = 0
-        while True:
-            try:
-                resp = get_taxa(taxon_id=tid)
-                time.sleep(SLEEP_BETWEEN_CALLS)
-                return resp
-            except HTTPError as e:
-                if "429" in str(e) and retries < MAX_RETRIES_429:
-                    retries += 1
-                    log(
-                        f"⚠️ 429 pour taxon_id={tid}, tentative "
-                        f"{retries}/{MAX_RETRIES_429}, pause {SLEEP_ON_429}s..."
-                    )
-                    time.sleep(SLEEP_ON_429)
-                    continue
-                else:
-                    log(f"❌ HTTPError pour taxon_id={tid} : {e}")
-                    return None
-            except Exception as e:
-                log(f"❌ Erreur pour taxon_id={tid} : {e}")
-                return None
-
-    def get_taxon_info(tid):
-        if tid in taxon_cache:
-            return taxon_cache[tid]
-        resp = safe_get_taxa(tid)
-        if not resp:
-            taxon_cache[tid] = None
-            return None
-        results = resp.get("results", [])
-        if not results:
-            taxon_cache[tid] = None
-            return None
-        t = results[0]
-        info = {
-            "rank": t.get("rank"),
-            "name": t.get("name"),
-            "ancestor_ids": t.get("ancestor_ids") or [],
-        }
-        taxon_cache[tid] = info
-        return info
-
-    taxo_map = {}
-    errors = 0
+    # 4) Construction taxonomie (API + cache + throttling, ou archive locale)
+    if mode == "offline":
+        log("🌳 Construction de la taxonomie hors ligne (archive DwC-A locale)...")
+    else:
+        log("🌳 Construction de la taxonomie via l'API iNaturalist (requêtes groupées)...")
 
     # ---------- ProgressDialog TAXONS ----------
     nb_taxa = len(taxa)
@@ -320,64 +333,57 @@ def etape9_all_in_one_reload():
             "Taxonomy processing in progress...\n"
             f"- Total records: {total_feats}\n"
             f"- Unique taxa: {nb_taxa}\n"
-            f"- Currently processing taxon {current}/{total} (id={tid})\n\n"
+            f"- Taxa fetched: {current}/{total} (id={tid})\n\n"
             "------------------------------------------------------------\n"
             "Traitement taxonomique en cours...\n"
             f"- Nombre total d'enregistrements : {total_feats}\n"
             f"- Nombre de taxons répertoriés : {nb_taxa}\n"
-            f"- Traitement du taxon {current}/{total} (id={tid})"
+            f"- Taxons récupérés : {current}/{total} (id={tid})"
         )
 
-    processed = 0
-    for tid in taxa:
-        processed += 1
-
-        if progress_taxa.wasCanceled():
-            log("⚠️ Traitement taxonomique annulé par l'utilisateur.")
-            break
-
-        progress_taxa.setValue(processed)
-        update_taxa_label(processed, nb_taxa, tid)
+    def on_taxon(current, total, tid):
+        # Taxons de la couche puis ancêtres : le total change d'une phase à l'autre
+        progress_taxa.setMaximum(total)
+        progress_taxa.setValue(current)
+        update_taxa_label(current, total, tid)
         QApplication.processEvents()
 
-        info = get_taxon_info(tid)
-        if not info:
-            log(f"⚠️ Aucun résultat pour taxon_id={tid}")
-            errors += 1
-            taxo_map[tid] = {field: "" for field in TAX_FIELDS}
-            continue
-
-        self_rank = info["rank"]
-        self_name = info["name"]
-        ancestor_ids = info["ancestor_ids"]
-
-        rank_to_name = {}
-        for aid in ancestor_ids:
-            ainfo = get_taxon_info(aid)
-            if not ainfo:
-                continue
-            r = ainfo.get("rank")
-            n = ainfo.get("name")
-            if r and n and r in TAX_FIELDS and r not in rank_to_name:
-                rank_to_name[r] = n
-
-        if self_rank in TAX_FIELDS and self_name:
-            rank_to_name[self_rank] = self_name
-
-        taxo_map[tid] = {field: rank_to_name.get(field, "") for field in TAX_FIELDS}
+    if mode == "offline":
+        taxo_map, errors = yd_build_taxonomy_offline(
+            store, taxa, log=log,
+            on_taxon=on_taxon, is_canceled=progress_taxa.wasCanceled, metrics=metrics,
+        )
+    else:
+        try:
+            taxo_map, errors = yd_build_taxonomy(
+                get_taxa_by_id, taxa, log=log,
+                on_taxon=on_taxon, is_canceled=progress_taxa.wasCanceled, metrics=metrics,
+                store=store,
+            )
+        except Exception as e:
+            # API injoignable : les taxons déjà reçus sont dans le référentiel
+            progress_taxa.close()
+            metrics.close(status="erreur", n_taxa=len(taxa))
+            end_time = datetime.now()
+            log(f"=== FIN avec erreur === Durée : {end_time - start_time}")
+            log.close()
+            QMessageBox.warning(
+                iface.mainWindow(),
+                "iNaturalist Import - ATTENTION !",
+                "The iNaturalist API is unreachable, the layer was not modified.\n"
+                f"{e}\n\n"
+                "------------------------------------------------------------\n"
+                "L'API iNaturalist est injoignable, la couche n'a pas été modifiée.\n"
+                "Les taxons déjà reçus sont conservés : relancer plus tard ira plus vite."
+            )
+            return
 
     progress_taxa.close()
-    log(f"✅ Taxonomie construite pour {len(taxo_map)} taxon_id, erreurs API : {errors}")
+    log(f"✅ Taxonomie construite pour {len(taxo_map)} taxon_id, erreurs : {errors}")
 
     # 5) CSV taxonomique (optionnel)
     try:
-        with open(taxo_csv_out, "w", newline="", encoding="utf-8") as out_f:
-            writer = csv.writer(out_f, delimiter=";")
-            header = ["taxon_id"] + TAX_FIELDS
-            writer.writerow(header)
-            for tid in taxa:
-                row = [tid] + [taxo_map[tid].get(field, "") for field in TAX_FIELDS]
-                writer.writerow(row)
+        yd_write_taxo_csv(taxo_csv_out, taxa, taxo_map)
         log(f"💾 CSV taxonomique écrit : {taxo_csv_out}")
     except Exception as e:
         log(f"⚠️ Impossible d'écrire {taxo_csv_out} (continuation quand même) : {e}")
@@ -385,32 +391,7 @@ def etape9_all_in_one_reload():
     # 6) Intégration dans le GPKG (couche fichier vl)
     log("🧬 Intégration directe de la taxonomie dans la couche (fichier)...")
 
-    provider = vl.dataProvider()
-    existing_fields = [f.name() for f in vl.fields()]
-    new_fields = []
-
-    for field_name in TAX_FIELDS:
-        if field_name not in existing_fields:
-            new_fields.append(QgsField(field_name, QVariant.String, len=150))
-
-    if new_fields:
-        log(
-            "➕ Ajout de "
-            f"{len(new_fields)} champs taxonomiques : "
-            f"{', '.join(f.name() for f in new_fields)}"
-        )
-        provider.addAttributes(new_fields)
-        vl.updateFields()
-    else:
-        log("ℹ️ Tous les champs taxonomiques existent déjà")
-
-    idx_map = {name: vl.fields().indexOf(name) for name in TAX_FIELDS}
-
-    if not vl.isEditable():
-        vl.startEditing()
-
-    n_updated = 0
-    n_not_found = 0
+    yd_add_taxonomy_fields(vl, log=log)
 
     log("✏️ Mise à jour des entités dans le fichier...")
 
@@ -428,55 +409,34 @@ def etape9_all_in_one_reload():
     progress_feats.setWindowModality(Qt.WindowModal)
     progress_feats.setMinimumDuration(0)
 
-    i_feat = 0
-    for feat in vl.getFeatures():
-        i_feat += 1
-
-        if progress_feats.wasCanceled():
-            log("⚠️ Mise à jour des entités annulée par l'utilisateur.")
-            break
-
-        progress_feats.setValue(i_feat)
+    def on_features(done, total):
+        # Appelé une fois par bloc de TAXO_UPDATE_CHUNK entités
+        progress_feats.setMaximum(total)
+        progress_feats.setValue(done)
         progress_feats.setLabelText(
             "Updating taxonomy in the layer...\n"
-            f"Feature {i_feat}/{total_feats} (FID={feat.id()})\n\n"
+            f"Features {done}/{total}\n\n"
             "------------------------------------------------------------\n"
             "Intégration de la taxonomie dans la couche...\n"
-            f"Entité {i_feat}/{total_feats} (FID={feat.id()})"
+            f"Entités {done}/{total}"
         )
         QApplication.processEvents()
 
-        tid_val = feat[taxon_idx]
-        try:
-            tid_int = int(tid_val)
-        except (TypeError, ValueError):
-            n_not_found += 1
-            continue
-
-        taxo = taxo_map.get(tid_int)
-        if not taxo:
-            n_not_found += 1
-            continue
-
-        for field_name in TAX_FIELDS:
-            idx = idx_map[field_name]
-            feat[idx] = taxo.get(field_name, "")
-
-        if not vl.updateFeature(feat):
-            log(f"⚠️ Échec updateFeature pour FID={feat.id()}")
-        else:
-            n_updated += 1
+    # Écriture SQL directe dans le GPKG (sans tampon d'édition), puis reload
+    commit_ok, n_updated, n_not_found = yd_write_taxonomy_gpkg(
+        gpkg_path, layer_name, taxo_map, log=log,
+        progress=on_features, is_canceled=progress_feats.wasCanceled, metrics=metrics
+    )
 
     progress_feats.close()
 
-    if vl.commitChanges():
+    if commit_ok:
         log(
             "✅ Intégration terminée dans le fichier : "
             f"{n_updated} entités MAJ, {n_not_found} sans taxonomie"
         )
     else:
         log("❌ Erreur lors du commit sur fichier, annulation")
-        vl.rollBack()
 
     # 7) Reload de la couche active si elle pointe sur ce GPKG
     log("🔄 Tentative de reload de la couche active...")
@@ -497,9 +457,14 @@ def etape9_all_in_one_reload():
     else:
         log("ℹ️ Pas de couche active ou couche non vectorielle, aucun reload effectué.")
 
+    metrics.close(status="ok" if commit_ok else "erreur", n_taxa=len(taxa), errors=errors)
+    log(metrics.text())
+    log(f"📊 Mesures : {metrics.path}")
+
     end_time = datetime.now()
     log(f"Durée totale Taxonomy : {end_time - start_time}")
     log("=== FIN Taxonomy ===")
+    log.close()
 
     # --- Timing information ---
     start_str = start_time.strftime("%H:%M:%S")
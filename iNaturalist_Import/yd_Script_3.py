@@ -0,0 +1,484 @@
+# ==============================================================
+# Plugin QGIS : iNaturalist Import
+# Script     : yd_Script_3
+# Version    : 1.0.0
+# Rôle       : Mise à jour (delta) de la couche iNat ACTIVE depuis la
+#              dernière synchronisation : ajouts, modifications (taxonomie
+#              des nouveaux taxons comprise), suppressions (balayage des id
+#              sur demande, proposé toutes les SWEEP_EVERY mises à jour)
+# Dépendance : pyinaturalist (pré-requis géré par Script 1)
+# QGIS       : 3.40 (Bratislava)
+# ==============================================================
+
+from qgis.core import (
+    QgsVectorLayer, QgsField, QgsFeature, QgsGeometry, QgsPointXY, QgsFeatureRequest, QgsProject
+)
+from qgis.PyQt.QtCore import QVariant, Qt
+from qgis.PyQt.QtWidgets import QProgressDialog, QMessageBox, QApplication
+from qgis.utils import iface
+
+import os
+from datetime import datetime
+
+from .yd_aggregate import yd_rebuild_aggregates
+from .yd_api import API_FIELDS_ID, API_FIELDS_ID_GEOM, yd_get_observations_v2
+from .yd_engine import yd_clip_test
+from .yd_fetch import PER_PAGE, yd_fetch_pages
+from .yd_gpkg import yd_sync_timestamp, yd_read_sync_info, yd_write_sync_info
+from .yd_metrics import yd_FileLog
+from .yd_observation import (
+    yd_obs_coords, yd_column_plan, yd_photo_rows, yd_photo_field_names
+)
+from .yd_photos import yd_harvest_photos, yd_has_photo_paths
+from .yd_taxo_store import yd_taxo_store_partage
+from .yd_taxonomy import TAX_FIELDS, yd_build_taxonomy
+
+# PARAMÈTRES
+# Balayage complet des id (suppressions) : une requête par 200 observations
+# de la zone ; proposé par défaut toutes les SWEEP_EVERY mises à jour
+SWEEP_EVERY = 10
+
+
+def etape10_mise_a_jour():
+
+    # ==============================================================
+    # === CONTROLE COUCHE ACTIVE ===================================
+    # ==============================================================
+
+    active = iface.activeLayer()
+
+    if active is None:
+        QMessageBox.warning(
+            iface.mainWindow(),
+            "CAS 1",
+            "Aucune couche active"
+        )
+        return
+
+    if not isinstance(active, QgsVectorLayer) or active.fields().indexOf("inat_id") == -1:
+        QMessageBox.warning(
+            iface.mainWindow(),
+            "iNaturalist Refresh - ATTENTION !",
+            "The active layer IS NOT an iNaturalist observation import vector layer.\n\n"
+            "Please select a correct layer and restart the program.\n"
+            "------------------------------------------------------------\n"
+            "La couche active N'EST PAS une couche vectorielle d'importation d'observations iNaturalist.\n\n"
+            "Veuillez sélectionner une couche correcte et relancer le programme."
+        )
+        return
+
+    src = active.source()
+    parts = src.split("|layername=")
+    if len(parts) != 2:
+        QMessageBox.warning(
+            iface.mainWindow(),
+            "iNaturalist Refresh - ATTENTION !",
+            "The active layer does not look like a GPKG source.\n\n"
+            f"Source: {src}\n\n"
+            "------------------------------------------------------------\n"
+            "La couche active ne semble pas être une couche GPKG (source invalide).\n\n"
+            f"Source : {src}"
+        )
+        return
+
+    gpkg_path = parts[0]
+    layer_name = parts[1].split("|")[0]
+
+    sync = yd_read_sync_info(gpkg_path, layer_name)
+    if sync is None:
+        QMessageBox.warning(
+            iface.mainWindow(),
+            "iNaturalist Refresh - ATTENTION !",
+            "The active layer holds no synchronisation information "
+            "(it was imported with an earlier version of this plugin).\n\n"
+            "Please run a new import.\n"
+            "------------------------------------------------------------\n"
+            "La couche active ne contient pas d'information de synchronisation "
+            "(elle a été importée avec une version antérieure du plugin).\n\n"
+            "Veuillez relancer une importation."
+        )
+        return
+
+    # ==============================================================
+    # === CONTROLE DEPENDANCE pyinaturalist ========================
+    # ==============================================================
+
+    try:
+        from pyinaturalist.node_api import get_taxa_by_id
+    except ImportError:
+        QMessageBox.critical(
+            iface.mainWindow(),
+            "iNaturalist Refresh - ATTENTION ! Missing dependency",
+            "This tool requires the Python module 'pyinaturalist'.\n"
+            "To install it for QGIS:\n\n"
+            "1. Close QGIS.\n"
+            "2. Open the 'OSGeo4W Shell' or the 'QGIS Python Console'.\n"
+            "3. Run the following command:\n"
+            "   python -m pip install pyinaturalist\n"
+            "4. Restart QGIS.\n\n"
+            "------------------------------------------------------------\n"
+            "Cet outil nécessite le module Python 'pyinaturalist'.\n"
+            "Pour l’installer dans QGIS :\n\n"
+            "1. Fermez QGIS.\n"
+            "2. Ouvrez le « OSGeo4W Shell » ou la « Console Python de QGIS ».\n"
+            "3. Lancez la commande suivante :\n"
+            "   python -m pip install pyinaturalist\n"
+            "4. Redémarrez QGIS.\n"
+        )
+        return
+
+    # ==============================================================
+    # === BALAYAGE DES SUPPRESSIONS (optionnel) ====================
+    # ==============================================================
+
+    n_refresh = (sync.get("n_refresh") or 0) + 1
+    n_requests = max(1, active.featureCount() // PER_PAGE)
+    ask = QMessageBox(iface.mainWindow())
+    ask.setIcon(QMessageBox.Question)
+    ask.setWindowTitle("iNaturalist Refresh - Deletions / Suppressions")
+    ask.setText(
+        "The refresh only downloads observations changed since the last sync.\n"
+        "Detecting observations deleted on iNaturalist (or no longer matching the "
+        f"filters) requires re-listing every id of the area: about {n_requests} "
+        "additional requests, which can take a long time on large layers.\n\n"
+        f"Refreshes since the last sweep: {n_refresh - 1}. Sweep now?\n\n"
+        "------------------------------------------------------------\n"
+        "La mise à jour ne télécharge que les observations modifiées depuis la dernière synchro.\n"
+        "Détecter les observations supprimées sur iNaturalist (ou sorties des filtres) "
+        f"impose de relister tous les id de la zone : environ {n_requests} requêtes "
+        "supplémentaires, ce qui peut être long sur une grande couche.\n\n"
+        f"Mises à jour depuis le dernier balayage : {n_refresh - 1}. Balayer maintenant ?"
+    )
+    ask.setStandardButtons(QMessageBox.Yes | QMessageBox.No | QMessageBox.Cancel)
+    ask.setDefaultButton(QMessageBox.Yes if n_refresh >= SWEEP_EVERY else QMessageBox.No)
+    answer = ask.exec_()
+    if answer == QMessageBox.Cancel:
+        return
+    sweep = answer == QMessageBox.Yes
+
+    start_time = datetime.now()
+
+    base_dir = os.path.dirname(gpkg_path)
+    log_path = os.path.join(base_dir, "iNat_ETAPE10_mise_a_jour.log")
+
+    # --- LOG (fichier ouvert une seule fois) ---
+    log = yd_FileLog(log_path, "=== ETAPE 10 (mise à jour delta) : début ===")
+
+    # 1) Couche GPKG (version fichier) + table des photos éventuelle
+    vl = QgsVectorLayer(f"{gpkg_path}|layername={layer_name}", layer_name, "ogr")
+    if not vl.isValid():
+        log("❌ Couche GPKG invalide")
+        return
+    pr = vl.dataProvider()
+
+    params = sync["params"]
+    photo_mode = sync["photo_mode"]
+    layer_names = vl.fields().names()
+    ordered_fields = [c for c in sync["fields"] if c in layer_names]
+    max_photos = sum(1 for n in layer_names if n.startswith("url_photo")) if photo_mode == "all" else 0
+    build_row = yd_column_plan(ordered_fields, photo_mode)
+    # Zone (polygone) : la requête porte sur sa bbox, découpe exacte ici
+    clip = sync.get("clip")
+    inside = yd_clip_test(clip) if clip else None
+
+    vl_photos = None
+    if photo_mode == "table":
+        photos_name = f"{layer_name}_photos"
+        vl_photos = QgsVectorLayer(f"{gpkg_path}|layername={photos_name}", photos_name, "ogr")
+        if not vl_photos.isValid():
+            log(f"⚠️ Table des photos {photos_name} introuvable, photos non mises à jour")
+            vl_photos = None
+
+    log(f"✅ Couche chargée : {layer_name} ({vl.featureCount()} entités), "
+        f"dernière synchro : {sync['last_sync']}")
+
+    # 2) Index inat_id → fid (+ taxonomie déjà connue par taxon_id, cf. Script 2)
+    inat_idx = vl.fields().indexOf("inat_id")
+    taxon_idx = vl.fields().indexOf("taxon_id")
+    tax_idx = {f: vl.fields().indexOf(f) for f in TAX_FIELDS if vl.fields().indexOf(f) != -1}
+
+    fid_by_id = {}
+    taxo_by_taxon = {}
+    req = QgsFeatureRequest().setFlags(QgsFeatureRequest.NoGeometry)
+    for f in vl.getFeatures(req):
+        fid_by_id[f[inat_idx]] = f.id()
+        if tax_idx and taxon_idx != -1 and f[taxon_idx] not in taxo_by_taxon:
+            taxo = {i: f[i] for i in tax_idx.values()}
+            if all(v not in (None, "") for v in taxo.values()):
+                taxo_by_taxon[f[taxon_idx]] = taxo
+
+    photo_fids = {}
+    if vl_photos is not None:
+        photo_inat_idx = vl_photos.fields().indexOf("inat_id")
+        for f in vl_photos.getFeatures(QgsFeatureRequest().setFlags(QgsFeatureRequest.NoGeometry)):
+            photo_fids.setdefault(f[photo_inat_idx], []).append(f.id())
+
+    progress = QProgressDialog(
+        "", "Cancel / Annuler", 0, 0, iface.mainWindow()
+    )
+    progress.setWindowTitle("STEP 10 – iNaturalist refresh / Mise à jour iNaturalist")
+    progress.setWindowModality(Qt.WindowModal)
+    progress.setMinimumDuration(0)
+
+    # 3) Observations modifiées depuis la dernière synchro → upsert par inat_id
+    sync_start = yd_sync_timestamp()
+    n_added = 0
+    n_updated = 0
+    n_no_taxo = 0
+    canceled = False
+    error = None
+    # fid → taxon_id des entités ajoutées / modifiées dont la taxonomie est à résoudre
+    taxo_todo = {}
+
+    delta_params = dict(params, updated_since=sync["last_sync"])
+    try:
+        for results in yd_fetch_pages(yd_get_observations_v2, delta_params, log=log):
+            if progress.wasCanceled():
+                canceled = True
+                break
+
+            if photo_mode == "all":
+                nb = max((len(o.get('photos', []) or []) for o in results), default=0)
+                if nb > max_photos:
+                    pr.addAttributes([
+                        QgsField(f"url_photo{i}", QVariant.String, len=250)
+                        for i in range(max_photos + 1, nb + 1)
+                    ])
+                    vl.updateFields()
+                    max_photos = nb
+
+            fields = vl.fields()
+            names = ordered_fields + yd_photo_field_names(photo_mode, max_photos)
+            indexes = [fields.indexOf(n) for n in names]
+
+            adds = []
+            attr_changes = {}
+            geom_changes = {}
+            photo_adds = []
+            photo_deletes = []
+
+            for obs in results:
+                coords = yd_obs_coords(obs)
+                if not coords:
+                    continue
+                if inside is not None and not inside(coords):
+                    # Hors zone : supprimée plus bas si elle était dans la couche
+                    continue
+                geom = QgsGeometry.fromPointXY(QgsPointXY(coords[0], coords[1]))
+                attrs = build_row(obs, coords, max_photos)
+                values = dict(zip(indexes, attrs))
+
+                tid = (obs.get('taxon') or {}).get('id')
+                taxo = taxo_by_taxon.get(tid)
+                if tax_idx:
+                    # Taxon inconnu de la couche : champs vidés ici (un ancien
+                    # taxon ne doit pas rester), résolus après le delta
+                    values.update(taxo or {i: None for i in tax_idx.values()})
+
+                fid = fid_by_id.get(obs.get('id'))
+                if fid is None:
+                    feat = QgsFeature(fields)
+                    feat.setGeometry(geom)
+                    for idx, val in values.items():
+                        feat.setAttribute(idx, val)
+                    adds.append((feat, tid if tax_idx and not taxo else None))
+                else:
+                    attr_changes[fid] = values
+                    geom_changes[fid] = geom
+                    if tax_idx and not taxo and tid is not None:
+                        taxo_todo[fid] = tid
+
+                if vl_photos is not None:
+                    photo_deletes.extend(photo_fids.pop(obs.get('id'), []))
+                    for row_values in yd_photo_rows(obs):
+                        row = QgsFeature(vl_photos.fields())
+                        row.setAttributes(list(row_values))
+                        photo_adds.append(row)
+
+            if adds:
+                ok, added = pr.addFeatures([feat for feat, _ in adds])
+                for feat, (_, tid) in zip(added, adds):
+                    fid_by_id[feat[inat_idx]] = feat.id()
+                    if tid is not None:
+                        taxo_todo[feat.id()] = tid
+                n_added += len(adds)
+            if attr_changes:
+                pr.changeAttributeValues(attr_changes)
+                pr.changeGeometryValues(geom_changes)
+                n_updated += len(attr_changes)
+            if vl_photos is not None:
+                vl_photos.dataProvider().deleteFeatures(photo_deletes)
+                vl_photos.dataProvider().addFeatures(photo_adds)
+
+            progress.setLabelText(
+                "Refreshing the layer...\n"
+                f"{n_added} added, {n_updated} updated\n\n"
+                "------------------------------------------------------------\n"
+                "Mise à jour de la couche...\n"
+                f"{n_added} ajoutées, {n_updated} modifiées"
+            )
+            QApplication.processEvents()
+    except Exception as e:
+        # Traité comme une annulation : les pages déjà écrites seront
+        # redemandées à la prochaine mise à jour (date de synchro inchangée)
+        log(f"❌ Delta interrompu : {e}")
+        error = e
+        canceled = True
+
+    log(f"✅ Delta : {n_added} observations ajoutées, {n_updated} modifiées")
+
+    # 3b) Taxonomie des taxons nouveaux pour la couche (requêtes groupées +
+    #     référentiel persistant, cf. Script 2) ; API en erreur : laissée au Script 2
+    if taxo_todo and error is not None:
+        n_no_taxo = len(taxo_todo)
+    elif taxo_todo:
+        new_taxa = sorted(set(taxo_todo.values()))
+        log(f"🌳 Taxonomie de {len(new_taxa)} nouveaux taxons ({len(taxo_todo)} observations)...")
+        progress.setLabelText(
+            f"Resolving the taxonomy of {len(new_taxa)} new taxa...\n\n"
+            "------------------------------------------------------------\n"
+            f"Taxonomie de {len(new_taxa)} nouveaux taxons..."
+        )
+        QApplication.processEvents()
+        try:
+            taxo_map, _ = yd_build_taxonomy(
+                get_taxa_by_id, new_taxa, log=log,
+                on_taxon=lambda *a: QApplication.processEvents(),
+                store=yd_taxo_store_partage(),
+            )
+        except Exception as e:
+            log(f"⚠️ Taxonomie des nouveaux taxons impossible : {e}")
+            taxo_map = {}
+        tax_changes = {}
+        for fid, tid in taxo_todo.items():
+            taxo = taxo_map.get(tid)
+            if taxo and taxo.get("kingdom"):
+                tax_changes[fid] = {idx: taxo.get(name, "") for name, idx in tax_idx.items()}
+            else:
+                n_no_taxo += 1
+        if tax_changes:
+            pr.changeAttributeValues(tax_changes)
+        log(f"✅ Taxonomie écrite pour {len(tax_changes)} observations")
+
+    # 4) Suppressions : balayage des seuls id encore présents dans la zone
+    #    (couvre les observations supprimées ET celles sorties des filtres,
+    #    ex. changement de quality_grade)
+    n_deleted = 0
+    if not canceled and not sweep:
+        log(f"ℹ️ Suppressions non recherchées ({n_refresh} mises à jour sans balayage)")
+    if not canceled and sweep:
+        live_ids = set()
+        try:
+            id_params = dict(params, fields=API_FIELDS_ID if inside is None else API_FIELDS_ID_GEOM)
+            for results in yd_fetch_pages(yd_get_observations_v2, id_params, log=log):
+                if progress.wasCanceled():
+                    # Liste d'id incomplète : rien ne doit être supprimé
+                    canceled = True
+                    live_ids = None
+                    break
+                for o in results:
+                    if inside is None:
+                        live_ids.add(o.get('id'))
+                        continue
+                    coords = yd_obs_coords(o)
+                    if coords and inside(coords):
+                        live_ids.add(o.get('id'))
+                QApplication.processEvents()
+        except Exception as e:
+            log(f"⚠️ Balayage des id impossible, aucune suppression : {e}")
+            live_ids = None
+
+        if live_ids is not None:
+            if not live_ids and fid_by_id:
+                log("⚠️ Aucun id renvoyé par l'API, suppressions ignorées par prudence")
+            else:
+                gone = [iid for iid in fid_by_id if iid not in live_ids]
+                if gone:
+                    pr.deleteFeatures([fid_by_id[iid] for iid in gone])
+                    if vl_photos is not None:
+                        vl_photos.dataProvider().deleteFeatures(
+                            [fid for iid in gone for fid in photo_fids.get(iid, [])]
+                        )
+                n_deleted = len(gone)
+        if canceled:
+            log("⚠️ Balayage des id annulé, aucune suppression")
+        else:
+            log(f"✅ {n_deleted} observations supprimées (disparues ou hors filtres)")
+
+    progress.close()
+
+    if error is not None:
+        log("⚠️ Mise à jour interrompue par une erreur : date de synchro inchangée")
+    elif canceled:
+        log("⚠️ Mise à jour annulée par l'utilisateur : date de synchro inchangée")
+    else:
+        yd_write_sync_info(
+            gpkg_path, layer_name, sync_start, params, sync["fields"], photo_mode,
+            clip=clip, n_refresh=0 if sweep else n_refresh,
+        )
+        log(f"💾 Nouvelle date de synchro : {sync_start}")
+
+    if n_no_taxo:
+        log(f"ℹ️ {n_no_taxo} observations sans taxonomie : le Script 2 peut compléter la couche")
+
+    # 5) Photos locales : si la couche a déjà été récoltée, nouvelles photos en cache
+    if not canceled and yd_has_photo_paths(gpkg_path, layer_name, photo_mode):
+        yd_harvest_photos(gpkg_path, layer_name, photo_mode, log=log,
+                          progress=lambda p: QApplication.processEvents())
+
+    # 6) Couches de synthèse par mailles : recalculées sur la couche à jour
+    if not canceled:
+        levels = yd_rebuild_aggregates(gpkg_path, layer_name, log=log)
+        agg_names = {lv["name"] for lv in levels}
+        for lyr in QgsProject.instance().mapLayers().values():
+            if (isinstance(lyr, QgsVectorLayer) and lyr.source().split("|")[0] == gpkg_path
+                    and lyr.source().split("layername=")[-1].split("|")[0] in agg_names):
+                lyr.reload()
+                lyr.triggerRepaint()
+
+    active.reload()
+    active.triggerRepaint()
+
+    end_time = datetime.now()
+    log(f"Durée totale mise à jour : {end_time - start_time}")
+    log("=== FIN mise à jour ===")
+    log.close()
+
+    if error is not None:
+        QMessageBox.warning(
+            iface.mainWindow(),
+            "iNaturalist Refresh - ATTENTION !",
+            f"The refresh of \"{layer_name}\" was interrupted by an error, "
+            "the sync date is unchanged: run it again later.\n"
+            f"{error}\n"
+            f"- {n_added} observations added, {n_updated} updated before the error\n\n"
+            "------------------------------------------------------------\n\n"
+            f"La mise à jour de \"{layer_name}\" a été interrompue par une erreur, "
+            "la date de synchro est inchangée : relancez-la plus tard.\n"
+            f"- {n_added} observations ajoutées, {n_updated} modifiées avant l'erreur\n\n"
+            f"Journal / Log : {log_path}"
+        )
+        return
+
+    msg = QMessageBox(iface.mainWindow())
+    msg.setIcon(QMessageBox.Information)
+    msg.setWindowTitle("iNaturalist Refresh – Finished / Terminé")
+    msg.setText(
+        f"Layer \"{layer_name}\" refreshed:\n"
+        f"- {n_added} observations added\n"
+        f"- {n_updated} observations updated\n"
+        f"- {n_deleted} observations removed"
+        + ("" if sweep else " (no deletion sweep)") + "\n\n"
+        "------------------------------------------------------------\n\n"
+        f"Couche \"{layer_name}\" mise à jour :\n"
+        f"- {n_added} observations ajoutées\n"
+        f"- {n_updated} observations modifiées\n"
+        f"- {n_deleted} observations supprimées"
+        + ("" if sweep else " (sans balayage des suppressions)")
+    )
+    msg.setStandardButtons(QMessageBox.Ok)
+    msg.exec_()
+
+
+def yd_run(iface):  #*** Plugin entry point
+    etape10_mise_a_jour()
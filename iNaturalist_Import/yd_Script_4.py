@@ -0,0 +1,106 @@
+# ==============================================================
+# Plugin QGIS : iNaturalist Import
+# Script     : yd_Script_4
+# Version    : 1.0.0
+# Rôle       : Reprise du dernier import interrompu (erreur réseau, QGIS
+#              fermé...) à partir de son journal : le GPKG partiel est
+#              complété depuis le dernier curseur validé
+# Dépendance : pyinaturalist (pré-requis géré par Script 1)
+# QGIS       : 3.40 (Bratislava)
+# ==============================================================
+
+from qgis.core import QgsApplication, QgsTask
+from qgis.PyQt.QtWidgets import QMessageBox
+
+from datetime import datetime
+
+from .yd_api import yd_get_observations_v2
+from .yd_cache import yd_cache_partage
+from .yd_engine import yd_resume_import
+from .yd_journal import yd_journal_last
+from .yd_layers import yd_load_gpkg_layers
+
+# Tâches de reprise en cours (références à garder pour QgsTask.fromFunction)
+_yd_tasks = []
+
+
+def etape7_reprise(iface):
+
+    journal = yd_journal_last()
+    if journal is None:
+        QMessageBox.information(
+            iface.mainWindow(),
+            "iNaturalist Resume",
+            "There is no interrupted import to resume.\n"
+            "------------------------------------------------------------\n"
+            "Aucun import interrompu à reprendre."
+        )
+        return
+
+    layer_name = journal["layer_name"]
+    gpkg_path = journal["gpkg_path"]
+    updated = datetime.fromtimestamp(journal.get("updated", 0)).strftime("%Y-%m-%d %H:%M")
+
+    reply = QMessageBox.question(
+        iface.mainWindow(),
+        "iNaturalist Resume / Reprise",
+        f"Resume the import of \"{layer_name}\"?\n"
+        f"{journal.get('n_obs', 0)} observations already saved (last checkpoint: {updated}).\n\n"
+        "------------------------------------------------------------\n"
+        f"Reprendre l'import de « {layer_name} » ?\n"
+        f"{journal.get('n_obs', 0)} observations déjà enregistrées "
+        f"(dernier point de reprise : {updated}).\n\n"
+        f"GPKG : {gpkg_path}",
+        QMessageBox.Yes | QMessageBox.No
+    )
+    if reply != QMessageBox.Yes:
+        return
+
+    cache = yd_cache_partage()
+
+    def run_resume(task):
+        return yd_resume_import(
+            yd_get_observations_v2, journal, cache=cache,
+            progress=task.setProgress, is_canceled=task.isCanceled,
+        )
+
+    def resume_finished(exception, result=None):
+        if task_ref in _yd_tasks:
+            _yd_tasks.remove(task_ref)
+
+        if exception is not None or result is None or result["canceled"] or result["error"]:
+            if exception is not None:
+                print(f"❌ Reprise interrompue : {exception}")
+            iface.messageBar().pushWarning(
+                "ETAPE 7", f"Reprise {layer_name} interrompue / annulée"
+            )
+            return
+
+        iface.messageBar().pushSuccess(
+            "ETAPE 8", f"{result['n_feats']} obs ajoutées - GPKG enregistré : {gpkg_path}"
+        )
+        yd_load_gpkg_layers(iface, gpkg_path, layer_name, journal["photo_mode"])
+
+    task_ref = QgsTask.fromFunction(
+        f"iNaturalist Resume – {layer_name}",
+        run_resume,
+        on_finished=resume_finished,
+    )
+    _yd_tasks.append(task_ref)
+    QgsApplication.taskManager().addTask(task_ref)
+    print(f"⏳ Reprise lancée en tâche de fond : {layer_name}")
+
+
+def yd_run(iface):  #*** Plugin entry point
+    try:
+        import pyinaturalist  # noqa: F401
+    except ImportError:
+        QMessageBox.critical(
+            iface.mainWindow(),
+            "iNaturalist Resume - ATTENTION ! Missing dependency",
+            "This tool requires the Python module 'pyinaturalist' (see Script 1).\n"
+            "------------------------------------------------------------\n"
+            "Cet outil nécessite le module Python 'pyinaturalist' (voir Script 1)."
+        )
+        return
+    etape7_reprise(iface)
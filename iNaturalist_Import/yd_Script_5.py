@@ -0,0 +1,270 @@
+# ==============================================================
+# Plugin QGIS : iNaturalist Import
+# Script     : yd_Script_5
+# Version    : 1.0.0
+# Rôle       : Import par lot depuis la couche active (points + champ
+#              rayon, ou polygones) : un seul profil de filtres / champs,
+#              un GPKG par site ou une couche combinée (site_id)
+# Dépendance : pyinaturalist (pré-requis géré par Script 1)
+# QGIS       : 3.40 (Bratislava)
+# ==============================================================
+
+from qgis.core import QgsApplication, QgsProject, QgsTask, QgsVectorLayer, QgsWkbTypes
+from qgis.PyQt.QtWidgets import (
+    QDialog, QVBoxLayout, QLabel, QLineEdit, QComboBox, QDialogButtonBox,
+    QRadioButton, QCheckBox, QDoubleSpinBox, QSpinBox, QMessageBox
+)
+
+import os
+
+from .yd_api import yd_get_observations_v2
+from .yd_batch import (
+    BATCH_WORKERS, OUTPUT_COMBINED, OUTPUT_SITES, STATUS_OK, yd_run_batch,
+    yd_sites_from_layer
+)
+from .yd_cache import yd_cache_partage
+from .yd_engine import yd_ordered_fields
+from .yd_layers import yd_load_gpkg_layers
+from .yd_observation import BASE_ORDER
+from .yd_photos import YD_HARVEST_TOOLTIP
+
+# PARAMÈTRES
+# Au-delà, les couches par site ne sont pas chargées dans le projet
+BATCH_LOAD_MAX = 20
+
+# Tâches d'import par lot en cours (références à garder pour QgsTask.fromFunction)
+_yd_tasks = []
+
+
+def etape7_lot(iface):
+
+    layer = iface.activeLayer()
+    geom_type = None
+    if isinstance(layer, QgsVectorLayer):
+        geom_type = QgsWkbTypes.geometryType(layer.wkbType())
+    if geom_type not in (QgsWkbTypes.PointGeometry, QgsWkbTypes.PolygonGeometry):
+        QMessageBox.warning(
+            iface.mainWindow(),
+            "iNaturalist Batch Import",
+            "Select a point layer (site centers) or a polygon layer (site outlines) first.\n"
+            "------------------------------------------------------------\n"
+            "Sélectionner d'abord une couche de points (centres des sites) "
+            "ou de polygones (contours des sites)."
+        )
+        return
+
+    project_path = QgsProject.instance().fileName()
+    if not project_path:
+        QMessageBox.warning(
+            iface.mainWindow(),
+            "iNaturalist Batch Import",
+            "Save the project first: the GPKG files are written in the project folder.\n"
+            "------------------------------------------------------------\n"
+            "Enregistrer d'abord le projet : les GPKG sont écrits dans le dossier du projet."
+        )
+        return
+
+    is_points = geom_type == QgsWkbTypes.PointGeometry
+
+    # ---------- DIALOGUE : SITES, FILTRES, CHAMPS, SORTIE ----------
+    dialog = QDialog()
+    dialog.setWindowTitle("iNaturalist Import - Batch / Import par lot")
+    dialog.resize(420, 760)
+    layout = QVBoxLayout()
+
+    layout.addWidget(QLabel(f"Couche des sites : {layer.name()} ({layer.featureCount()} entités)"))
+    selected_check = QCheckBox("Entités sélectionnées seulement")
+    selected_check.setEnabled(layer.selectedFeatureCount() > 0)
+    layout.addWidget(selected_check)
+
+    layout.addWidget(QLabel("Champ identifiant du site (site_id) :"))
+    id_combo = QComboBox()
+    id_combo.addItem("(fid)")
+    for field in layer.fields():
+        id_combo.addItem(field.name())
+    layout.addWidget(id_combo)
+
+    radius_combo = QComboBox()
+    radius_spin = QDoubleSpinBox()
+    if is_points:
+        layout.addWidget(QLabel("Champ rayon (m) :"))
+        radius_combo.addItem("(rayon fixe)")
+        for field in layer.fields():
+            if field.isNumeric():
+                radius_combo.addItem(field.name())
+        layout.addWidget(radius_combo)
+        layout.addWidget(QLabel("Rayon fixe / par défaut (m) :"))
+        radius_spin.setRange(1, 500000)
+        radius_spin.setValue(1000)
+        layout.addWidget(radius_spin)
+
+    layout.addWidget(QLabel("Date début (incluse) YYYY-MM-DD (vide = tout) :"))
+    d1_edit = QLineEdit()
+    layout.addWidget(d1_edit)
+    layout.addWidget(QLabel("Date fin (exclue) YYYY-MM-DD (vide = tout) :"))
+    d2_edit = QLineEdit()
+    layout.addWidget(d2_edit)
+    layout.addWidget(QLabel("User login (empty = all) / Login utilisateur (vide = tous) :"))
+    user_edit = QLineEdit()
+    layout.addWidget(user_edit)
+    layout.addWidget(QLabel("Taxon nom scientifique (vide = tous) :"))
+    taxon_edit = QLineEdit()
+    layout.addWidget(taxon_edit)
+    layout.addWidget(QLabel("Quality grade :"))
+    quality_combo = QComboBox()
+    quality_combo.addItems(["tous", "research", "needs_id", "casual"])
+    layout.addWidget(quality_combo)
+
+    layout.addWidget(QLabel("Non-photo fields to include :"))
+    champs_checks = {}
+    for champ in BASE_ORDER:
+        if champ in ("inat_id", "taxon_id"):
+            continue
+        cb = QCheckBox(champ)
+        cb.setChecked(True)
+        champs_checks[champ] = cb
+        layout.addWidget(cb)
+
+    layout.addWidget(QLabel("Photos à exporter :"))
+    photo_combo = QComboBox()
+    photo_combo.addItems(["none", "one", "all", "table"])
+    photo_combo.setCurrentText("all")
+    layout.addWidget(photo_combo)
+    harvest_check = QCheckBox(
+        "Download the photos for offline use / Télécharger les photos (consultation hors ligne)"
+    )
+    harvest_check.setToolTip(YD_HARVEST_TOOLTIP)
+    layout.addWidget(harvest_check)
+
+    layout.addWidget(QLabel("Summary layers / Couches de synthèse par mailles :"))
+    agg_combo = QComboBox()
+    agg_combo.addItem("None / Aucune", None)
+    agg_combo.addItem("Hexagons / Hexagones", "hex")
+    agg_combo.addItem("Square grid / Grille carrée", "grid")
+    layout.addWidget(agg_combo)
+
+    layout.addWidget(QLabel("Sortie :"))
+    radio_sites = QRadioButton("Un GPKG par site")
+    radio_combined = QRadioButton("Une couche combinée (colonne site_id)")
+    radio_combined.setChecked(True)
+    layout.addWidget(radio_sites)
+    layout.addWidget(radio_combined)
+
+    layout.addWidget(QLabel("Travaux simultanés :"))
+    workers_spin = QSpinBox()
+    workers_spin.setRange(1, 8)
+    workers_spin.setValue(BATCH_WORKERS)
+    layout.addWidget(workers_spin)
+
+    bypass_check = QCheckBox(
+        "Bypass cache (re-download) / Ignorer le cache (tout retélécharger)"
+    )
+    layout.addWidget(bypass_check)
+
+    buttons = QDialogButtonBox(QDialogButtonBox.Ok | QDialogButtonBox.Cancel)
+    buttons.accepted.connect(dialog.accept)
+    buttons.rejected.connect(dialog.reject)
+    layout.addWidget(buttons)
+    dialog.setLayout(layout)
+    if dialog.exec_() != QDialog.Accepted:
+        print("❌ Annulé par utilisateur (import par lot)")
+        return
+
+    # ---------- SITES (lus dans le fil principal) ----------
+    try:
+        sites = yd_sites_from_layer(
+            layer,
+            radius_field=radius_combo.currentText() if radius_combo.currentIndex() > 0 else None,
+            default_radius_m=radius_spin.value() if is_points else None,
+            id_field=id_combo.currentText() if id_combo.currentIndex() > 0 else None,
+            selected_only=selected_check.isChecked(),
+        )
+    except Exception as e:
+        print(f"❌ Lecture des sites impossible : {e}")
+        return
+    if not sites:
+        print("❌ Aucun site utilisable dans la couche")
+        return
+
+    profile = {
+        "d1": d1_edit.text(),
+        "d2": d2_edit.text(),
+        "user_login": user_edit.text(),
+        "taxon_name": taxon_edit.text(),
+        "quality_grade": quality_combo.currentText(),
+        "ordered_fields": yd_ordered_fields(
+            [k for k, cb in champs_checks.items() if cb.isChecked()]
+        ),
+        "photo_mode": photo_combo.currentText(),
+        "photos": harvest_check.isChecked(),
+        "aggregates": agg_combo.currentData(),
+    }
+    output = OUTPUT_COMBINED if radio_combined.isChecked() else OUTPUT_SITES
+    out_dir = os.path.dirname(project_path)
+    batch_name = layer.name()
+    bypass_cache = bypass_check.isChecked()
+    workers = workers_spin.value()
+
+    print(f"🗂️ Import par lot : {len(sites)} sites, sortie {output}, photos {profile['photo_mode']}")
+
+    cache = yd_cache_partage()
+
+    def run_batch(task):
+        return yd_run_batch(
+            yd_get_observations_v2, sites, profile, out_dir, batch_name=batch_name,
+            output=output, cache=cache, refresh=bypass_cache, workers=workers,
+            progress=task.setProgress, is_canceled=task.isCanceled,
+        )
+
+    def batch_finished(exception, result=None):
+        if task_ref in _yd_tasks:
+            _yd_tasks.remove(task_ref)
+
+        if exception is not None or result is None or result["canceled"]:
+            if exception is not None:
+                print(f"❌ Import par lot interrompu : {exception}")
+            iface.messageBar().pushWarning("ETAPE 7", f"Import par lot {batch_name} interrompu / annulé")
+            return
+
+        jobs = result["jobs"]
+        n_ok = sum(1 for job in jobs if job["status"] == STATUS_OK)
+        iface.messageBar().pushSuccess(
+            "ETAPE 8", f"Lot {batch_name} : {n_ok}/{len(jobs)} sites importés - rapport : "
+            f"{result['report_path']}"
+        )
+
+        # ---------- ETAPE 8 bis : charger les couches GPKG ----------
+        photo_mode = profile["photo_mode"]
+        if result["combined"] is not None:
+            gpkg_path, layer_name = result["combined"]
+            yd_load_gpkg_layers(iface, gpkg_path, layer_name, photo_mode)
+        elif n_ok <= BATCH_LOAD_MAX:
+            for job in jobs:
+                if job["status"] == STATUS_OK:
+                    yd_load_gpkg_layers(iface, job["gpkg_path"], job["layer_name"], photo_mode)
+        else:
+            print(f"ℹ️ {n_ok} GPKG écrits dans {out_dir} (non chargés : plus de {BATCH_LOAD_MAX})")
+
+    task_ref = QgsTask.fromFunction(
+        f"iNaturalist Batch Import – {batch_name}",
+        run_batch,
+        on_finished=batch_finished,
+    )
+    _yd_tasks.append(task_ref)
+    QgsApplication.taskManager().addTask(task_ref)
+    print(f"⏳ Import par lot lancé en tâche de fond : {batch_name}")
+
+
+def yd_run(iface):  #*** Plugin entry point
+    try:
+        import pyinaturalist  # noqa: F401
+    except ImportError:
+        QMessageBox.critical(
+            iface.mainWindow(),
+            "iNaturalist Batch Import - ATTENTION ! Missing dependency",
+            "This tool requires the Python module 'pyinaturalist' (see Script 1).\n"
+            "------------------------------------------------------------\n"
+            "Cet outil nécessite le module Python 'pyinaturalist' (voir Script 1)."
+        )
+        return
+    etape7_lot(iface)
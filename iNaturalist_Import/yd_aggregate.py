@@ -0,0 +1,274 @@
+# ==============================================================
+# Plugin QGIS : iNaturalist Import
+# Module     : yd_aggregate
+# Version    : 1.0.0
+# Rôle       : Couches de synthèse pré-agrégées (hexagones ou grille) à
+#              plusieurs résolutions : nombre d'observations, richesse
+#              spécifique et dernière date par maille, écrites dans le
+#              même GPKG, chacune visible dans sa plage d'échelles
+# QGIS       : 3.40 (Bratislava) — sans qgis (sqlite3 uniquement)
+# ==============================================================
+
+import math
+import sqlite3
+
+from .yd_gpkg import yd_GpkgWriter
+
+# PARAMÈTRES
+AGG_SHAPES = ("hex", "grid")
+AGG_SIZES_M = (500, 2000, 10000, 50000)   # largeur des mailles, de la plus fine
+# Une maille de s mètres est affichée à partir de l'échelle 1:(s x AGG_SCALE_FACTOR)
+# jusqu'au seuil du niveau suivant ; les points en dessous du premier seuil
+AGG_SCALE_FACTOR = 50
+AGG_TABLE = "yd_inat_aggregates"
+# Colonnes de la couche d'observations lues pour l'agrégation
+AGG_FIELDS = ["scientific_name", "taxon_rank", "date_obs"]
+AGG_COLUMNS = [
+    ("cell_id", "TEXT(40)"),
+    ("size_m", "MEDIUMINT"),
+    ("n_obs", "MEDIUMINT"),
+    ("n_species", "MEDIUMINT"),
+    ("last_obs", "DATE"),
+]
+# Rangs comptés dans la richesse (ramenés au binôme genre + espèce)
+SPECIES_RANKS = {"species", "hybrid", "subspecies", "variety", "form", "infrahybrid"}
+EARTH_RADIUS_M = 6378137.0   # sphère de la projection Web Mercator
+
+_SQRT3 = math.sqrt(3.0)
+
+
+def yd_aggregate_layer_name(layer_name, shape, size_m):
+    return f"{layer_name}_{shape}{size_m}m"
+
+
+def yd_aggregate_scales(sizes=AGG_SIZES_M):
+    """
+    (min_scale, max_scale) de chaque niveau, au sens de QGIS : dénominateur
+    le plus dézoomé (0 = sans limite) puis le plus zoomé.
+    """
+    sizes = sorted(sizes)
+    return [
+        (sizes[i + 1] * AGG_SCALE_FACTOR if i + 1 < len(sizes) else 0,
+         size * AGG_SCALE_FACTOR)
+        for i, size in enumerate(sizes)
+    ]
+
+
+def yd_points_min_scale(sizes=AGG_SIZES_M):
+    """Échelle au-delà de laquelle la couche de points laisse place aux mailles."""
+    return min(sizes) * AGG_SCALE_FACTOR
+
+
+def _mercator(lon, lat):
+    lat = max(-85.0, min(85.0, lat))
+    return (EARTH_RADIUS_M * math.radians(lon),
+            EARTH_RADIUS_M * math.log(math.tan(math.pi / 4 + math.radians(lat) / 2)))
+
+
+def _lonlat(x, y):
+    return (math.degrees(x / EARTH_RADIUS_M),
+            math.degrees(2 * math.atan(math.exp(y / EARTH_RADIUS_M)) - math.pi / 2))
+
+
+def _species_key(name, rank):
+    # Sous-espèces, variétés… comptées avec leur espèce ; rangs supérieurs ignorés
+    if rank not in SPECIES_RANKS or not name:
+        return None
+    words = [w for w in name.split() if w != "×"]
+    return " ".join(words[:2])
+
+
+def _hex_cell(x, y, r):
+    # Hexagones pointe en haut, rayon r : coordonnées axiales arrondies (cube)
+    q = (_SQRT3 / 3 * x - y / 3) / r
+    s = 2.0 / 3 * y / r
+    cx, cz = round(q), round(s)
+    cy = round(-q - s)
+    dx, dy, dz = abs(cx - q), abs(cy + q + s), abs(cz - s)
+    if dx > dy and dx > dz:
+        cx = -cy - cz
+    elif dy <= dz:
+        cz = -cx - cy
+    return int(cx), int(cz)
+
+
+def _hex_ring(cell, r):
+    q, s = cell
+    cx = r * _SQRT3 * (q + s / 2.0)
+    cy = r * 1.5 * s
+    angles = [math.radians(30 + 60 * i) for i in range(6)]
+    ring = [(cx + r * math.cos(a), cy + r * math.sin(a)) for a in angles]
+    return ring + ring[:1]
+
+
+def _grid_cell(x, y, size):
+    return int(math.floor(x / size)), int(math.floor(y / size))
+
+
+def _grid_ring(cell, size):
+    i, j = cell
+    x0, y0 = i * size, j * size
+    return [(x0, y0), (x0 + size, y0), (x0 + size, y0 + size), (x0, y0 + size), (x0, y0)]
+
+
+def yd_aggregate_rows(points, shape, sizes=AGG_SIZES_M):
+    """
+    points : [(lon, lat, nom scientifique, rang, date_obs)] en EPSG:4326.
+    Mailles construites en Web Mercator ; leur taille est corrigée à la
+    latitude moyenne des points pour valoir ~size_m mètres sur le terrain
+    (largeur entre côtés opposés pour les hexagones).
+    Renvoie {size_m: [(anneau lon/lat, [cell_id, size_m, n_obs, n_species, last_obs])]}.
+    """
+    if shape not in AGG_SHAPES:
+        raise ValueError(f"Forme de maille inconnue : {shape}")
+    if not points:
+        return {size: [] for size in sizes}
+    lat0 = sum(p[1] for p in points) / len(points)
+    k = 1.0 / max(0.05, math.cos(math.radians(lat0)))
+    projected = [
+        (_mercator(lon, lat), _species_key(name, rank), (date or "")[:10])
+        for lon, lat, name, rank, date in points
+    ]
+
+    out = {}
+    for size in sizes:
+        if shape == "hex":
+            unit = size * k / _SQRT3      # rayon = largeur / √3
+            cell_of, ring_of = _hex_cell, _hex_ring
+        else:
+            unit = size * k
+            cell_of, ring_of = _grid_cell, _grid_ring
+        cells = {}
+        for (x, y), species, date in projected:
+            cell = cell_of(x, y, unit)
+            stats = cells.get(cell)
+            if stats is None:
+                stats = cells[cell] = [0, set(), ""]
+            stats[0] += 1
+            if species:
+                stats[1].add(species)
+            if date > stats[2]:
+                stats[2] = date
+        out[size] = [
+            ([_lonlat(x, y) for x, y in ring_of(cell, unit)],
+             [f"{shape}{size}_{cell[0]}_{cell[1]}", size, n, len(species), date or None])
+            for cell, (n, species, date) in sorted(cells.items())
+        ]
+    return out
+
+
+def yd_read_aggregate_info(gpkg_path, layer_name):
+    """Niveaux agrégés de la couche [{name, shape, size_m, min_scale, max_scale}]."""
+    conn = sqlite3.connect(gpkg_path)
+    try:
+        rows = conn.execute(
+            f"SELECT agg_name, shape, size_m, min_scale, max_scale FROM {AGG_TABLE} "
+            "WHERE layer_name = ? ORDER BY size_m",
+            (layer_name,),
+        ).fetchall()
+    except sqlite3.OperationalError:
+        return []
+    finally:
+        conn.close()
+    return [
+        {"name": r[0], "shape": r[1], "size_m": r[2], "min_scale": r[3], "max_scale": r[4]}
+        for r in rows
+    ]
+
+
+def yd_write_aggregate_info(gpkg_path, layer_name, levels):
+    """Mémorise les niveaux agrégés de la couche (remplace les précédents)."""
+    conn = sqlite3.connect(gpkg_path)
+    try:
+        conn.execute(
+            f"CREATE TABLE IF NOT EXISTS {AGG_TABLE} ("
+            " agg_name TEXT PRIMARY KEY,"
+            " layer_name TEXT NOT NULL,"
+            " shape TEXT NOT NULL,"
+            " size_m INTEGER NOT NULL,"
+            " min_scale REAL NOT NULL,"
+            " max_scale REAL NOT NULL)"
+        )
+        # Table déclarée dans gpkg_contents pour rester un GPKG valide
+        conn.execute(
+            "INSERT OR IGNORE INTO gpkg_contents "
+            "(table_name, data_type, identifier, last_change) "
+            "VALUES (?, 'attributes', ?, strftime('%Y-%m-%dT%H:%M:%fZ', 'now'))",
+            (AGG_TABLE, AGG_TABLE),
+        )
+        conn.execute(f"DELETE FROM {AGG_TABLE} WHERE layer_name = ?", (layer_name,))
+        conn.executemany(
+            f"INSERT INTO {AGG_TABLE} VALUES (?, ?, ?, ?, ?, ?)",
+            [(lv["name"], layer_name, lv["shape"], lv["size_m"], lv["min_scale"],
+              lv["max_scale"]) for lv in levels],
+        )
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def yd_write_aggregates(writer, layer_name, shape, sizes=AGG_SIZES_M, log=print):
+    """
+    (Re)construit les couches agrégées de layer_name dans le GPKG ouvert par
+    writer (yd_GpkgWriter), à partir des points déjà écrits : les niveaux
+    précédents sont supprimés, les nouveaux indexés au close() du writer.
+    Une couche de même nom déjà présente (ex. rafraîchissement, fichier
+    ouvert dans QGIS) est vidée puis remplie plutôt que recréée.
+    Appeler ensuite yd_write_aggregate_info une fois le writer fermé.
+    Renvoie la liste des niveaux (cf. yd_read_aggregate_info) + n_cells.
+    """
+    missing = [c for c in AGG_FIELDS if c not in writer.columns(layer_name)]
+    if missing:
+        log(f"⚠️ Synthèse par mailles impossible, colonnes absentes : {', '.join(missing)}")
+        return []
+    sizes = sorted(sizes)
+    names = {size: yd_aggregate_layer_name(layer_name, shape, size) for size in sizes}
+    for lv in yd_read_aggregate_info(writer.path, layer_name):
+        # Niveaux d'une synthèse précédente qui ne seront pas reconstruits
+        if lv["name"] not in names.values() and writer.has_layer(lv["name"]):
+            writer.drop_layer(lv["name"])
+
+    points = list(writer.rows(layer_name, AGG_FIELDS))
+    per_size = yd_aggregate_rows(points, shape, sizes)
+    levels = []
+    refilled = []
+    for size, (min_scale, max_scale) in zip(sizes, yd_aggregate_scales(sizes)):
+        name = names[size]
+        if writer.has_layer(name):
+            writer.clear(name)
+            refilled.append(name)
+        else:
+            writer.create_layer(name, AGG_COLUMNS, geometry="POLYGON")
+        writer.insert(name, per_size[size])
+        levels.append({
+            "name": name, "shape": shape, "size_m": size,
+            "min_scale": min_scale, "max_scale": max_scale,
+            "n_cells": len(per_size[size]),
+        })
+    for name in refilled:
+        writer.update_extent(name)
+    writer.commit()
+    log(f"🔷 Synthèse {shape} : "
+        + ", ".join(f"{lv['size_m']} m → {lv['n_cells']} mailles" for lv in levels))
+    return levels
+
+
+def yd_rebuild_aggregates(gpkg_path, layer_name, log=print):
+    """
+    Recalcule les couches agrégées existantes d'une couche (ex. après une
+    mise à jour par Script 3) avec leur forme et leurs tailles d'origine.
+    Renvoie les niveaux, [] si la couche n'a pas de synthèse.
+    """
+    info = yd_read_aggregate_info(gpkg_path, layer_name)
+    if not info:
+        return []
+    writer = yd_GpkgWriter(gpkg_path, resume=True)
+    try:
+        levels = yd_write_aggregates(writer, layer_name, info[0]["shape"],
+                                     [lv["size_m"] for lv in info], log=log)
+    except Exception:
+        writer.suspend()
+        raise
+    writer.close()
+    yd_write_aggregate_info(gpkg_path, layer_name, levels)
+    return levels
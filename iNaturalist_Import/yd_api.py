@@ -0,0 +1,65 @@
+# ==============================================================
+# Plugin QGIS : iNaturalist Import
+# Module     : yd_api
+# Version    : 1.0.0
+# Rôle       : Appel GET /v2/observations (session par thread) avec la
+#              projection des réponses : l'API v2 ne renvoie que les
+#              attributs utiles aux champs de sortie (paramètre fields,
+#              construit par yd_columns), au lieu de l'observation complète
+# QGIS       : 3.40 (Bratislava)
+# ==============================================================
+
+import threading
+import time
+
+import requests
+
+from .yd_columns import (  # noqa: F401 (projection, réexportée pour les scripts)
+    API_FIELDS_ALL, API_FIELDS_ID, API_FIELDS_ID_GEOM, yd_api_fields
+)
+from .yd_metrics import yd_note_response
+
+# PARAMÈTRES
+API_V2_OBSERVATIONS = "https://api.inaturalist.org/v2/observations"
+TIMEOUT_S = 60
+USER_AGENT = "iNaturalist_Import (QGIS plugin)"
+
+_local = threading.local()
+
+
+def _session():
+    # Une session (connexions keep-alive) par thread de récupération
+    session = getattr(_local, "session", None)
+    if session is None:
+        session = requests.Session()
+        session.headers["User-Agent"] = USER_AGENT
+        _local.session = session
+    return session
+
+
+def _query_value(value):
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    if isinstance(value, (list, tuple, set)):
+        return ",".join(str(v) for v in value)
+    return value
+
+
+def yd_get_observations_v2(**params):
+    """
+    GET /v2/observations, même usage que pyinaturalist get_observations
+    (dict avec total_results et results). Les dates restent des chaînes ISO.
+    Sans fields, la projection commune API_FIELDS_ALL est demandée : elle
+    ne figure pas dans les paramètres de l'appelant, donc pas dans la clé
+    du cache, et une page en cache sert toute sélection de champs.
+    Lève requests.HTTPError sur une réponse en erreur (429 compris).
+    """
+    if params.get("fields") is None:
+        params["fields"] = API_FIELDS_ALL
+    query = {k: _query_value(v) for k, v in params.items() if v is not None}
+    resp = _session().get(API_V2_OBSERVATIONS, params=query, timeout=TIMEOUT_S)
+    resp.raise_for_status()
+    t = time.perf_counter()
+    data = resp.json()
+    yd_note_response(len(resp.content), time.perf_counter() - t)
+    return data
@@ -0,0 +1,291 @@
+# ==============================================================
+# Plugin QGIS : iNaturalist Import
+# Module     : yd_batch
+# Version    : 1.0.0
+# Rôle       : Import par lot : une couche de sites (centres + rayon, ou
+#              polygones) → une requête par site, exécutées par une file de
+#              travaux concurrents (cache et limiteur partagés) → un GPKG
+#              par site, ou une couche combinée avec une colonne site_id
+#              Utilisé par Script 5 (QgsTask) et par yd_cli batch
+# QGIS       : 3.40 (Bratislava) — qgis.core uniquement
+# ==============================================================
+
+from qgis.core import (
+    QgsCoordinateReferenceSystem, QgsCoordinateTransform, QgsGeometry, QgsProject,
+    QgsWkbTypes, QgsVectorFileWriter, NULL
+)
+
+import csv
+import os
+import re
+import shutil
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
+
+from .yd_aggregate import AGG_FIELDS, yd_write_aggregate_info, yd_write_aggregates
+from .yd_engine import (
+    PHOTO_TABLE_COLUMNS, yd_area_layer_name, yd_build_area_params, yd_build_params,
+    yd_gpkg_columns, yd_import_observations, yd_layer_name, yd_ordered_fields
+)
+from .yd_gpkg import yd_GpkgWriter
+from .yd_journal import yd_journal_clear
+from .yd_photos import yd_harvest_photos
+
+# PARAMÈTRES
+BATCH_WORKERS = 3          # sites importés simultanément (limiteur commun)
+OUTPUT_SITES = "sites"     # un GPKG par site
+OUTPUT_COMBINED = "combined"  # une couche unique avec site_id
+SITE_ID_COLUMN = ("site_id", "TEXT(80)")
+
+# Statuts des travaux (rapport)
+STATUS_OK = "ok"
+STATUS_SKIPPED = "ignoré"
+STATUS_ERROR = "erreur"
+STATUS_CANCELED = "annulé"
+
+REPORT_FIELDS = [
+    "site_id", "status", "n_obs", "n_feats", "duration_s",
+    "lat", "lon", "radius_m", "layer_name", "gpkg_path", "error",
+]
+
+
+def _safe_name(value):
+    return re.sub(r"[^\w.-]+", "_", str(value)).strip("_") or "site"
+
+
+def yd_sites_from_layer(layer, radius_field=None, default_radius_m=None,
+                        id_field=None, selected_only=False, log=print):
+    """
+    Sites d'une couche de points (rayon = champ radius_field, sinon
+    default_radius_m) ou de polygones (zone : bbox + découpe au polygone,
+    radius_m à None). Renvoie [{site_id, lat, lon, radius_m, clip}] en
+    EPSG:4326 ; à appeler depuis le fil principal pour une couche du projet.
+    """
+    wgs84 = QgsCoordinateReferenceSystem("EPSG:4326")
+    to_wgs = QgsCoordinateTransform(layer.crs(), wgs84, QgsProject.instance())
+    geom_type = QgsWkbTypes.geometryType(layer.wkbType())
+    if geom_type not in (QgsWkbTypes.PointGeometry, QgsWkbTypes.PolygonGeometry):
+        raise ValueError("Couche de sites : points ou polygones attendus")
+
+    feats = layer.getSelectedFeatures() if selected_only else layer.getFeatures()
+    sites = []
+    seen = set()
+    for feat in feats:
+        geom = QgsGeometry(feat.geometry())
+        if geom.isEmpty():
+            continue
+        geom.transform(to_wgs)
+
+        site_id = feat[id_field] if id_field else None
+        if site_id in (None, NULL, ""):
+            site_id = feat.id()
+        site_id = str(site_id)
+        if site_id in seen:
+            site_id = f"{site_id}_{feat.id()}"
+        seen.add(site_id)
+
+        center = geom.centroid().asPoint()
+        if geom_type == QgsWkbTypes.PolygonGeometry:
+            sites.append({
+                "site_id": site_id,
+                "lat": center.y(),
+                "lon": center.x(),
+                "radius_m": None,
+                "clip": geom.asWkt(),
+            })
+            continue
+
+        radius_m = feat[radius_field] if radius_field else None
+        if radius_m in (None, NULL, ""):
+            radius_m = default_radius_m
+        try:
+            radius_m = float(radius_m)
+        except (TypeError, ValueError):
+            radius_m = 0.0
+        if radius_m <= 0:
+            log(f"⚠️ Site {site_id} ignoré : rayon absent ou nul")
+            continue
+
+        sites.append({
+            "site_id": site_id,
+            "lat": center.y(),
+            "lon": center.x(),
+            "radius_m": radius_m,
+            "clip": None,
+        })
+    return sites
+
+
+def _write_report(path, jobs):
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=REPORT_FIELDS, delimiter=";",
+                                extrasaction="ignore")
+        writer.writeheader()
+        writer.writerows(jobs)
+
+
+def yd_run_batch(get_observations, sites, profile, out_dir, batch_name="lot",
+                 output=OUTPUT_SITES, cache=None, refresh=False, workers=BATCH_WORKERS,
+                 progress=None, is_canceled=None, log=print):
+    """
+    Import de tous les sites avec un même profil (dict : d1, d2, user_login,
+    taxon_name, quality_grade, ordered_fields, photo_mode, photos, aggregates).
+    photos=True : photos téléchargées (yd_photos) pour chaque GPKG de site,
+    ou une fois pour la couche combinée.
+    aggregates ("hex" / "grid") : couches de synthèse de chaque GPKG de site,
+    ou de la couche combinée une fois la fusion terminée.
+    Les sites passent par une file de `workers` travaux concurrents ; le
+    limiteur de débit et le cache sont communs à tous les travaux.
+    Renvoie {"jobs": [...], "report_path", "combined": (gpkg, couche) ou None,
+    "canceled"} ; chaque travail porte son statut et sa durée.
+    """
+    is_canceled = is_canceled or (lambda: False)
+    ordered_fields = profile["ordered_fields"]
+    photo_mode = profile["photo_mode"]
+    harvest = bool(profile.get("photos")) and photo_mode != "none"
+    aggregates = profile.get("aggregates") or None
+    if aggregates:
+        # Colonnes nécessaires aux mailles, identiques pour tous les sites
+        ordered_fields = yd_ordered_fields(list(ordered_fields) + AGG_FIELDS)
+    os.makedirs(out_dir, exist_ok=True)
+
+    combined = None
+    writer = None
+    sites_dir = out_dir
+    if output == OUTPUT_COMBINED:
+        # Un GPKG temporaire par site, fusionné au fil des fins de travaux
+        layer_name = f"iNat_{_safe_name(batch_name)}_sites"
+        combined = (os.path.join(out_dir, f"{layer_name}.gpkg"), layer_name)
+        sites_dir = os.path.join(out_dir, f".{layer_name}_tmp")
+        os.makedirs(sites_dir, exist_ok=True)
+        writer = yd_GpkgWriter(combined[0])
+        writer.create_layer(layer_name, [SITE_ID_COLUMN] + yd_gpkg_columns(ordered_fields, photo_mode))
+        if photo_mode == "table":
+            writer.create_layer(f"{layer_name}_photos", [SITE_ID_COLUMN] + PHOTO_TABLE_COLUMNS,
+                                spatial=False)
+
+    def run_job(site):
+        job = {
+            "site_id": site["site_id"],
+            "lat": site["lat"],
+            "lon": site["lon"],
+            "radius_m": site["radius_m"],
+            "status": STATUS_OK,
+            "n_obs": 0,
+            "n_feats": 0,
+            "error": "",
+        }
+        t0 = time.monotonic()
+        if site.get("clip"):
+            layer_name = yd_area_layer_name(_safe_name(site["site_id"]))
+        else:
+            layer_name = yd_layer_name(_safe_name(site["site_id"]), site["radius_m"])
+        gpkg_path = os.path.join(sites_dir, f"{layer_name}.gpkg")
+        job.update(layer_name=layer_name, gpkg_path=gpkg_path)
+
+        def job_log(msg):
+            log(f"[{site['site_id']}] {msg}")
+
+        try:
+            if is_canceled():
+                job["status"] = STATUS_CANCELED
+            elif output == OUTPUT_SITES and os.path.exists(gpkg_path):
+                job["status"] = STATUS_SKIPPED
+                job["error"] = "GPKG déjà présent"
+            else:
+                filters = (
+                    profile.get("d1", ""), profile.get("d2", ""),
+                    profile.get("user_login", ""), profile.get("taxon_name", ""),
+                    profile.get("quality_grade", "tous"),
+                )
+                if site.get("clip"):
+                    params = yd_build_area_params(site["clip"], *filters)
+                else:
+                    params = yd_build_params(site["lat"], site["lon"], site["radius_m"], *filters)
+                result = yd_import_observations(
+                    get_observations, params, ordered_fields, photo_mode, layer_name,
+                    gpkg_path=gpkg_path, cache=cache, refresh=refresh,
+                    is_canceled=is_canceled, log=job_log, clip=site.get("clip"),
+                    aggregates=aggregates if output == OUTPUT_SITES else None,
+                )
+                job.update(n_obs=result["n_obs"], n_feats=result["n_feats"])
+                if result["canceled"]:
+                    job["status"] = STATUS_CANCELED
+                elif result["error"] != QgsVectorFileWriter.NoError:
+                    job["status"] = STATUS_ERROR
+                    job["error"] = f"GPKG (code {result['error']})"
+                elif harvest and output == OUTPUT_SITES:
+                    photos = yd_harvest_photos(gpkg_path, layer_name, photo_mode,
+                                               is_canceled=is_canceled, log=job_log)
+                    if photos["n_errors"]:
+                        job["error"] = f"{photos['n_errors']} photos non téléchargées"
+        except Exception as e:
+            job["status"] = STATUS_ERROR
+            job["error"] = str(e)
+        job["duration_s"] = round(time.monotonic() - t0, 2)
+        return job
+
+    jobs = []
+    n_sites = len(sites)
+    log(f"🗂️ Lot {batch_name} : {n_sites} sites, {workers} travaux simultanés")
+    t_batch = time.monotonic()
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(run_job, site) for site in sites]
+            for future in as_completed(futures):
+                job = future.result()
+                if writer is not None and job["status"] == STATUS_OK:
+                    # Fusion SQL dans la couche combinée (fil du lot uniquement)
+                    extra = {SITE_ID_COLUMN[0]: job["site_id"]}
+                    writer.append_from(combined[1], job["gpkg_path"], job["layer_name"], extra)
+                    if photo_mode == "table":
+                        writer.append_from(f"{combined[1]}_photos", job["gpkg_path"],
+                                           f"{job['layer_name']}_photos", extra)
+                if writer is not None and os.path.exists(job["gpkg_path"]):
+                    # GPKG temporaire (complet ou partiel) : plus de reprise possible
+                    os.remove(job["gpkg_path"])
+                    yd_journal_clear(job["gpkg_path"])
+                jobs.append(job)
+                icon = "✅" if job["status"] == STATUS_OK else "⚠️"
+                log(f"{icon} [{len(jobs)}/{n_sites}] {job['site_id']} : {job['status']}, "
+                    f"{job['n_feats']} obs en {job['duration_s']:.1f}s"
+                    f"{' — ' + job['error'] if job['error'] else ''}")
+                if progress is not None and n_sites:
+                    progress(100.0 * len(jobs) / n_sites)
+    finally:
+        if writer is not None:
+            if is_canceled():
+                writer.abort()
+                combined = None
+            else:
+                if aggregates:
+                    levels = yd_write_aggregates(writer, combined[1], aggregates, log=log)
+                writer.close()
+                if aggregates:
+                    yd_write_aggregate_info(combined[0], combined[1], levels)
+            shutil.rmtree(sites_dir, ignore_errors=True)
+
+    if combined is not None and harvest and not is_canceled():
+        # Une récolte pour toute la couche combinée (cache du dossier de sortie)
+        yd_harvest_photos(combined[0], combined[1], photo_mode, is_canceled=is_canceled,
+                          log=log)
+
+    stamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    report_path = os.path.join(out_dir, f"iNat_{_safe_name(batch_name)}_rapport_{stamp}.csv")
+    jobs.sort(key=lambda j: j["site_id"])
+    _write_report(report_path, jobs)
+
+    counts = {}
+    for job in jobs:
+        counts[job["status"]] = counts.get(job["status"], 0) + 1
+    log(f"🏁 Lot {batch_name} terminé en {time.monotonic() - t_batch:.1f}s : "
+        + ", ".join(f"{n} {status}" for status, n in sorted(counts.items())))
+    log(f"📄 Rapport : {report_path}")
+
+    return {
+        "jobs": jobs,
+        "report_path": report_path,
+        "combined": combined,
+        "canceled": is_canceled(),
+    }
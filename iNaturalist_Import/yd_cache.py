@@ -0,0 +1,169 @@
+# ==============================================================
+# Plugin QGIS : iNaturalist Import
+# Module     : yd_cache
+# Version    : 1.0.0
+# Rôle       : Cache disque (SQLite) des réponses de l'API iNaturalist
+# QGIS       : 3.40 (Bratislava)
+# ==============================================================
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from datetime import date, datetime
+
+# PARAMÈTRES
+CACHE_DIR = os.path.join(os.path.expanduser("~"), ".yd_iNaturalist_Import")
+CACHE_FILE = "yd_cache_api.sqlite"
+CACHE_TTL_S = 24 * 3600             # durée de validité d'une réponse
+CACHE_MAX_BYTES = 500 * 1024 * 1024  # taille max (réponses compressées)
+
+
+def _json_default(value):
+    # pyinaturalist convertit les dates : on les restitue en ISO 8601
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return str(value)
+
+
+def yd_cache_key(endpoint, params):
+    """Clé stable : endpoint + paramètres normalisés (ordre, types, vides)."""
+    norm = {
+        str(k): v for k, v in params.items()
+        if v is not None and v != ""
+    }
+    raw = json.dumps([endpoint, norm], sort_keys=True, default=_json_default)
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+class yd_ResponseCache:
+    """
+    Cache clé → réponse JSON avec TTL et éviction LRU bornée en taille.
+    Une seule connexion protégée par un verrou : utilisable depuis les
+    workers de yd_fetch.
+    """
+
+    def __init__(self, path, ttl_s=CACHE_TTL_S, max_bytes=CACHE_MAX_BYTES):
+        self.path = path
+        self.ttl_s = ttl_s
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            " key TEXT PRIMARY KEY,"
+            " created REAL NOT NULL,"
+            " last_access REAL NOT NULL,"
+            " size INTEGER NOT NULL,"
+            " value BLOB NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS responses_lru ON responses(last_access)"
+        )
+        self._conn.commit()
+        self._size = self._conn.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM responses"
+        ).fetchone()[0]
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT created, value FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            created, value = row
+            if self.ttl_s is not None and now - created > self.ttl_s:
+                self._delete(key)
+                self._conn.commit()
+                self.misses += 1
+                return None
+            self._conn.execute(
+                "UPDATE responses SET last_access = ? WHERE key = ?", (now, key)
+            )
+            self._conn.commit()
+            self.hits += 1
+        return json.loads(zlib.decompress(value).decode("utf-8"))
+
+    def put(self, key, response):
+        value = zlib.compress(
+            json.dumps(response, default=_json_default).encode("utf-8")
+        )
+        now = time.time()
+        with self._lock:
+            self._delete(key)
+            self._conn.execute(
+                "INSERT INTO responses (key, created, last_access, size, value)"
+                " VALUES (?, ?, ?, ?, ?)",
+                (key, now, now, len(value), value),
+            )
+            self._size += len(value)
+            if self._size > self.max_bytes:
+                self._evict()
+            self._conn.commit()
+
+    def _delete(self, key):
+        row = self._conn.execute(
+            "SELECT size FROM responses WHERE key = ?", (key,)
+        ).fetchone()
+        if row:
+            self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+            self._size -= row[0]
+
+    def _evict(self):
+        # LRU : on libère jusqu'à 90 % de la taille max
+        target = int(self.max_bytes * 0.9)
+        rows = self._conn.execute(
+            "SELECT key, size FROM responses ORDER BY last_access"
+        )
+        evicted = []
+        for key, size in rows:
+            if self._size <= target:
+                break
+            evicted.append(key)
+            self._size -= size
+        self._conn.executemany(
+            "DELETE FROM responses WHERE key = ?", [(k,) for k in evicted]
+        )
+
+    def reset_stats(self):
+        self.hits = 0
+        self.misses = 0
+
+    def snapshot(self):
+        """Compteurs à un instant donné, pour stats(since=...) d'un seul run."""
+        with self._lock:
+            return (self.hits, self.misses)
+
+    def stats(self, since=None):
+        hits, misses = self.snapshot()
+        if since is not None:
+            hits, misses = hits - since[0], misses - since[1]
+        total = hits + misses
+        rate = (100.0 * hits / total) if total else 0.0
+        return f"cache API : {hits} hits, {misses} misses ({rate:.0f} %)"
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+_yd_cache = None
+
+
+def yd_cache_partage():
+    """Cache unique du process, ouvert à la première utilisation."""
+    global _yd_cache
+    if _yd_cache is None:
+        _yd_cache = yd_ResponseCache(os.path.join(CACHE_DIR, CACHE_FILE))
+    return _yd_cache
@@ -0,0 +1,344 @@
+# ==============================================================
+# Plugin QGIS : iNaturalist Import
+# Module     : yd_cli
+# Version    : 1.0.0
+# Rôle       : Point d'entrée en ligne de commande (sans interface QGIS)
+#              pour l'import (ETAPES 7/8) et la taxonomie (ETAPE 9)
+# QGIS       : 3.40 (Bratislava) — qgis.core uniquement
+#
+# Exemples (depuis le dossier parent du plugin, avec le Python de QGIS) :
+#   python -m iNaturalist_Import.yd_cli import --lat 45.56 --lon 5.92 \
+#          --radius-m 2000 --out /data/inat --quality research --taxonomy
+#   python -m iNaturalist_Import.yd_cli import --lat 45.56 --lon 5.92 \
+#          --radius-m 20000 --out /data/inat --aggregates hex
+#   python -m iNaturalist_Import.yd_cli import --wkt @reserve.wkt --name reserve --out /data/inat
+#   python -m iNaturalist_Import.yd_cli taxonomy --gpkg x.gpkg --layer iNat_...
+#   python -m iNaturalist_Import.yd_cli taxa-import --dwca inaturalist-taxonomy.dwca.zip
+#   python -m iNaturalist_Import.yd_cli taxonomy --offline --gpkg x.gpkg --layer iNat_...
+#   python -m iNaturalist_Import.yd_cli photos --gpkg x.gpkg --layer iNat_...
+#   python -m iNaturalist_Import.yd_cli job jobs.json
+#   python -m iNaturalist_Import.yd_cli resume
+#   python -m iNaturalist_Import.yd_cli batch --sites sites.gpkg --radius-field rayon \
+#          --id-field nom --out /data/inat --combined
+#
+# Fichier de travaux (JSON) : un objet ou une liste d'objets reprenant les
+# options de la commande import (lat, lon, radius_m ou wkt, out, name, d1, d2,
+# user_login, taxon_name, quality_grade, fields, photo_mode, photos, aggregates,
+# taxonomy, taxonomy_offline, no_cache, refresh_cache).
+# ==============================================================
+
+import argparse
+import json
+import os
+import sys
+from datetime import datetime
+
+from qgis.core import QgsApplication, QgsVectorLayer
+
+from .yd_aggregate import AGG_SHAPES
+from .yd_api import yd_get_observations_v2
+from .yd_batch import (
+    BATCH_WORKERS, OUTPUT_COMBINED, OUTPUT_SITES, STATUS_OK, yd_run_batch,
+    yd_sites_from_layer
+)
+from .yd_cache import yd_cache_partage
+from .yd_engine import (
+    yd_build_params, yd_build_area_params, yd_ordered_fields, yd_layer_name,
+    yd_area_layer_name, yd_import_observations, yd_resume_import
+)
+from .yd_gpkg import yd_read_sync_info
+from .yd_journal import yd_journal_last
+from .yd_metrics import PROFILE_ENV
+from .yd_observation import BASE_ORDER
+from .yd_photos import PHOTO_MAX_BYTES, PHOTO_WORKERS, yd_harvest_photos
+from .yd_taxo_store import DWCA_LANGUAGE, yd_taxo_store_partage
+from .yd_taxonomy import yd_enrich_layer
+
+PHOTO_MODES = ("none", "one", "all", "table")
+QUALITY_CHOICES = ("tous", "research", "needs_id", "casual")
+
+
+def log(msg):
+    ts = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    print(f"[{ts}] {msg}", flush=True)
+
+
+def yd_run_import_job(job):
+    """Un import complet (cercle ou zone → GPKG), décrit par un dict d'options."""
+    out_dir = job.get("out") or "."
+    os.makedirs(out_dir, exist_ok=True)
+    wkt = job.get("wkt") or None
+    if wkt and wkt.startswith("@"):
+        with open(wkt[1:], encoding="utf-8") as f:
+            wkt = f.read().strip()
+    if wkt:
+        layer_name = yd_area_layer_name(job.get("name") or "zone")
+    else:
+        layer_name = yd_layer_name(job.get("name") or "cercle", job["radius_m"])
+    gpkg_path = os.path.join(out_dir, f"{layer_name.replace(' ', '_')}.gpkg")
+    if os.path.exists(gpkg_path):
+        log(f"❌ GPKG déjà présent, import ignoré : {gpkg_path}")
+        return False
+
+    filters = (
+        job.get("d1", ""), job.get("d2", ""), job.get("user_login", ""),
+        job.get("taxon_name", ""), job.get("quality_grade", "tous"),
+    )
+    if wkt:
+        params = yd_build_area_params(wkt, *filters)
+    else:
+        params = yd_build_params(job["lat"], job["lon"], job["radius_m"], *filters)
+    fields = job.get("fields") or BASE_ORDER
+    if isinstance(fields, str):
+        fields = [f.strip() for f in fields.split(",") if f.strip()]
+    ordered_fields = yd_ordered_fields(fields)
+    photo_mode = job.get("photo_mode", "all")
+
+    cache = None if job.get("no_cache") else yd_cache_partage()
+    log(f"▶️ Import {layer_name} → {gpkg_path}")
+    result = yd_import_observations(
+        yd_get_observations_v2, params, ordered_fields, photo_mode, layer_name,
+        gpkg_path=gpkg_path, cache=cache, refresh=bool(job.get("refresh_cache")),
+        log=log, clip=wkt, aggregates=job.get("aggregates") or None,
+    )
+    if result["canceled"] or result["error"]:
+        return False
+
+    if job.get("photos") and photo_mode != "none":
+        photos = yd_harvest_photos(gpkg_path, layer_name, photo_mode, log=log)
+        if photos["canceled"]:
+            return False
+
+    if job.get("taxonomy_offline"):
+        return yd_enrich_layer(None, gpkg_path, layer_name, log=log,
+                               store=yd_taxo_store_partage(), offline=True)
+    if job.get("taxonomy"):
+        from pyinaturalist.node_api import get_taxa_by_id
+        return yd_enrich_layer(
+            get_taxa_by_id, gpkg_path, layer_name, log=log,
+            store=None if job.get("no_cache") else yd_taxo_store_partage(),
+            refresh=bool(job.get("refresh_cache")),
+        )
+    return True
+
+
+def yd_run_resume():
+    """Reprise du dernier import interrompu (journal de yd_journal)."""
+    journal = yd_journal_last()
+    if journal is None:
+        log("ℹ️ Aucun import interrompu à reprendre")
+        return True
+    log(f"🔁 Reprise {journal['layer_name']} → {journal['gpkg_path']}")
+    result = yd_resume_import(
+        yd_get_observations_v2, journal, cache=yd_cache_partage(), log=log
+    )
+    return not (result["canceled"] or result["error"])
+
+
+def yd_run_photos(args):
+    """Récolte des photos d'une couche GPKG existante (mode photo de la synchro)."""
+    sync = yd_read_sync_info(args.gpkg, args.layer)
+    if sync is None:
+        log("❌ Couche sans informations de synchro (import antérieur) : mode photo inconnu")
+        return False
+    result = yd_harvest_photos(
+        args.gpkg, args.layer, sync["photo_mode"], workers=args.workers,
+        max_bytes=int(args.max_mb * 1024 * 1024), log=log,
+    )
+    return result["n_errors"] == 0 and not result["canceled"]
+
+
+def yd_run_batch_sites(args):
+    """Import par lot : un site par entité de la couche --sites."""
+    uri = args.sites if not args.sites_layer else f"{args.sites}|layername={args.sites_layer}"
+    layer = QgsVectorLayer(uri, "sites", "ogr")
+    if not layer.isValid():
+        log(f"❌ Couche de sites invalide : {uri}")
+        return False
+    sites = yd_sites_from_layer(
+        layer, radius_field=args.radius_field, default_radius_m=args.radius_m,
+        id_field=args.id_field, log=log,
+    )
+    if not sites:
+        log("❌ Aucun site utilisable dans la couche")
+        return False
+
+    fields = [f.strip() for f in args.fields.split(",") if f.strip()]
+    profile = {
+        "d1": args.d1,
+        "d2": args.d2,
+        "user_login": args.user_login,
+        "taxon_name": args.taxon_name,
+        "quality_grade": args.quality_grade,
+        "ordered_fields": yd_ordered_fields(fields),
+        "photo_mode": args.photo_mode,
+        "photos": args.photos,
+        "aggregates": args.aggregates,
+    }
+    batch_name = args.name or os.path.splitext(os.path.basename(args.sites))[0]
+    result = yd_run_batch(
+        yd_get_observations_v2, sites, profile, args.out, batch_name=batch_name,
+        output=OUTPUT_COMBINED if args.combined else OUTPUT_SITES,
+        cache=None if args.no_cache else yd_cache_partage(),
+        refresh=args.refresh_cache, workers=args.workers, log=log,
+    )
+    return all(job["status"] == STATUS_OK for job in result["jobs"])
+
+
+def _add_filter_args(parser):
+    parser.add_argument("--d1", default="", help="date début incluse YYYY-MM-DD")
+    parser.add_argument("--d2", default="", help="date fin exclue YYYY-MM-DD")
+    parser.add_argument("--user-login", default="")
+    parser.add_argument("--taxon-name", default="")
+    parser.add_argument("--quality-grade", default="tous", choices=QUALITY_CHOICES)
+    parser.add_argument("--fields", default=",".join(BASE_ORDER),
+                        help="champs non-photo séparés par des virgules")
+    parser.add_argument("--photo-mode", default="all", choices=PHOTO_MODES)
+    parser.add_argument("--photos", action="store_true",
+                        help="télécharger les photos (cache iNat_photos, consultation hors ligne)")
+    parser.add_argument("--aggregates", default=None, choices=AGG_SHAPES,
+                        help="couches de synthèse par mailles (hexagones ou grille)")
+    parser.add_argument("--no-cache", action="store_true")
+    parser.add_argument("--refresh-cache", action="store_true")
+
+
+def _job_from_args(args):
+    return {
+        "lat": args.lat,
+        "lon": args.lon,
+        "radius_m": args.radius_m,
+        "wkt": args.wkt,
+        "out": args.out,
+        "name": args.name,
+        "d1": args.d1,
+        "d2": args.d2,
+        "user_login": args.user_login,
+        "taxon_name": args.taxon_name,
+        "quality_grade": args.quality_grade,
+        "fields": args.fields,
+        "photo_mode": args.photo_mode,
+        "photos": args.photos,
+        "aggregates": args.aggregates,
+        "taxonomy": args.taxonomy,
+        "no_cache": args.no_cache,
+        "refresh_cache": args.refresh_cache,
+    }
+
+
+def _parser():
+    parser = argparse.ArgumentParser(
+        prog="yd_cli", description="iNaturalist Import sans interface QGIS"
+    )
+    parser.add_argument("--profile", action="store_true",
+                        help="profil cProfile + tracemalloc à côté du GPKG (lent)")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_imp = sub.add_parser("import", help="importer un cercle dans un GPKG")
+    p_imp.add_argument("--lat", type=float)
+    p_imp.add_argument("--lon", type=float)
+    p_imp.add_argument("--radius-m", type=float)
+    p_imp.add_argument("--wkt", default="",
+                       help="zone : polygone WKT EPSG:4326 (ou @fichier) au lieu du cercle")
+    p_imp.add_argument("--out", default=".", help="dossier de sortie")
+    p_imp.add_argument("--name", default="",
+                       help="nom du cercle (iNat_<name>_Ray=...) ou de la zone (iNat_<name>_Zone)")
+    _add_filter_args(p_imp)
+    p_imp.add_argument("--taxonomy", action="store_true", help="enchaîner l'ETAPE 9")
+
+    p_bat = sub.add_parser("batch", help="importer chaque site d'une couche (points ou polygones)")
+    p_bat.add_argument("--sites", required=True, help="couche des sites (GPKG, SHP...)")
+    p_bat.add_argument("--sites-layer", default="", help="nom de la couche dans le GPKG")
+    p_bat.add_argument("--radius-field", default=None, help="champ rayon (m) des points")
+    p_bat.add_argument("--radius-m", type=float, default=None, help="rayon fixe / par défaut (m)")
+    p_bat.add_argument("--id-field", default=None, help="champ identifiant du site (site_id)")
+    p_bat.add_argument("--out", default=".", help="dossier de sortie")
+    p_bat.add_argument("--name", default="", help="nom du lot (défaut : nom du fichier des sites)")
+    p_bat.add_argument("--combined", action="store_true",
+                       help="une couche combinée avec site_id au lieu d'un GPKG par site")
+    p_bat.add_argument("--workers", type=int, default=BATCH_WORKERS)
+    _add_filter_args(p_bat)
+
+    p_tax = sub.add_parser("taxonomy", help="ajouter la taxonomie à une couche GPKG")
+    p_tax.add_argument("--gpkg", required=True)
+    p_tax.add_argument("--layer", required=True)
+    p_tax.add_argument("--no-cache", action="store_true",
+                       help="sans le référentiel taxonomique persistant")
+    p_tax.add_argument("--refresh-cache", action="store_true",
+                       help="redemander tous les taxons à l'API (référentiel mis à jour)")
+    p_tax.add_argument("--offline", action="store_true",
+                       help="sans réseau, depuis la taxonomie DwC-A importée (taxa-import)")
+
+    p_dwc = sub.add_parser("taxa-import",
+                           help="importer l'archive taxonomique iNaturalist (DwC-A) hors ligne")
+    p_dwc.add_argument("--dwca", required=True, help="inaturalist-taxonomy.dwca.zip")
+    p_dwc.add_argument("--language", default=DWCA_LANGUAGE,
+                       help="noms vernaculaires (VernacularNames-<language>.csv)")
+
+    p_pho = sub.add_parser("photos", help="télécharger les photos d'une couche GPKG")
+    p_pho.add_argument("--gpkg", required=True)
+    p_pho.add_argument("--layer", required=True)
+    p_pho.add_argument("--workers", type=int, default=PHOTO_WORKERS)
+    p_pho.add_argument("--max-mb", type=float, default=PHOTO_MAX_BYTES / 1048576.0,
+                       help="taille max du cache de photos (Mo)")
+
+    p_job = sub.add_parser("job", help="exécuter un fichier de travaux JSON")
+    p_job.add_argument("job_file")
+
+    sub.add_parser("resume", help="reprendre le dernier import interrompu")
+
+    return parser
+
+
+def main(argv=None):
+    parser = _parser()
+    args = parser.parse_args(argv)
+    if args.command == "import" and not args.wkt and None in (args.lat, args.lon, args.radius_m):
+        parser.error("import : --lat, --lon et --radius-m (ou --wkt) sont requis")
+    if args.profile:
+        os.environ[PROFILE_ENV] = "1"
+
+    # QGIS sans interface (QGIS_PREFIX_PATH doit pointer sur l'installation)
+    qgs = QgsApplication([], False)
+    qgs.initQgis()
+    try:
+        if args.command == "import":
+            ok = yd_run_import_job(_job_from_args(args))
+        elif args.command == "taxonomy" and args.offline:
+            ok = yd_enrich_layer(None, args.gpkg, args.layer, log=log,
+                                 store=yd_taxo_store_partage(), offline=True)
+        elif args.command == "taxonomy":
+            from pyinaturalist.node_api import get_taxa_by_id
+            ok = yd_enrich_layer(
+                get_taxa_by_id, args.gpkg, args.layer, log=log,
+                store=None if args.no_cache else yd_taxo_store_partage(),
+                refresh=args.refresh_cache,
+            )
+        elif args.command == "taxa-import":
+            ok = yd_taxo_store_partage().import_dwca(
+                args.dwca, language=args.language, log=log) is not None
+        elif args.command == "photos":
+            ok = yd_run_photos(args)
+        elif args.command == "resume":
+            ok = yd_run_resume()
+        elif args.command == "batch":
+            ok = yd_run_batch_sites(args)
+        else:
+            with open(args.job_file, encoding="utf-8") as f:
+                jobs = json.load(f)
+            if isinstance(jobs, dict):
+                jobs = [jobs]
+            ok = True
+            for i, job in enumerate(jobs, start=1):
+                log(f"=== Travail {i}/{len(jobs)} ===")
+                try:
+                    ok = yd_run_import_job(job) and ok
+                except Exception as e:
+                    log(f"❌ Travail {i} en erreur : {e}")
+                    ok = False
+    finally:
+        qgs.exitQgis()
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
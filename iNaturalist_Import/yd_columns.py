@@ -0,0 +1,212 @@
+# ==============================================================
+# Plugin QGIS : iNaturalist Import
+# Module     : yd_columns
+# Version    : 1.0.0
+# Rôle       : Plan de colonnes compilé une fois pour les champs choisis
+#              (liste d'extracteurs figée, sans chaîne if/elif), URL photo et dates
+#              mémoïsées, projection fields des réponses de l'API v2
+#              (sans dépendance QGIS, cf. benchmarks/)
+# QGIS       : 3.40 (Bratislava)
+# ==============================================================
+
+from datetime import datetime
+from functools import lru_cache
+
+# PARAMÈTRES
+URL_CACHE_SIZE = 65536    # URL photo réécrites gardées en mémoire
+DATE_CACHE_SIZE = 65536   # dates (chaînes ISO et valeurs construites)
+
+
+@lru_cache(maxsize=URL_CACHE_SIZE)
+def yd_large_photo_url(url):
+    return url.replace('square.jpg', 'large.jpg') \
+              .replace('square.jpeg', 'large.jpeg') \
+              .replace('square.png', 'large.png')
+
+
+@lru_cache(maxsize=DATE_CACHE_SIZE)
+def _iso_parts(text):
+    # Réponses en cache : dates en chaînes ISO (heure locale de l'observation)
+    text = text.strip()
+    if text.endswith('Z'):
+        text = text[:-1] + '+00:00'
+    try:
+        d = datetime.fromisoformat(text)
+    except ValueError:
+        return None
+    return (d.year, d.month, d.day, d.hour, d.minute, d.second)
+
+
+def yd_date_parts(value):
+    """(année, mois, jour, h, min, s) d'une date iNat (datetime ou ISO), ou None."""
+    if not value:
+        return None
+    if isinstance(value, str):
+        return _iso_parts(value)
+    return (value.year, value.month, value.day,
+            getattr(value, 'hour', 0), getattr(value, 'minute', 0),
+            getattr(value, 'second', 0))
+
+
+def _url_photo(p):
+    return yd_large_photo_url(p['url']) if p and p.get('url') else None
+
+
+def _url_taxon(taxon):
+    tid = taxon.get('id')
+    return f"https://www.inaturalist.org/taxa/{tid}" if tid else None
+
+
+# Extracteurs : une fonction (obs, taxon, user, coords) → valeur par colonne
+def _from_obs(key):
+    return lambda obs, taxon, user, coords: obs.get(key)
+
+
+def _from_taxon(key):
+    return lambda obs, taxon, user, coords: taxon.get(key)
+
+
+def _from_user(key):
+    return lambda obs, taxon, user, coords: user.get(key)
+
+
+def _from_coords(i):
+    return lambda obs, taxon, user, coords: coords[i]
+
+
+def _url_obs(obs, taxon, user, coords):
+    return f"https://www.inaturalist.org/observations/{obs.get('id')}"
+
+
+# date_obs dépend de make_datetime / now : extracteur construit par yd_compile_columns
+COLUMN_EXTRACTORS = {
+    "inat_id": _from_obs('id'),
+    "date_obs": None,
+    "scientific_name": _from_taxon('name'),
+    "vernacular_name_FR": _from_taxon('preferred_common_name'),
+    "latitude": _from_coords(1),
+    "longitude": _from_coords(0),
+    "place_guess": _from_obs('place_guess'),
+    "taxon_id": _from_taxon('id'),
+    "taxon_rank": _from_taxon('rank'),
+    "url_obs": _url_obs,
+    "url_taxon": lambda obs, taxon, user, coords: _url_taxon(taxon),
+    "observateur_id": _from_user('login'),
+    "observateur_name": _from_user('name'),
+    "quality_grade": _from_obs('quality_grade'),
+    "precision": _from_obs('positional_accuracy'),
+}
+
+
+def _photos_one(obs, attrs, max_photos):
+    photos = obs.get('photos')
+    attrs.append(_url_photo(photos[0]) if photos else None)
+
+
+def _photos_all(obs, attrs, max_photos):
+    photos = obs.get('photos') or []
+    attrs.append(len(photos))
+    attrs.extend([_url_photo(p) for p in photos])
+    attrs.extend([None] * (max_photos - len(photos)))
+
+
+def _photos_table(obs, attrs, max_photos):
+    attrs.append(len(obs.get('photos') or []))
+
+
+PHOTO_COLUMNS = {"one": _photos_one, "all": _photos_all, "table": _photos_table}
+
+
+def yd_compile_columns(ordered_fields, photo_mode, make_datetime, now):
+    """
+    Compile les colonnes de la couche (ordered_fields puis champs photo) en
+    une fonction row(obs, coords, max_photos) → liste d'attributs : la liste
+    des extracteurs est figée une fois, sans test de nom de champ par
+    observation.
+
+    make_datetime(a, m, j, h, mi, s) construit la valeur date_obs (mémoïsée
+    par composantes) ; now() sert de repli pour les dates absentes.
+    """
+    make_date = lru_cache(maxsize=DATE_CACHE_SIZE)(make_datetime)
+
+    def date_obs(obs, taxon, user, coords):
+        parts = yd_date_parts(obs.get('time_observed_at') or obs.get('observed_on'))
+        return make_date(*parts) if parts else now()
+
+    extractors = tuple(
+        date_obs if champ == "date_obs" else COLUMN_EXTRACTORS[champ]
+        for champ in ordered_fields if champ in COLUMN_EXTRACTORS
+    )
+    photos = PHOTO_COLUMNS.get(photo_mode)
+
+    def row(obs, coords, max_photos=0):
+        taxon = obs.get('taxon') or {}
+        user = obs.get('user') or {}
+        attrs = [extract(obs, taxon, user, coords) for extract in extractors]
+        if photos is not None:
+            photos(obs, attrs, max_photos)
+        return attrs
+
+    return row
+
+
+# ---------- Projection des réponses de l'API v2 (paramètre fields) ----------
+
+# Attributs API nécessaires à chaque champ de sortie (chemins pointés)
+API_FIELDS = {
+    "inat_id": ["id"],
+    "date_obs": ["time_observed_at", "observed_on"],
+    "scientific_name": ["taxon.name"],
+    "vernacular_name_FR": ["taxon.preferred_common_name"],
+    "latitude": ["geojson"],
+    "longitude": ["geojson"],
+    "place_guess": ["place_guess"],
+    "taxon_id": ["taxon.id"],
+    "taxon_rank": ["taxon.rank"],
+    "url_obs": ["id"],
+    "url_taxon": ["taxon.id"],
+    "observateur_id": ["user.login"],
+    "observateur_name": ["user.name"],
+    "quality_grade": ["quality_grade"],
+    "precision": ["positional_accuracy"],
+}
+PHOTO_API_FIELDS = {
+    "one": ["photos.url"],
+    "all": ["photos.url"],
+    "table": ["photos.url", "photos.license_code"],
+}
+# Toujours demandés : clé de la couche et géométrie
+API_FIELDS_BASE = ["id", "geojson"]
+# Balayage des seuls id (équivalent v2 de only_id)
+API_FIELDS_ID = "(id:!t)"
+# Idem avec la géométrie (zone découpée au polygone)
+API_FIELDS_ID_GEOM = "(geojson:!t,id:!t)"
+
+
+def _rison(tree):
+    # {"id": {}, "taxon": {"name": {}}} → (id:!t,taxon:(name:!t))
+    parts = []
+    for key in sorted(tree):
+        sub = tree[key]
+        parts.append(f"{key}:{_rison(sub) if sub else '!t'}")
+    return "(" + ",".join(parts) + ")"
+
+
+def yd_api_fields(ordered_fields, photo_mode):
+    """Valeur du paramètre fields (RISON) pour les champs et le mode photo."""
+    paths = list(API_FIELDS_BASE)
+    for champ in ordered_fields:
+        paths.extend(API_FIELDS.get(champ, []))
+    paths.extend(PHOTO_API_FIELDS.get(photo_mode, []))
+
+    tree = {}
+    for path in paths:
+        node = tree
+        for key in path.split("."):
+            node = node.setdefault(key, {})
+    return _rison(tree)
+
+
+# Projection commune à toutes les sélections de champs et modes photo :
+# demandée par défaut (yd_get_observations_v2), hors clé du cache
+API_FIELDS_ALL = yd_api_fields(API_FIELDS, "table")
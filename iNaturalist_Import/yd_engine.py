@@ -0,0 +1,547 @@
+# ==============================================================
+# Plugin QGIS : iNaturalist Import
+# Module     : yd_engine
+# Version    : 1.0.0
+# Rôle       : Moteur d'import indépendant de l'interface (ETAPES 7/8) :
+#              paramètres → récupération → entités → GPKG
+#              Utilisé par Script 1 (QgsTask) et par yd_cli (sans GUI)
+# QGIS       : 3.40 (Bratislava) — qgis.core uniquement
+# ==============================================================
+
+import os
+import time
+
+from qgis.core import (
+    QgsFeature, QgsGeometry, QgsPoint, QgsPointXY, QgsRectangle, QgsVectorLayer,
+    QgsVectorFileWriter, QgsFields, QgsField
+)
+from qgis.PyQt.QtCore import QVariant
+
+from .yd_aggregate import AGG_FIELDS, yd_write_aggregate_info, yd_write_aggregates
+from .yd_columns import yd_compile_columns
+from .yd_fetch import yd_fetch_pages
+from .yd_gpkg import (
+    yd_GpkgWriter, yd_gpkg_datetime, yd_gpkg_now, yd_sync_timestamp, yd_write_sync_info
+)
+from .yd_journal import yd_journal_write, yd_journal_clear
+from .yd_metrics import YD_NO_METRICS, yd_Metrics, yd_metrics_path, yd_peak_rss_mb
+from .yd_observation import (
+    CHAMP_DEFS, BASE_ORDER, yd_obs_coords, yd_column_plan, yd_photo_rows
+)
+from .yd_ratelimit import yd_LIMITEUR
+from .yd_tiling import TILE_MAX_RESULTS, yd_count, yd_fetch_tiled
+
+# PARAMÈTRES
+# Nombre d'entités accumulées avant chaque ajout dans la couche de sortie
+CHUNK_SIZE = 1000
+QUALITY_GRADES = ("research", "needs_id", "casual")
+# Découpage en tuiles : "auto" = seulement si le cercle dépasse TILE_MAX_RESULTS
+TILING_AUTO = "auto"
+
+# Types des colonnes GPKG (écriture directe, cf. yd_GpkgWriter) ; les id
+# iNaturalist (inat_id, taxon_id) sont des entiers 64 bits (INTEGER)
+SQL_TYPES = {
+    QVariant.Int: "MEDIUMINT",
+    QVariant.LongLong: "INTEGER",
+    QVariant.Double: "REAL",
+    QVariant.DateTime: "DATETIME",
+    QVariant.String: "TEXT",
+}
+PHOTO_TABLE_COLUMNS = [
+    ("inat_id", "INTEGER"),
+    ("position", "MEDIUMINT"),
+    ("url", "TEXT(250)"),
+    ("license", "TEXT(30)"),
+]
+
+
+def yd_build_params(lat, lng, rayon_m, d1="", d2="", user_login="",
+                    taxon_name="", quality_grade="tous"):
+    """Paramètres de requête /observations pour un cercle et des filtres d'entrée."""
+    params = {
+        'lat': lat,
+        'lng': lng,
+        'radius': rayon_m / 1000.0,
+    }
+    return _filter_params(params, d1, d2, user_login, taxon_name, quality_grade)
+
+
+def yd_build_area_params(wkt, d1="", d2="", user_login="", taxon_name="",
+                         quality_grade="tous"):
+    """
+    Paramètres de requête pour une zone : bbox du polygone WKT (EPSG:4326) ;
+    l'import découpe ensuite au polygone exact (clip=wkt).
+    """
+    bbox = QgsGeometry.fromWkt(wkt).boundingBox()
+    params = {
+        'swlat': bbox.yMinimum(),
+        'swlng': bbox.xMinimum(),
+        'nelat': bbox.yMaximum(),
+        'nelng': bbox.xMaximum(),
+    }
+    return _filter_params(params, d1, d2, user_login, taxon_name, quality_grade)
+
+
+def _filter_params(params, d1, d2, user_login, taxon_name, quality_grade):
+    params.update({
+        'captive': False,
+        'locale': 'fr',             # noms vernaculaires en français
+        'preferred_place_id': 6753  # ex: France
+    })
+    if (d1 or "").strip():
+        params['d1'] = d1.strip()
+    if (d2 or "").strip():
+        params['d2'] = d2.strip()
+    if (user_login or "").strip():
+        params['user_login'] = user_login.strip()
+    if (taxon_name or "").strip():
+        params['taxon_name'] = taxon_name.strip()
+    if quality_grade in QUALITY_GRADES:
+        params['quality_grade'] = quality_grade
+    return params
+
+
+def yd_ordered_fields(champs_selectionnes):
+    """Champs non-photo dans l'ordre de référence, inat_id et taxon_id forcés."""
+    champs = list(champs_selectionnes)
+    for forced in ["inat_id", "taxon_id"]:
+        if forced not in champs:
+            champs.append(forced)
+    return [c for c in BASE_ORDER if c in champs]
+
+
+def yd_layer_fields(ordered_fields, photo_mode):
+    """QgsFields de la couche : champs non-photo puis champs photo."""
+    fields = QgsFields()
+    for champ in ordered_fields:
+        var_type, length = CHAMP_DEFS[champ]
+        if length:
+            fields.append(QgsField(champ, var_type, len=length))
+        else:
+            fields.append(QgsField(champ, var_type))
+
+    if photo_mode == "one":
+        fields.append(QgsField("url_photo1", QVariant.String, len=250))
+    elif photo_mode == "all":
+        # Les colonnes url_photoN sont ajoutées au fil du flux
+        fields.append(QgsField("nb_photos", QVariant.Int))
+    elif photo_mode == "table":
+        # Schéma fixe : les URL vont dans la table fille <couche>_photos
+        fields.append(QgsField("nb_photos", QVariant.Int))
+    return fields
+
+
+def yd_gpkg_columns(ordered_fields, photo_mode):
+    """Colonnes (nom, type SQL) de la table GPKG, comme yd_layer_fields."""
+    columns = []
+    for field in yd_layer_fields(ordered_fields, photo_mode):
+        sql_type = SQL_TYPES.get(field.type(), "TEXT")
+        if sql_type == "TEXT" and field.length() > 0:
+            sql_type = f"TEXT({field.length()})"
+        columns.append((field.name(), sql_type))
+    return columns
+
+
+def yd_layer_name(circle_name, rayon_m):
+    return f"iNat_{circle_name}_Ray={int(rayon_m)}m"
+
+
+def yd_area_layer_name(area_name):
+    return f"iNat_{area_name}_Zone"
+
+
+def yd_clip_test(wkt):
+    """inside(coords) : point (lon, lat) dans le polygone WKT (géométrie préparée)."""
+    engine = QgsGeometry.createGeometryEngine(QgsGeometry.fromWkt(wkt).constGet())
+    engine.prepareGeometry()
+    return lambda coords: engine.intersects(QgsPoint(coords[0], coords[1]))
+
+
+def yd_clip_coverage(wkt):
+    """coverage(tuile) : part d'une tuile (swlat, swlng, nelat, nelng) dans le polygone."""
+    geom = QgsGeometry.fromWkt(wkt)
+    engine = QgsGeometry.createGeometryEngine(geom.constGet())
+    engine.prepareGeometry()
+
+    def coverage(tile):
+        swlat, swlng, nelat, nelng = tile
+        rect = QgsGeometry.fromRect(QgsRectangle(swlng, swlat, nelng, nelat))
+        if not engine.intersects(rect.constGet()):
+            return 0.0
+        if engine.contains(rect.constGet()):
+            return 1.0
+        return geom.intersection(rect).area() / max(rect.area(), 1e-12)
+    return coverage
+
+
+def yd_import_observations(get_observations, params, ordered_fields, photo_mode,
+                           layer_name, gpkg_path=None, cache=None, refresh=False,
+                           progress=None, is_canceled=None, tiling=TILING_AUTO, log=print,
+                           resume=None, clip=None, metrics=None, aggregates=None):
+    """
+    Import complet sans interface : pages iNat → entités → couche.
+
+    - gpkg_path renseigné : les lignes sont écrites au fil du flux dans ce
+      GPKG (couche et, en mode "table", table des photos), avec les
+      informations de synchro ; aucune couche mémoire intermédiaire.
+      Un journal (yd_journal) garde le curseur du dernier paquet validé :
+      après une erreur, le GPKG partiel est conservé et resume=journal
+      (cf. yd_resume_import) reprend l'import à ce curseur ;
+    - sinon la couche mémoire est renvoyée dans le résultat.
+    progress(pourcentage) et is_canceled() sont optionnels (QgsTask, CLI).
+    tiling : True / False / TILING_AUTO (cf. yd_tiling).
+    clip : polygone WKT (EPSG:4326) ; les observations hors polygone sont
+    écartées. Avec des params de zone (yd_build_area_params), la bbox est
+    toujours découpée en tuiles, redécoupées là où le polygone les couvre mal.
+    metrics (yd_Metrics, ex. ouvert dès le pré-scan) : mesures par étape,
+    écrites dans <gpkg>_metrics.jsonl ; créé ici si absent et GPKG demandé.
+    aggregates : "hex" / "grid" (GPKG seulement) — couches de synthèse par
+    mailles construites à la finalisation (yd_aggregate) ; les colonnes
+    AGG_FIELDS sont ajoutées aux champs si besoin.
+    """
+    is_canceled = is_canceled or (lambda: False)
+    if metrics is None and gpkg_path:
+        metrics = yd_Metrics(run={"layer_name": layer_name, "photo_mode": photo_mode})
+    if gpkg_path and metrics is not None:
+        metrics.attach(yd_metrics_path(gpkg_path))
+    run_metrics = metrics
+    metrics = metrics or YD_NO_METRICS
+    metrics.profile_begin()
+    # Cache et limiteur partagés (autres tâches en cours) : compteurs de ce run
+    # = différence avec ces instantanés
+    limiter_snap = yd_LIMITEUR.snapshot()
+    cache_snap = cache.snapshot() if cache is not None else None
+    inside = yd_clip_test(clip) if clip else None
+    area = 'swlat' in params
+    if not gpkg_path:
+        aggregates = None
+    if aggregates and resume is None:
+        ordered_fields = yd_ordered_fields(list(ordered_fields) + AGG_FIELDS)
+    photos_name = f"{layer_name}_photos"
+    fields = yd_layer_fields(ordered_fields, photo_mode)
+
+    if resume is not None:
+        tiling = resume["tiled"]
+    elif area:
+        tiling = True
+    elif tiling == TILING_AUTO:
+        tiling = yd_count(get_observations, params, cache, refresh,
+                          metrics=metrics, log=log) > TILE_MAX_RESULTS
+
+    # Début de synchro : sert de updated_since au prochain rafraîchissement
+    sync_start = resume["sync_start"] if resume is not None else yd_sync_timestamp()
+    cursor = None      # id_above de reprise (pagination par id croissant)
+    skip_ids = set()   # reprise d'un import en tuiles : id déjà écrits
+
+    writer = None
+    vl = None
+    vl_photos = None
+    max_photos = 0
+    if gpkg_path and resume is not None:
+        # Reprise : lignes postérieures au dernier point de reprise effacées
+        writer = yd_GpkgWriter(gpkg_path, resume=True)
+        if tiling:
+            skip_ids = writer.ids(layer_name, "inat_id")
+        else:
+            cursor = resume.get("cursor")
+            writer.delete_above(layer_name, "inat_id", cursor or 0)
+            if photo_mode == "table":
+                writer.delete_above(photos_name, "inat_id", cursor or 0)
+        max_photos = sum(1 for c in writer.columns(layer_name) if c.startswith("url_photo"))
+        log(f"🔁 Reprise de {layer_name} après inat_id={cursor} "
+            f"({resume.get('n_obs', 0)} observations déjà traitées)")
+    elif gpkg_path:
+        # Écriture directe : tables créées d'emblée, lignes insérées par paquets
+        writer = yd_GpkgWriter(gpkg_path)
+        writer.create_layer(layer_name, yd_gpkg_columns(ordered_fields, photo_mode))
+        if photo_mode == "table":
+            writer.create_layer(photos_name, PHOTO_TABLE_COLUMNS, spatial=False)
+
+    journal = None
+    if writer is not None:
+        journal = resume or {
+            "gpkg_path": gpkg_path,
+            "layer_name": layer_name,
+            "params": params,
+            "ordered_fields": ordered_fields,
+            "photo_mode": photo_mode,
+            "tiled": bool(tiling),
+            "sync_start": sync_start,
+            "cursor": None,
+            "n_obs": 0,
+            "clip": clip,
+            "aggregates": aggregates,
+        }
+        yd_journal_write(journal)
+        build_row = yd_compile_columns(
+            ordered_fields, photo_mode, yd_gpkg_datetime, yd_gpkg_now
+        )
+    else:
+        vl = QgsVectorLayer("Point?crs=EPSG:4326", layer_name, "memory")
+        pr = vl.dataProvider()
+        pr.addAttributes(fields)
+        vl.updateFields()
+
+        # Table fille des photos (mode "table") : non spatiale, liée par inat_id
+        if photo_mode == "table":
+            vl_photos = QgsVectorLayer("None", photos_name, "memory")
+            pr_photos = vl_photos.dataProvider()
+            pr_photos.addAttributes([
+                QgsField("inat_id", QVariant.LongLong),
+                QgsField("position", QVariant.Int),
+                QgsField("url", QVariant.String, len=250),
+                QgsField("license", QVariant.String, len=30),
+            ])
+            vl_photos.updateFields()
+            photo_fields = vl_photos.fields()
+        build_row = yd_column_plan(ordered_fields, photo_mode)
+    photo_rows = []
+
+    # ---------- FEATURES (flux : page → entités → ajout par paquets) ----------
+
+    def ensure_photo_columns(nb):
+        # Élargit la couche si une observation a plus de photos que les précédentes
+        nonlocal fields, max_photos
+        if nb <= max_photos:
+            return
+        names = [f"url_photo{i}" for i in range(max_photos + 1, nb + 1)]
+        if writer is not None:
+            writer.add_columns(layer_name, [(name, "TEXT(250)") for name in names])
+        else:
+            pr.addAttributes([QgsField(name, QVariant.String, len=250) for name in names])
+            vl.updateFields()
+            fields = vl.fields()
+        max_photos = nb
+
+    def build_feature(obs):
+        coords = yd_obs_coords(obs)
+        if not coords:
+            return None
+        if inside is not None and not inside(coords):
+            return None
+        attrs = build_row(obs, coords, max_photos)
+
+        if photo_mode == "table":
+            for values in yd_photo_rows(obs):
+                if writer is not None:
+                    photo_rows.append(values)
+                else:
+                    row = QgsFeature(photo_fields)
+                    row.setAttributes(list(values))
+                    photo_rows.append(row)
+
+        if writer is not None:
+            return (coords[0], coords[1], attrs)
+        lon, lat_obs = coords
+        feat_out = QgsFeature(fields)
+        feat_out.setGeometry(QgsGeometry.fromPointXY(QgsPointXY(lon, lat_obs)))
+        feat_out.setAttributes(attrs)
+        return feat_out
+
+    total = [0]
+
+    def set_total(n):
+        total[0] = n
+
+    # Projection : pas de fields ici, yd_get_observations_v2 demande la
+    # projection commune à toutes les sélections (API_FIELDS_ALL) ; la clé du
+    # cache ne dépend donc pas des champs choisis
+    fetch_params = dict(params)
+
+    if tiling:
+        log("🧩 Zone découpée en tuiles" if area else "🧩 Grand cercle : découpage en tuiles")
+        pages = yd_fetch_tiled(get_observations, fetch_params, cache=cache,
+                               refresh=refresh, on_total=set_total,
+                               coverage=yd_clip_coverage(clip) if area and clip else None,
+                               metrics=metrics, log=log)
+    else:
+        pages = yd_fetch_pages(get_observations, fetch_params, cache=cache,
+                               refresh=refresh, on_total=set_total, id_above=cursor,
+                               metrics=metrics, log=log)
+
+    def stream_observations():
+        # Attente de chaque page (réseau, pool de récupération) mesurée à part
+        pages_it = iter(pages)
+        while True:
+            t = time.perf_counter()
+            results = next(pages_it, None)
+            if results is None:
+                return
+            metrics.record("fetch_wait", time.perf_counter() - t, items=len(results),
+                           event=False)
+            if is_canceled():
+                return
+            yield from results
+
+    n_obs = 0
+    n_feats = 0
+    n_photos = 0
+    last_id = cursor
+    chunk = []
+    build_s = 0.0
+    n_built = 0
+
+    def end_metrics(status, **extra):
+        # Résumé JSON (étapes, cache, limiteur, pic mémoire) + profil éventuel
+        if run_metrics is None:
+            return
+        if cache is not None:
+            extra["cache"] = cache.stats(since=cache_snap)
+        run_metrics.close(status=status, n_obs=n_obs, n_feats=n_feats,
+                          limiter=yd_LIMITEUR.stats(since=limiter_snap), **extra)
+        log(run_metrics.text())
+        if run_metrics.profile and run_metrics.path:
+            log(f"🔬 Profil : {os.path.splitext(run_metrics.path)[0]}_profile.txt")
+
+    def flush():
+        nonlocal n_feats, n_photos, build_s, n_built
+        if n_built:
+            metrics.record("build", build_s, items=n_built, event=False)
+            build_s = 0.0
+            n_built = 0
+        t = time.perf_counter()
+        n_rows = len(chunk) + len(photo_rows)
+        committed = False
+        if chunk:
+            if writer is not None:
+                committed = writer.insert(layer_name, chunk)
+            else:
+                pr.addFeatures(chunk)
+            n_feats += len(chunk)
+            chunk.clear()
+        if photo_rows:
+            if writer is not None:
+                committed = writer.insert(photos_name, photo_rows) or committed
+            else:
+                pr_photos.addFeatures(photo_rows)
+            n_photos += len(photo_rows)
+            photo_rows.clear()
+        if committed and writer is not None:
+            # Une transaction vient d'être validée par l'une des deux tables :
+            # on valide aussi l'autre pour que le point de reprise les couvre
+            writer.commit()
+        if n_rows:
+            metrics.record("write", time.perf_counter() - t, items=n_rows,
+                           event=committed, committed=committed)
+        if committed:
+            # Point de reprise : last_id = dernière observation entièrement
+            # traitée (ligne et photos écrites, ou écartée), donc validée
+            journal.update(
+                cursor=None if tiling else last_id,
+                n_obs=(resume or {}).get("n_obs", 0) + n_obs,
+            )
+            yd_journal_write(journal)
+        if progress is not None and total[0]:
+            # 95 % pour la récupération, le reste pour l'index spatial
+            progress(min(95.0, 95.0 * n_obs / total[0]))
+
+    result = {
+        "canceled": False,
+        "n_obs": 0,
+        "n_feats": 0,
+        "n_photos": 0,
+        "error": None,
+        "gpkg_path": gpkg_path,
+        "layer_name": layer_name,
+        "photos_name": photos_name if photo_mode == "table" else None,
+        "vl_memory": None,
+        "vl_photos_memory": None,
+        "aggregates": [],
+    }
+
+    try:
+        for obs in stream_observations():
+            if skip_ids and obs.get('id') in skip_ids:
+                continue
+            n_obs += 1
+            if photo_mode == "all":
+                nb = len(obs.get('photos', []) or [])
+                if nb > max_photos:
+                    # Vider le paquet en cours avant de modifier le schéma
+                    flush()
+                    ensure_photo_columns(nb)
+            t = time.perf_counter()
+            feat_out = build_feature(obs)
+            build_s += time.perf_counter() - t
+            n_built += 1
+            if feat_out is not None:
+                chunk.append(feat_out)
+            # Seulement maintenant : un flush() antérieur (élargissement du
+            # schéma photo) ne doit pas marquer cette observation comme écrite
+            last_id = obs.get('id')
+            if len(chunk) >= CHUNK_SIZE:
+                flush()
+        flush()
+    except Exception as e:
+        if writer is not None:
+            # GPKG partiel conservé : reprise possible au dernier curseur
+            writer.suspend()
+            log(f"⚠️ Import interrompu, reprise possible après inat_id={journal['cursor']}")
+        end_metrics("erreur", error=str(e))
+        raise
+
+    result.update(n_obs=n_obs, n_feats=n_feats, n_photos=n_photos)
+
+    if is_canceled():
+        log("❌ Import annulé")
+        if writer is not None:
+            writer.abort()
+            yd_journal_clear(gpkg_path)
+        result["canceled"] = True
+        end_metrics("annulé")
+        return result
+
+    log(f"{n_obs} observations récupérées.")
+    if photo_mode == "table":
+        log(f"{n_photos} photos dans la table liée.")
+    else:
+        log(f"Maximum {max_photos} photos.")
+    log(f"📈 Pic mémoire (RSS) : {yd_peak_rss_mb():.0f} Mo")
+    if cache is not None:
+        log(f"🗄️ {cache.stats(since=cache_snap)}")
+    log(f"⏱️ {yd_LIMITEUR.stats(since=limiter_snap)}")
+    log(f"✅ ETAPE 7 : {n_feats} obs (mode {photo_mode}, {len(ordered_fields)} champs non-photo)")
+
+    if writer is None:
+        result["vl_memory"] = vl
+        result["vl_photos_memory"] = vl_photos
+        end_metrics("ok")
+        return result
+
+    # ---------- ETAPE 8 : finalisation GPKG (index R-tree, emprise) ----------
+    try:
+        if aggregates:
+            with metrics.stage("aggregate") as m:
+                result["aggregates"] = yd_write_aggregates(writer, layer_name, aggregates,
+                                                           log=log)
+                m["items"] = sum(lv["n_cells"] for lv in result["aggregates"])
+        with metrics.stage("finalize"):
+            writer.close()
+            yd_write_sync_info(
+                gpkg_path, layer_name, sync_start, params, ordered_fields, photo_mode,
+                clip=clip,
+            )
+            if result["aggregates"]:
+                yd_write_aggregate_info(gpkg_path, layer_name, result["aggregates"])
+        result["error"] = QgsVectorFileWriter.NoError
+        yd_journal_clear(gpkg_path)
+        log(f"💾 GPKG enregistré : {gpkg_path}")
+    except Exception as e:
+        result["error"] = QgsVectorFileWriter.ErrCreateDataSource
+        log(f"❌ Erreur enregistrement GPKG : {e}")
+
+    end_metrics("ok" if result["error"] == QgsVectorFileWriter.NoError else "erreur")
+    if progress is not None:
+        progress(100)
+    return result
+
+
+def yd_resume_import(get_observations, journal, cache=None, progress=None,
+                     is_canceled=None, log=print):
+    """Reprend un import interrompu décrit par son journal (yd_journal_last)."""
+    return yd_import_observations(
+        get_observations, journal["params"], journal["ordered_fields"],
+        journal["photo_mode"], journal["layer_name"], gpkg_path=journal["gpkg_path"],
+        cache=cache, progress=progress, is_canceled=is_canceled, log=log,
+        resume=journal, clip=journal.get("clip"), aggregates=journal.get("aggregates"),
+    )
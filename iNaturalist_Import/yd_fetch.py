@@ -0,0 +1,205 @@
+# ==============================================================
+# Plugin QGIS : iNaturalist Import
+# Module     : yd_fetch
+# Version    : 1.0.0
+# Rôle       : Récupération concurrente des pages d'observations iNaturalist
+# QGIS       : 3.40 (Bratislava)
+# ==============================================================
+
+import math
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from .yd_cache import yd_cache_key
+from .yd_metrics import YD_NO_METRICS, yd_take_response
+from .yd_ratelimit import yd_LIMITEUR, yd_retry_after
+
+# PARAMÈTRES
+PER_PAGE = 200
+MAX_WORKERS = 4
+# L'API refuse page * per_page au-delà de 10 000 résultats
+OFFSET_MAX = 10000
+
+# Modes de pagination
+MODE_AUTO = "auto"          # pages si total_results <= OFFSET_MAX, sinon id_above
+MODE_PAGES = "pages"        # page=1..N, récupérées en parallèle
+MODE_ID_ABOVE = "id_above"  # curseur (keyset) : order_by=id + id_above
+
+# Nouvelles tentatives par page (réseau, 429, 5xx) : attente exponentielle
+RETRIES = 5
+BACKOFF_S = 2.0
+BACKOFF_MAX_S = 120.0
+
+
+def yd_call(fn, limiter=None, cache=None, refresh=False, metrics=None, **params):
+    """
+    Appel API derrière le limiteur de débit partagé (un succès le fait
+    remonter, voir yd_call_retry pour les 429).
+    Avec un cache : lecture d'abord (sauf refresh=True), écriture ensuite ;
+    un hit ne consomme pas de jeton du limiteur.
+    metrics (yd_Metrics) : attente du limiteur, latence, octets, décodage JSON.
+    """
+    metrics = metrics or YD_NO_METRICS
+    key = None
+    if cache is not None:
+        key = yd_cache_key(f"{fn.__module__}.{fn.__name__}", params)
+        if not refresh:
+            t = time.perf_counter()
+            resp = cache.get(key)
+            if resp is not None:
+                metrics.record("cache_hit", time.perf_counter() - t,
+                               items=len(resp.get('results') or []))
+                return resp
+    limiter = limiter or yd_LIMITEUR
+    t = time.perf_counter()
+    limiter.acquire()
+    t_call = time.perf_counter()
+    metrics.record("limiter_wait", t_call - t, event=False)
+    yd_take_response()
+    resp = fn(**params)
+    elapsed = time.perf_counter() - t_call
+    limiter.success()
+    n_bytes, decode_s = yd_take_response() or (0, 0.0)
+    if decode_s:
+        metrics.record("json_decode", decode_s, n_bytes, event=False)
+    metrics.record(f"api:{fn.__name__}", elapsed, n_bytes,
+                   items=len(resp.get('results') or []) if isinstance(resp, dict) else 0,
+                   page=params.get('page'), id_above=params.get('id_above'))
+    if key is not None and resp is not None:
+        cache.put(key, resp)
+    return resp
+
+
+def _status(e):
+    return getattr(getattr(e, 'response', None), 'status_code', None)
+
+
+def _retryable(e):
+    # Erreurs réseau / HTTP de requests (OSError) : 429 et 5xx seulement
+    if not isinstance(e, OSError):
+        return False
+    status = _status(e)
+    return status is None or status == 429 or status >= 500
+
+
+def yd_call_retry(fn, retries=RETRIES, log=print, **kwargs):
+    """
+    yd_call avec nouvelles tentatives. Sur 429 : le limiteur réduit son débit
+    et suspend tous les threads (Retry-After si fourni) ; sinon attente
+    exponentielle (+ aléa). log : messages des tentatives (journal de l'appelant).
+    """
+    limiter = kwargs.get("limiter") or yd_LIMITEUR
+    attempt = 0
+    while True:
+        try:
+            return yd_call(fn, **kwargs)
+        except Exception as e:
+            if attempt >= retries or not _retryable(e):
+                raise
+            attempt += 1
+            (kwargs.get("metrics") or YD_NO_METRICS).record("retry", status=_status(e))
+            if _status(e) == 429:
+                # Pas de sleep ici : le prochain acquire() attend la fin de la pause
+                pause = limiter.throttled(yd_retry_after(e))
+                log(f"⚠️ 429 — tentative {attempt}/{retries}, pause {pause:.0f}s, "
+                      f"débit ramené à {limiter.rate:.2f} req/s")
+                continue
+            delay = min(BACKOFF_MAX_S, BACKOFF_S * 2 ** (attempt - 1))
+            delay *= random.uniform(0.5, 1.0)
+            log(f"⚠️ {e} — tentative {attempt}/{retries} dans {delay:.0f}s")
+            time.sleep(delay)
+
+
+def yd_plan_pages(total_results, per_page=PER_PAGE):
+    """Pages restant à récupérer une fois la page 1 connue."""
+    nb_pages = int(math.ceil(total_results / float(per_page))) if total_results else 0
+    return list(range(2, nb_pages + 1))
+
+
+def yd_fetch_pages(get_observations, params, per_page=PER_PAGE,
+                   max_workers=MAX_WORKERS, limiter=None, mode=MODE_AUTO,
+                   cache=None, refresh=False, on_total=None, id_above=None, metrics=None,
+                   log=print):
+    """
+    Générateur : renvoie les listes 'results' page par page, DANS L'ORDRE.
+
+    Les observations sont toujours triées par id croissant. La page 1
+    fournit total_results :
+    - mode pages : les pages suivantes sont planifiées puis récupérées par
+      un pool borné de workers (fenêtre glissante de 2 x max_workers pages
+      en vol au maximum) ;
+    - mode id_above : chaque page repart de l'id de la dernière
+      observation reçue, sans offset, donc sans plafond de profondeur.
+    En mode auto, id_above est choisi dès que total_results dépasse
+    OFFSET_MAX. cache / refresh : voir yd_call. on_total(total_results)
+    est appelé une fois la page 1 reçue (barre de progression).
+    id_above : reprise après cet id (mode id_above imposé). Chaque page
+    est retentée RETRIES fois (yd_call_retry) avant d'abandonner.
+    metrics (yd_Metrics) : mesures de chaque appel, cf. yd_call.
+    log : journal de l'appelant (pagination choisie, tentatives).
+    """
+    base = dict(params, per_page=per_page, order_by='id', order='asc')
+    if id_above is not None:
+        base['id_above'] = id_above
+        mode = MODE_ID_ABOVE
+
+    def call(**page_params):
+        return yd_call_retry(get_observations, limiter=limiter, cache=cache,
+                             refresh=refresh, metrics=metrics, log=log, **page_params)
+
+    first = call(**dict(base, page=1))
+    results = first.get('results', []) or []
+    if not results:
+        return
+    yield results
+
+    total = first.get('total_results') or 0
+    if on_total is not None:
+        on_total(total)
+    if mode == MODE_AUTO:
+        mode = MODE_ID_ABOVE if total > OFFSET_MAX else MODE_PAGES
+    log(f"📑 {total} observations annoncées, pagination : {mode}")
+
+    if mode == MODE_ID_ABOVE:
+        yield from _fetch_id_above(call, base, results)
+    else:
+        yield from _fetch_parallel(call, base, total, per_page, max_workers)
+
+
+def _fetch_id_above(call, base, results):
+    per_page = base['per_page']
+    while len(results) >= per_page:
+        last_id = results[-1].get('id')
+        if last_id is None:
+            return
+        results = call(**dict(base, id_above=last_id)).get('results', []) or []
+        if not results:
+            return
+        yield results
+
+
+def _fetch_parallel(call, base, total, per_page, max_workers):
+
+    def fetch(page):
+        return call(**dict(base, page=page)).get('results', []) or []
+
+    pages = yd_plan_pages(total, per_page)
+    if not pages:
+        return
+
+    window = max(1, max_workers) * 2
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+        pending = []
+        next_idx = 0
+        while next_idx < len(pages) or pending:
+            while next_idx < len(pages) and len(pending) < window:
+                pending.append(executor.submit(fetch, pages[next_idx]))
+                next_idx += 1
+            results = pending.pop(0).result()
+            if not results:
+                # total_results a pu diminuer entre-temps : fin des données
+                for fut in pending:
+                    fut.cancel()
+                return
+            yield results
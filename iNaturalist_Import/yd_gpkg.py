@@ -0,0 +1,522 @@
+# ==============================================================
+# Plugin QGIS : iNaturalist Import
+# Module     : yd_gpkg
+# Version    : 1.0.0
+# Rôle       : Accès direct (sqlite3) aux GPKG produits par le plugin :
+#              informations de synchro, écriture en masse des couches
+# QGIS       : 3.40 (Bratislava)
+# ==============================================================
+
+import json
+import os
+import sqlite3
+import struct
+from datetime import datetime, timezone
+
+# Table des informations de synchronisation (une ligne par couche iNat)
+SYNC_TABLE = "yd_inat_sync"
+
+# Écriture en masse : lignes par transaction
+BATCH_ROWS = 50000
+
+GPKG_APPLICATION_ID = 0x47504B47   # "GPKG"
+GPKG_USER_VERSION = 10400          # GeoPackage 1.4
+SRS_WGS84 = 4326
+WKT_WGS84 = (
+    'GEOGCS["WGS 84",DATUM["WGS_1984",SPHEROID["WGS 84",6378137,298.257223563,'
+    'AUTHORITY["EPSG","7030"]],AUTHORITY["EPSG","6326"]],PRIMEM["Greenwich",0,'
+    'AUTHORITY["EPSG","8901"]],UNIT["degree",0.0174532925199433,'
+    'AUTHORITY["EPSG","9122"]],AXIS["Latitude",NORTH],AXIS["Longitude",EAST],'
+    'AUTHORITY["EPSG","4326"]]'
+)
+
+# En-tête GPKG (little endian, sans enveloppe, srs 4326) + WKB Point
+_GP_HEADER = struct.pack("<2sBBi", b"GP", 0, 0x01, SRS_WGS84)
+_WKB_POINT = struct.Struct("<BIdd")
+_XY = struct.Struct("<dd")
+# Polygones : en-tête avec enveloppe xy (minx, maxx, miny, maxy)
+_GP_HEADER_ENV = struct.pack("<2sBBi", b"GP", 0, 0x03, SRS_WGS84)
+_ENV = struct.Struct("<dddd")
+_WKB_POLYGON = struct.Struct("<BIII")
+
+
+def yd_sync_timestamp():
+    """Horodatage UTC ISO 8601, utilisable tel quel pour updated_since."""
+    return datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S+00:00")
+
+
+def _sync_columns(conn):
+    return [row[1] for row in conn.execute(f"PRAGMA table_info({SYNC_TABLE})")]
+
+
+def yd_write_sync_info(gpkg_path, layer_name, last_sync, params, fields, photo_mode,
+                       clip=None, n_refresh=0):
+    """
+    Mémorise dans le GPKG la requête d'origine et la date de dernière synchro
+    (clip : polygone WKT d'une zone, cf. yd_build_area_params ; n_refresh :
+    mises à jour delta depuis le dernier balayage complet des id).
+    """
+    conn = sqlite3.connect(gpkg_path)
+    try:
+        conn.execute(
+            f"CREATE TABLE IF NOT EXISTS {SYNC_TABLE} ("
+            " layer_name TEXT PRIMARY KEY,"
+            " last_sync TEXT NOT NULL,"
+            " params TEXT NOT NULL,"
+            " fields TEXT NOT NULL,"
+            " photo_mode TEXT NOT NULL,"
+            " clip TEXT,"
+            " n_refresh INTEGER NOT NULL DEFAULT 0)"
+        )
+        cols = _sync_columns(conn)
+        # Table créée par une version antérieure
+        if "clip" not in cols:
+            conn.execute(f"ALTER TABLE {SYNC_TABLE} ADD COLUMN clip TEXT")
+        if "n_refresh" not in cols:
+            conn.execute(f"ALTER TABLE {SYNC_TABLE} ADD COLUMN n_refresh INTEGER NOT NULL DEFAULT 0")
+        # Table déclarée dans gpkg_contents pour rester un GPKG valide
+        conn.execute(
+            "INSERT OR IGNORE INTO gpkg_contents "
+            "(table_name, data_type, identifier, last_change) "
+            "VALUES (?, 'attributes', ?, strftime('%Y-%m-%dT%H:%M:%fZ', 'now'))",
+            (SYNC_TABLE, SYNC_TABLE),
+        )
+        conn.execute(
+            f"INSERT OR REPLACE INTO {SYNC_TABLE} "
+            "(layer_name, last_sync, params, fields, photo_mode, clip, n_refresh) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (layer_name, last_sync, json.dumps(params), json.dumps(fields), photo_mode, clip,
+             n_refresh),
+        )
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def yd_read_sync_info(gpkg_path, layer_name):
+    """Informations de synchro de la couche, ou None (import antérieur)."""
+    conn = sqlite3.connect(gpkg_path)
+    try:
+        cols = _sync_columns(conn)
+        clip = "clip" if "clip" in cols else "NULL"
+        n_refresh = "n_refresh" if "n_refresh" in cols else "0"
+        row = conn.execute(
+            f"SELECT last_sync, params, fields, photo_mode, {clip}, {n_refresh} FROM {SYNC_TABLE} "
+            "WHERE layer_name = ?",
+            (layer_name,),
+        ).fetchone()
+    except sqlite3.OperationalError:
+        return None
+    finally:
+        conn.close()
+    if row is None:
+        return None
+    return {
+        "last_sync": row[0],
+        "params": json.loads(row[1]),
+        "fields": json.loads(row[2]),
+        "photo_mode": row[3],
+        "clip": row[4],
+        "n_refresh": row[5],
+    }
+
+
+# ==============================================================
+# ÉCRITURE EN MASSE (sqlite3) : table créée d'emblée, insertions par
+# transactions de BATCH_ROWS lignes (WAL), index R-tree construit une
+# seule fois à la fin. Aucune couche intermédiaire.
+# ==============================================================
+
+def _q(name):
+    return '"' + name.replace('"', '""') + '"'
+
+
+def yd_gpkg_point(x, y):
+    """Géométrie GPKG (blob) d'un point WGS 84."""
+    return _GP_HEADER + _WKB_POINT.pack(1, 1, x, y)
+
+
+def yd_gpkg_polygon(ring):
+    """Géométrie GPKG (blob, avec enveloppe) d'un polygone WGS 84 à un anneau fermé."""
+    xs = [x for x, _ in ring]
+    ys = [y for _, y in ring]
+    coords = b"".join(_XY.pack(x, y) for x, y in ring)
+    return (_GP_HEADER_ENV + _ENV.pack(min(xs), max(xs), min(ys), max(ys))
+            + _WKB_POLYGON.pack(1, 3, 1, len(ring)) + coords)
+
+
+def yd_gpkg_datetime(year, month, day, hour=0, minute=0, second=0):
+    """Valeur DATETIME GPKG (heure locale de l'observation)."""
+    return f"{year:04d}-{month:02d}-{day:02d}T{hour:02d}:{minute:02d}:{second:02d}.000"
+
+
+def yd_gpkg_now():
+    return yd_gpkg_datetime(*datetime.now().timetuple()[:6])
+
+
+def _envelope(blob):
+    # (minx, maxx, miny, maxy) d'un point GPKG, None si vide / autre type
+    if blob is None or len(blob) < 8:
+        return None
+    if len(blob) == 29 and blob[3] == 0x01 and blob[8] == 1:
+        # Cas courant : point écrit par yd_gpkg_point
+        x, y = _XY.unpack_from(blob, 13)
+        return x, x, y, y
+    flags = blob[3]
+    if flags & 0x10:
+        return None
+    env_len = {0: 0, 1: 32, 2: 48, 3: 48, 4: 64}.get((flags >> 1) & 0x07, 0)
+    if env_len and len(blob) >= 40:
+        # Enveloppe dans l'en-tête (ex. polygones de yd_gpkg_polygon)
+        order = "<" if flags & 0x01 else ">"
+        return struct.unpack(order + "dddd", blob[8:40])
+    wkb = blob[8 + env_len:]
+    if len(wkb) < 21:
+        return None
+    order = "<" if wkb[0] == 1 else ">"
+    if struct.unpack(order + "I", wkb[1:5])[0] % 1000 != 1:
+        return None
+    x, y = struct.unpack(order + "dd", wkb[5:21])
+    if x != x or y != y:
+        return None
+    return x, x, y, y
+
+
+def yd_gpkg_functions(conn):
+    """
+    Fonctions ST_* utilisées par les triggers R-tree du GPKG (normalement
+    fournies par GDAL/Spatialite), pour les points écrits par le plugin.
+    """
+    def coord(i):
+        return lambda blob: (_envelope(blob) or (None,) * 4)[i]
+
+    conn.create_function("ST_MinX", 1, coord(0), deterministic=True)
+    conn.create_function("ST_MaxX", 1, coord(1), deterministic=True)
+    conn.create_function("ST_MinY", 1, coord(2), deterministic=True)
+    conn.create_function("ST_MaxY", 1, coord(3), deterministic=True)
+    conn.create_function("ST_IsEmpty", 1, lambda blob: int(_envelope(blob) is None),
+                         deterministic=True)
+
+
+_RTREE_TRIGGERS = [
+    ("insert", "AFTER INSERT ON {t} WHEN (new.{c} NOT NULL AND NOT ST_IsEmpty(NEW.{c})) "
+     "BEGIN INSERT OR REPLACE INTO {r} VALUES (NEW.{i}, ST_MinX(NEW.{c}), ST_MaxX(NEW.{c}), "
+     "ST_MinY(NEW.{c}), ST_MaxY(NEW.{c})); END"),
+    ("update2", "AFTER UPDATE OF {c} ON {t} WHEN OLD.{i} = NEW.{i} AND "
+     "(NEW.{c} IS NULL OR ST_IsEmpty(NEW.{c})) "
+     "BEGIN DELETE FROM {r} WHERE id = OLD.{i}; END"),
+    ("update4", "AFTER UPDATE ON {t} WHEN OLD.{i} != NEW.{i} AND "
+     "(NEW.{c} IS NULL OR ST_IsEmpty(NEW.{c})) "
+     "BEGIN DELETE FROM {r} WHERE id IN (OLD.{i}, NEW.{i}); END"),
+    ("update5", "AFTER UPDATE ON {t} WHEN OLD.{i} != NEW.{i} AND "
+     "(NEW.{c} NOTNULL AND NOT ST_IsEmpty(NEW.{c})) "
+     "BEGIN DELETE FROM {r} WHERE id = OLD.{i}; INSERT OR REPLACE INTO {r} VALUES "
+     "(NEW.{i}, ST_MinX(NEW.{c}), ST_MaxX(NEW.{c}), ST_MinY(NEW.{c}), ST_MaxY(NEW.{c})); END"),
+    ("update6", "AFTER UPDATE OF {c} ON {t} WHEN OLD.{i} = NEW.{i} AND "
+     "(NEW.{c} NOTNULL AND NOT ST_IsEmpty(NEW.{c})) AND "
+     "(OLD.{c} NOTNULL AND NOT ST_IsEmpty(OLD.{c})) "
+     "BEGIN UPDATE {r} SET minx = ST_MinX(NEW.{c}), maxx = ST_MaxX(NEW.{c}), "
+     "miny = ST_MinY(NEW.{c}), maxy = ST_MaxY(NEW.{c}) WHERE id = NEW.{i}; END"),
+    ("update7", "AFTER UPDATE OF {c} ON {t} WHEN OLD.{i} = NEW.{i} AND "
+     "(NEW.{c} NOTNULL AND NOT ST_IsEmpty(NEW.{c})) AND "
+     "(OLD.{c} ISNULL OR ST_IsEmpty(OLD.{c})) "
+     "BEGIN INSERT INTO {r} VALUES (NEW.{i}, ST_MinX(NEW.{c}), ST_MaxX(NEW.{c}), "
+     "ST_MinY(NEW.{c}), ST_MaxY(NEW.{c})); END"),
+    ("delete", "AFTER DELETE ON {t} WHEN old.{c} NOT NULL "
+     "BEGIN DELETE FROM {r} WHERE id = OLD.{i}; END"),
+]
+
+
+class yd_GpkgWriter:
+    """
+    Écrit des couches dans un nouveau GPKG (fichier existant remplacé).
+
+    create_layer(nom, colonnes, spatial, geometry) avec colonnes = [(nom, type SQL)] ;
+    insert(nom, lignes) : (x, y, attributs) pour une couche de points,
+    (anneau, attributs) pour une couche de polygones, attributs seuls pour
+    une table, renvoie True quand une transaction vient d'être validée
+    (point de reprise) ; close() construit les index R-tree des couches
+    qui n'en ont pas encore, les emprises et repasse le fichier en journal
+    classique.
+
+    resume=True : rouvre un GPKG du plugin, ex. celui d'un import
+    interrompu (suspend()) pour y poursuivre les insertions.
+    """
+
+    def __init__(self, gpkg_path, batch_rows=BATCH_ROWS, resume=False):
+        self.path = gpkg_path
+        self.batch_rows = batch_rows
+        self._columns = {}     # nom de couche -> [colonnes]
+        self._spatial = {}     # nom de couche -> bool
+        self._geometry = {}    # nom de couche -> POINT / POLYGON
+        self._unfinished = set()  # couches spatiales sans index R-tree
+        self._pending = 0
+
+        if not resume:
+            for suffix in ("", "-wal", "-shm", "-journal"):
+                if os.path.exists(gpkg_path + suffix):
+                    os.remove(gpkg_path + suffix)
+        self._conn = sqlite3.connect(gpkg_path)
+        yd_gpkg_functions(self._conn)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        if resume:
+            self._load_layers()
+            return
+        self._conn.execute(f"PRAGMA application_id={GPKG_APPLICATION_ID}")
+        self._conn.execute(f"PRAGMA user_version={GPKG_USER_VERSION}")
+        self._create_core_tables()
+
+    def _load_layers(self):
+        c = self._conn
+        spatial = dict(c.execute(
+            "SELECT table_name, geometry_type_name FROM gpkg_geometry_columns"
+        ).fetchall())
+        tables = {row[0] for row in c.execute("SELECT name FROM sqlite_master")}
+        for (name,) in c.execute(
+            "SELECT table_name FROM gpkg_contents WHERE data_type IN ('features', 'attributes') "
+            "AND table_name != ?", (SYNC_TABLE,)
+        ).fetchall():
+            cols = [row[1] for row in c.execute(f"PRAGMA table_info({_q(name)})")]
+            self._columns[name] = [col for col in cols if col not in ("fid", "geom")]
+            self._spatial[name] = name in spatial
+            if name in spatial:
+                self._geometry[name] = spatial[name]
+                if f"rtree_{name}_geom" not in tables:
+                    self._unfinished.add(name)
+
+    def columns(self, name):
+        return list(self._columns[name])
+
+    def ids(self, name, column):
+        """Valeurs déjà écrites d'une colonne (ex. inat_id), en ensemble."""
+        return {row[0] for row in self._conn.execute(f"SELECT {_q(column)} FROM {_q(name)}")}
+
+    def has_layer(self, name):
+        return name in self._columns
+
+    def rows(self, name, columns):
+        """(x, y, valeurs des colonnes) de chaque point de la couche."""
+        select = ", ".join(["geom"] + [_q(col) for col in columns])
+        for row in self._conn.execute(f"SELECT {select} FROM {_q(name)}"):
+            env = _envelope(row[0])
+            if env is not None:
+                yield (env[0], env[2]) + tuple(row[1:])
+
+    def clear(self, name):
+        """Vide une couche ; son index R-tree est tenu à jour par les triggers."""
+        self._conn.execute(f"DELETE FROM {_q(name)}")
+
+    def update_extent(self, name):
+        """Emprise de gpkg_contents recalculée depuis l'index R-tree."""
+        self._conn.execute(
+            f"UPDATE gpkg_contents SET (min_x, max_x, min_y, max_y) = "
+            f"(SELECT min(minx), max(maxx), min(miny), max(maxy) FROM {_q(f'rtree_{name}_geom')}) "
+            "WHERE table_name = ?",
+            (name,),
+        )
+
+    def drop_layer(self, name):
+        """Supprime une couche (table, index R-tree, métadonnées GPKG)."""
+        c = self._conn
+        c.execute(f"DROP TABLE IF EXISTS {_q(f'rtree_{name}_geom')}")
+        c.execute(f"DROP TABLE IF EXISTS {_q(name)}")
+        for table in ("gpkg_extensions", "gpkg_geometry_columns", "gpkg_contents"):
+            c.execute(f"DELETE FROM {table} WHERE table_name = ?", (name,))
+        for registry in (self._columns, self._spatial, self._geometry):
+            registry.pop(name, None)
+        self._unfinished.discard(name)
+
+    def delete_above(self, name, column, value):
+        """Supprime les lignes écrites après un point de reprise."""
+        self._conn.execute(f"DELETE FROM {_q(name)} WHERE {_q(column)} > ?", (value,))
+        self._conn.commit()
+
+    def _create_core_tables(self):
+        c = self._conn
+        c.execute(
+            "CREATE TABLE gpkg_spatial_ref_sys ("
+            " srs_name TEXT NOT NULL, srs_id INTEGER PRIMARY KEY,"
+            " organization TEXT NOT NULL, organization_coordsys_id INTEGER NOT NULL,"
+            " definition TEXT NOT NULL, description TEXT)"
+        )
+        c.executemany(
+            "INSERT INTO gpkg_spatial_ref_sys VALUES (?, ?, ?, ?, ?, ?)",
+            [
+                ("Undefined cartesian SRS", -1, "NONE", -1, "undefined",
+                 "undefined cartesian coordinate reference system"),
+                ("Undefined geographic SRS", 0, "NONE", 0, "undefined",
+                 "undefined geographic coordinate reference system"),
+                ("WGS 84 geodetic", SRS_WGS84, "EPSG", SRS_WGS84, WKT_WGS84,
+                 "longitude/latitude coordinates in decimal degrees on the WGS 84 spheroid"),
+            ],
+        )
+        c.execute(
+            "CREATE TABLE gpkg_contents ("
+            " table_name TEXT NOT NULL PRIMARY KEY, data_type TEXT NOT NULL,"
+            " identifier TEXT UNIQUE, description TEXT DEFAULT '',"
+            " last_change DATETIME NOT NULL DEFAULT (strftime('%Y-%m-%dT%H:%M:%fZ','now')),"
+            " min_x DOUBLE, min_y DOUBLE, max_x DOUBLE, max_y DOUBLE, srs_id INTEGER,"
+            " CONSTRAINT fk_gc_r_srs_id FOREIGN KEY (srs_id)"
+            " REFERENCES gpkg_spatial_ref_sys(srs_id))"
+        )
+        c.execute(
+            "CREATE TABLE gpkg_geometry_columns ("
+            " table_name TEXT NOT NULL, column_name TEXT NOT NULL,"
+            " geometry_type_name TEXT NOT NULL, srs_id INTEGER NOT NULL,"
+            " z TINYINT NOT NULL, m TINYINT NOT NULL,"
+            " CONSTRAINT pk_geom_cols PRIMARY KEY (table_name, column_name),"
+            " CONSTRAINT uk_gc_table_name UNIQUE (table_name),"
+            " CONSTRAINT fk_gc_tn FOREIGN KEY (table_name) REFERENCES gpkg_contents(table_name),"
+            " CONSTRAINT fk_gc_srs FOREIGN KEY (srs_id) REFERENCES gpkg_spatial_ref_sys (srs_id))"
+        )
+        c.execute(
+            "CREATE TABLE gpkg_extensions ("
+            " table_name TEXT, column_name TEXT, extension_name TEXT NOT NULL,"
+            " definition TEXT NOT NULL, scope TEXT NOT NULL,"
+            " CONSTRAINT ge_tce UNIQUE (table_name, column_name, extension_name))"
+        )
+
+    def create_layer(self, name, columns, spatial=True, geometry="POINT"):
+        cols = ", ".join(f"{_q(col)} {sql_type}" for col, sql_type in columns)
+        geom = f"geom {geometry}, " if spatial else ""
+        self._conn.execute(
+            f"CREATE TABLE {_q(name)} (fid INTEGER PRIMARY KEY AUTOINCREMENT NOT NULL, "
+            f"{geom}{cols})"
+        )
+        self._conn.execute(
+            "INSERT INTO gpkg_contents (table_name, data_type, identifier, srs_id) "
+            "VALUES (?, ?, ?, ?)",
+            (name, "features" if spatial else "attributes", name,
+             SRS_WGS84 if spatial else None),
+        )
+        if spatial:
+            self._conn.execute(
+                "INSERT INTO gpkg_geometry_columns VALUES (?, 'geom', ?, ?, 0, 0)",
+                (name, geometry, SRS_WGS84),
+            )
+            self._geometry[name] = geometry
+            self._unfinished.add(name)
+        self._columns[name] = [col for col, _ in columns]
+        self._spatial[name] = spatial
+
+    def add_columns(self, name, columns):
+        for col, sql_type in columns:
+            self._conn.execute(f"ALTER TABLE {_q(name)} ADD COLUMN {_q(col)} {sql_type}")
+            self._columns[name].append(col)
+
+    def insert(self, name, rows):
+        cols = self._columns[name]
+        if self._spatial[name]:
+            sql = (
+                f"INSERT INTO {_q(name)} (geom, {', '.join(_q(c) for c in cols)}) "
+                f"VALUES (?{', ?' * len(cols)})"
+            )
+            if self._geometry[name] == "POINT":
+                values = ([yd_gpkg_point(x, y)] + list(attrs) for x, y, attrs in rows)
+            else:
+                values = ([yd_gpkg_polygon(ring)] + list(attrs) for ring, attrs in rows)
+        else:
+            sql = (
+                f"INSERT INTO {_q(name)} ({', '.join(_q(c) for c in cols)}) "
+                f"VALUES ({', '.join('?' * len(cols))})"
+            )
+            values = rows
+        cur = self._conn.executemany(sql, values)
+        self._pending += cur.rowcount
+        if self._pending >= self.batch_rows:
+            self.commit()
+            return True
+        return False
+
+    def commit(self):
+        self._conn.commit()
+        self._pending = 0
+
+    def append_from(self, name, src_path, src_name, extra=None):
+        """
+        Copie en SQL les lignes de la couche src_name d'un autre GPKG dans
+        la couche name (colonnes absentes ajoutées, ex. url_photoN) ;
+        extra = {colonne: valeur constante} (ex. site_id). Renvoie le nombre de lignes.
+        """
+        extra = extra or {}
+        self.commit()
+        self._conn.execute("ATTACH DATABASE ? AS src", (src_path,))
+        try:
+            src_cols = [
+                (row[1], row[2])
+                for row in self._conn.execute(f"PRAGMA src.table_info({_q(src_name)})")
+                if row[1] not in ("fid", "geom") and row[1] not in extra
+            ]
+            missing = [(col, t) for col, t in src_cols if col not in self._columns[name]]
+            if missing:
+                self.add_columns(name, missing)
+            cols = [col for col, _ in src_cols]
+            if self._spatial[name]:
+                cols = ["geom"] + cols
+            select = ", ".join(_q(c) for c in cols)
+            target = ", ".join(_q(c) for c in cols + list(extra))
+            params = ", ".join("?" * len(extra))
+            cur = self._conn.execute(
+                f"INSERT INTO {_q(name)} ({target}) "
+                f"SELECT {select}{', ' + params if extra else ''} FROM src.{_q(src_name)}",
+                list(extra.values()),
+            )
+            self._conn.commit()
+            return cur.rowcount
+        finally:
+            self._conn.execute("DETACH DATABASE src")
+
+    def _finish_spatial(self, name):
+        t = _q(name)
+        r = _q(f"rtree_{name}_geom")
+        c = self._conn
+        c.execute(f"CREATE VIRTUAL TABLE {r} USING rtree(id, minx, maxx, miny, maxy)")
+        if self._geometry[name] == "POINT":
+            # Points : une lecture de x et y par ligne (min = max)
+            c.execute(
+                f"WITH p AS MATERIALIZED (SELECT fid, ST_MinX(geom) AS x, ST_MinY(geom) AS y "
+                f"FROM {t} WHERE geom NOT NULL) "
+                f"INSERT INTO {r} SELECT fid, x, x, y, y FROM p WHERE x NOT NULL"
+            )
+        else:
+            c.execute(
+                f"INSERT INTO {r} SELECT fid, ST_MinX(geom), ST_MaxX(geom), ST_MinY(geom), "
+                f"ST_MaxY(geom) FROM {t} WHERE geom NOT NULL AND NOT ST_IsEmpty(geom)"
+            )
+        for suffix, body in _RTREE_TRIGGERS:
+            trigger = _q(f"rtree_{name}_geom_{suffix}")
+            c.execute(f"CREATE TRIGGER {trigger} " + body.format(t=t, r=r, c="geom", i="fid"))
+        c.execute(
+            "INSERT INTO gpkg_extensions VALUES "
+            "(?, 'geom', 'gpkg_rtree_index', "
+            "'http://www.geopackage.org/spec120/#extension_rtree', 'write-only')",
+            (name,),
+        )
+        self.update_extent(name)
+
+    def close(self):
+        """Index R-tree et emprises, puis fichier GPKG autonome (sans -wal)."""
+        for name in sorted(self._unfinished):
+            self._finish_spatial(name)
+        self._unfinished.clear()
+        self._conn.commit()
+        self._conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        self._conn.execute("PRAGMA journal_mode=DELETE")
+        self._conn.close()
+
+    def suspend(self):
+        """Import interrompu : lignes validées, fichier gardé pour la reprise."""
+        self._conn.commit()
+        self._conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        self._conn.execute("PRAGMA journal_mode=DELETE")
+        self._conn.close()
+
+    def abort(self):
+        """Abandon : connexion fermée et fichier partiel supprimé."""
+        try:
+            self._conn.close()
+        finally:
+            for suffix in ("", "-wal", "-shm", "-journal"):
+                if os.path.exists(self.path + suffix):
+                    os.remove(self.path + suffix)
@@ -0,0 +1,60 @@
+# ==============================================================
+# Plugin QGIS : iNaturalist Import
+# Module     : yd_journal
+# Version    : 1.0.0
+# Rôle       : Journal de reprise des imports vers GPKG : requête, couche
+#              et curseur de pagination (dernier inat_id enregistré)
+# QGIS       : 3.40 (Bratislava)
+# ==============================================================
+
+import hashlib
+import json
+import os
+import time
+
+from .yd_cache import CACHE_DIR, _json_default
+
+# PARAMÈTRES
+JOURNAL_DIR = os.path.join(CACHE_DIR, "journaux")
+
+
+def _journal_path(gpkg_path):
+    key = hashlib.sha1(os.path.abspath(gpkg_path).encode("utf-8")).hexdigest()
+    return os.path.join(JOURNAL_DIR, f"{key}.json")
+
+
+def yd_journal_write(state):
+    """Enregistre l'état d'un import (écriture atomique)."""
+    os.makedirs(JOURNAL_DIR, exist_ok=True)
+    state = dict(state, updated=time.time())
+    path = _journal_path(state["gpkg_path"])
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(state, f, default=_json_default)
+    os.replace(tmp, path)
+
+
+def yd_journal_clear(gpkg_path):
+    path = _journal_path(gpkg_path)
+    if os.path.exists(path):
+        os.remove(path)
+
+
+def yd_journal_last():
+    """Dernier import interrompu dont le GPKG existe encore, ou None."""
+    if not os.path.isdir(JOURNAL_DIR):
+        return None
+    states = []
+    for name in os.listdir(JOURNAL_DIR):
+        if not name.endswith(".json"):
+            continue
+        try:
+            with open(os.path.join(JOURNAL_DIR, name), encoding="utf-8") as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            continue
+        if os.path.exists(state.get("gpkg_path") or ""):
+            states.append(state)
+    if not states:
+        return None
+    return max(states, key=lambda s: s.get("updated", 0))
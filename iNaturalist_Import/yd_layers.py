@@ -0,0 +1,140 @@
+# ==============================================================
+# Plugin QGIS : iNaturalist Import
+# Module     : yd_layers
+# Version    : 1.0.0
+# Rôle       : Chargement dans le projet d'une couche iNat écrite en GPKG
+#              (style, table des photos et relation inat_id, couches de
+#              synthèse par mailles avec visibilité selon l'échelle)
+# QGIS       : 3.40 (Bratislava)
+# ==============================================================
+
+from qgis.core import (
+    QgsProject, QgsVectorLayer, QgsMarkerSymbol, QgsSingleSymbolRenderer, QgsRelation,
+    QgsEditorWidgetSetup, QgsGraduatedSymbolRenderer, QgsClassificationQuantile, QgsStyle
+)
+
+import os
+
+from .yd_aggregate import yd_points_min_scale, yd_read_aggregate_info
+from .yd_photos import PATH_PREFIX
+
+# PARAMÈTRES
+AGG_CLASSES = 5            # classes (quantiles) du nombre d'observations
+AGG_COLOR_RAMP = "Reds"
+AGG_OPACITY = 0.7
+
+
+def _load_aggregates(proj, gpkg_path, layer_name, vl_points):
+    """Couches de synthèse (yd_aggregate) : groupe, dégradé n_obs, plages d'échelles."""
+    levels = yd_read_aggregate_info(gpkg_path, layer_name)
+    if not levels:
+        return 0
+    root = proj.layerTreeRoot()
+    group = root.findGroup(f"Synthèse {layer_name}") or root.insertGroup(
+        0, f"Synthèse {layer_name}")
+    ramp = QgsStyle().defaultStyle().colorRamp(AGG_COLOR_RAMP)
+    n = 0
+    for lv in levels:
+        vl = QgsVectorLayer(f"{gpkg_path}|layername={lv['name']}", lv["name"], "ogr")
+        if not vl.isValid():
+            print(f"❌ Impossible de charger la synthèse {lv['name']}")
+            continue
+        renderer = QgsGraduatedSymbolRenderer("n_obs")
+        renderer.setClassificationMethod(QgsClassificationQuantile())
+        if ramp is not None:
+            renderer.setSourceColorRamp(ramp.clone())
+        renderer.updateClasses(vl, AGG_CLASSES)
+        vl.setRenderer(renderer)
+        vl.setOpacity(AGG_OPACITY)
+        # min = échelle la plus dézoomée, max = la plus zoomée (0 = sans limite)
+        vl.setScaleBasedVisibility(True)
+        vl.setMinimumScale(lv["min_scale"])
+        vl.setMaximumScale(lv["max_scale"])
+        proj.addMapLayer(vl, False)
+        group.addLayer(vl)
+        n += 1
+    if n:
+        # Points détaillés seulement en dessous du premier niveau de mailles
+        vl_points.setScaleBasedVisibility(True)
+        vl_points.setMinimumScale(yd_points_min_scale([lv["size_m"] for lv in levels]))
+        vl_points.setMaximumScale(0)
+    return n
+
+
+def _photo_widgets(vl, gpkg_path):
+    """Champs photo_path* (photos récoltées) : pièce jointe affichée en image."""
+    n = 0
+    for idx, field in enumerate(vl.fields()):
+        if field.name().startswith(PATH_PREFIX):
+            vl.setEditorWidgetSetup(idx, QgsEditorWidgetSetup("ExternalResource", {
+                "DocumentViewer": 1,          # image
+                "RelativeStorage": 2,         # relatif à DefaultRoot
+                "DefaultRoot": os.path.dirname(os.path.abspath(gpkg_path)),
+                "FileWidget": True,
+                "FileWidgetButton": False,
+                "UseLink": False,
+            }))
+            n += 1
+    return n
+
+
+def yd_load_gpkg_layers(iface, gpkg_path, layer_name, photo_mode):
+    """ETAPE 8 bis : couche GPKG ajoutée au projet, ou None si invalide."""
+    proj_local2 = QgsProject.instance()
+
+    uri_inat = f"{gpkg_path}|layername={layer_name}"
+    vl_perm = QgsVectorLayer(uri_inat, layer_name, "ogr")
+
+    if not vl_perm.isValid():
+        print("❌ Impossible de recharger la couche iNat depuis le GPKG")
+        return None
+
+    proj_local2.addMapLayer(vl_perm)
+    iface.setActiveLayer(vl_perm)
+    iface.zoomToActiveLayer()
+    print("✅ Couche iNat permanente chargée depuis le GPKG")
+
+    # ---- Style simple : point jaune bordure rouge, 4 mm ----
+    marker = QgsMarkerSymbol.createSimple({
+        "name": "circle",
+        "color": "255,255,0,255",          # jaune
+        "outline_color": "255,0,0,255",    # rouge
+        "outline_width": "0.4",
+        "outline_width_unit": "MM",
+        "size": "4",
+        "size_unit": "MM"
+    })
+    renderer = QgsSingleSymbolRenderer(marker)
+    vl_perm.setRenderer(renderer)
+    vl_perm.triggerRepaint()
+    print("✅ Style iNat appliqué (point jaune, bordure rouge, 4 mm)")
+
+    if _photo_widgets(vl_perm, gpkg_path):
+        print("✅ Photos locales affichées dans le formulaire (photo_path)")
+
+    n_agg = _load_aggregates(proj_local2, gpkg_path, layer_name, vl_perm)
+    if n_agg:
+        print(f"✅ {n_agg} couches de synthèse chargées (visibles selon l'échelle)")
+
+    # ---- Table des photos + relation parent (inat_id) → photos ----
+    if photo_mode == "table":
+        photos_name = f"{layer_name}_photos"
+        uri_photos = f"{gpkg_path}|layername={photos_name}"
+        vl_photos_perm = QgsVectorLayer(uri_photos, photos_name, "ogr")
+        if vl_photos_perm.isValid():
+            proj_local2.addMapLayer(vl_photos_perm)
+            _photo_widgets(vl_photos_perm, gpkg_path)
+            rel = QgsRelation()
+            rel.setId(f"{photos_name}_inat_id")
+            rel.setName("Photos iNaturalist")
+            rel.setReferencingLayer(vl_photos_perm.id())
+            rel.setReferencedLayer(vl_perm.id())
+            rel.addFieldPair("inat_id", "inat_id")
+            if rel.isValid():
+                proj_local2.relationManager().addRelation(rel)
+                print("✅ Table des photos chargée et liée (relation inat_id)")
+            else:
+                print("❌ Relation photos invalide")
+        else:
+            print("❌ Impossible de charger la table des photos depuis le GPKG")
+    return vl_perm
@@ -0,0 +1,296 @@
+# ==============================================================
+# Plugin QGIS : iNaturalist Import
+# Module     : yd_metrics
+# Version    : 1.1.0
+# Rôle       : Mesures d'exécution : mémoire, mesures par étape (JSON lines
+#              à côté du GPKG), profilage optionnel (cProfile / tracemalloc),
+#              journal texte gardé ouvert
+# QGIS       : 3.40 (Bratislava)
+# ==============================================================
+
+import cProfile
+import io
+import json
+import os
+import pstats
+import sys
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime
+
+# PARAMÈTRES
+# Profilage optionnel : variable d'environnement (interface) ou --profile (yd_cli)
+PROFILE_ENV = "YD_INAT_PROFILE"
+PROFILE_TOP = 30          # fonctions listées dans le rapport cProfile
+TRACEMALLOC_TOP = 15      # lignes d'allocation listées dans le résumé
+
+
+def yd_peak_rss_mb():
+    """Pic de mémoire résidente du process QGIS, en Mo (0 si indisponible)."""
+    if sys.platform == "win32":
+        try:
+            import ctypes
+            from ctypes import wintypes
+
+            class PROCESS_MEMORY_COUNTERS(ctypes.Structure):
+                _fields_ = [
+                    ("cb", wintypes.DWORD),
+                    ("PageFaultCount", wintypes.DWORD),
+                    ("PeakWorkingSetSize", ctypes.c_size_t),
+                    ("WorkingSetSize", ctypes.c_size_t),
+                    ("QuotaPeakPagedPoolUsage", ctypes.c_size_t),
+                    ("QuotaPagedPoolUsage", ctypes.c_size_t),
+                    ("QuotaPeakNonPagedPoolUsage", ctypes.c_size_t),
+                    ("QuotaNonPagedPoolUsage", ctypes.c_size_t),
+                    ("PagefileUsage", ctypes.c_size_t),
+                    ("PeakPagefileUsage", ctypes.c_size_t),
+                ]
+
+            counters = PROCESS_MEMORY_COUNTERS()
+            counters.cb = ctypes.sizeof(counters)
+            ctypes.windll.psapi.GetProcessMemoryInfo(
+                ctypes.windll.kernel32.GetCurrentProcess(),
+                ctypes.byref(counters),
+                counters.cb,
+            )
+            return counters.PeakWorkingSetSize / (1024.0 * 1024.0)
+        except Exception:
+            return 0.0
+
+    try:
+        import resource
+    except ImportError:
+        return 0.0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux : kilo-octets, macOS : octets
+    if sys.platform == "darwin":
+        return peak / (1024.0 * 1024.0)
+    return peak / 1024.0
+
+
+# ==============================================================
+# MESURES PAR ÉTAPE (JSON lines)
+# ==============================================================
+
+_local = threading.local()
+
+
+def yd_note_response(n_bytes, decode_s):
+    """Taille et temps de décodage JSON de la dernière réponse HTTP du thread."""
+    _local.response = (n_bytes, decode_s)
+
+
+def yd_take_response():
+    response = getattr(_local, "response", None)
+    _local.response = None
+    return response
+
+
+def yd_metrics_path(gpkg_path):
+    return os.path.splitext(gpkg_path)[0] + "_metrics.jsonl"
+
+
+def _percentile(values, q):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+class yd_Metrics:
+    """
+    Mesures par étape (thread-safe) : record(étape, secondes, octets, éléments)
+    cumule nombre, durées, octets et éléments par étape et écrit un événement
+    JSON par ligne ; close() écrit le résumé (latences p50 / p95, taux de hit
+    du cache, pic mémoire) puis, si profile=True, les rapports cProfile et
+    tracemalloc. Sans chemin, les lignes attendent attach(chemin).
+    """
+
+    def __init__(self, path=None, run=None, profile=None):
+        if profile is None:
+            profile = bool(os.environ.get(PROFILE_ENV))
+        self.profile = profile
+        self.run = dict(run or {}, started=datetime.now().isoformat(timespec="seconds"))
+        self._lock = threading.Lock()
+        self._t0 = time.perf_counter()
+        self._stages = {}
+        self._pending = [dict(self.run, event="run")]
+        self.path = None
+        self._file = None
+        self._profiler = None
+        if path:
+            self.attach(path)
+
+    def attach(self, path):
+        """Fichier de sortie (ajout) : les événements déjà mesurés y sont écrits."""
+        with self._lock:
+            if self._file is not None:
+                return
+            self.path = path
+            self._file = open(path, "a", encoding="utf-8")
+            for event in self._pending:
+                self._write(event)
+            self._pending = []
+
+    def _write(self, event):
+        line = json.dumps(event, ensure_ascii=False, default=str)
+        if self._file is None:
+            self._pending.append(event)
+        else:
+            self._file.write(line + "\n")
+
+    def record(self, stage, seconds=0.0, n_bytes=0, items=0, event=True, **fields):
+        with self._lock:
+            agg = self._stages.get(stage)
+            if agg is None:
+                agg = self._stages[stage] = {
+                    "n": 0, "s": 0.0, "max_s": 0.0, "bytes": 0, "items": 0, "lat": []
+                }
+            agg["n"] += 1
+            agg["s"] += seconds
+            agg["max_s"] = max(agg["max_s"], seconds)
+            agg["bytes"] += n_bytes
+            agg["items"] += items
+            agg["lat"].append(seconds)
+            if event:
+                ev = {"t": round(time.perf_counter() - self._t0, 4), "stage": stage,
+                      "s": round(seconds, 5)}
+                if n_bytes:
+                    ev["bytes"] = n_bytes
+                if items:
+                    ev["items"] = items
+                ev.update(fields)
+                self._write(ev)
+
+    @contextmanager
+    def stage(self, name, **fields):
+        """with metrics.stage("write") as m: ... ; m["items"] = n (optionnel)."""
+        info = {}
+        t = time.perf_counter()
+        try:
+            yield info
+        finally:
+            self.record(name, time.perf_counter() - t, info.pop("bytes", 0),
+                        info.pop("items", 0), **dict(fields, **info))
+
+    def profile_begin(self):
+        """Profilage du thread appelant (à appeler dans le thread de travail)."""
+        if not self.profile or self._profiler is not None:
+            return
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+        self._profiler = cProfile.Profile()
+        self._profiler.enable()
+
+    def _profile_end(self, summary):
+        if self._profiler is None:
+            return
+        self._profiler.disable()
+        base = os.path.splitext(self.path or "yd_inat")[0]
+        self._profiler.dump_stats(base + ".prof")
+        out = io.StringIO()
+        pstats.Stats(self._profiler, stream=out).sort_stats("cumulative").print_stats(PROFILE_TOP)
+        with open(base + "_profile.txt", "w", encoding="utf-8") as f:
+            f.write(out.getvalue())
+        summary["profile"] = base + ".prof"
+        if tracemalloc.is_tracing():
+            current, peak = tracemalloc.get_traced_memory()
+            top = tracemalloc.take_snapshot().statistics("lineno")[:TRACEMALLOC_TOP]
+            summary["tracemalloc"] = {
+                "current_mb": round(current / 1048576.0, 1),
+                "peak_mb": round(peak / 1048576.0, 1),
+                "top": [f"{stat.traceback} : {stat.size / 1024.0:.0f} Ko ({stat.count})"
+                        for stat in top],
+            }
+            tracemalloc.stop()
+        self._profiler = None
+
+    def summary(self):
+        with self._lock:
+            stages = {}
+            for name, agg in self._stages.items():
+                stages[name] = {
+                    "n": agg["n"],
+                    "s": round(agg["s"], 3),
+                    "mean_s": round(agg["s"] / agg["n"], 5),
+                    "p50_s": round(_percentile(agg["lat"], 0.5), 5),
+                    "p95_s": round(_percentile(agg["lat"], 0.95), 5),
+                    "max_s": round(agg["max_s"], 5),
+                    "bytes": agg["bytes"],
+                    "items": agg["items"],
+                }
+        hits = stages.get("cache_hit", {}).get("n", 0)
+        misses = sum(v["n"] for k, v in stages.items() if k.startswith("api:"))
+        return {
+            "event": "summary",
+            "total_s": round(time.perf_counter() - self._t0, 3),
+            "stages": stages,
+            "cache_hit_rate": round(hits / (hits + misses), 3) if hits + misses else None,
+            "peak_rss_mb": round(yd_peak_rss_mb(), 1),
+        }
+
+    def close(self, **extra):
+        """Écrit le résumé (+ extra, ex. stats du cache) et ferme le fichier."""
+        summary = self.summary()
+        summary.update(extra)
+        self._profile_end(summary)
+        with self._lock:
+            self._write(summary)
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+        return summary
+
+    def text(self):
+        """Résumé lisible (une ligne par étape) pour le journal."""
+        lines = []
+        for name, v in sorted(self.summary()["stages"].items()):
+            size = f", {v['bytes'] / 1048576.0:.1f} Mo" if v["bytes"] else ""
+            lines.append(f"⏱️ {name} : {v['n']} × {v['mean_s'] * 1000:.1f} ms "
+                         f"(p95 {v['p95_s'] * 1000:.1f} ms, total {v['s']:.1f}s{size})")
+        return "\n".join(lines)
+
+
+# Mesures nulles : mêmes méthodes, aucun effet (appelants sans mesures)
+class _yd_NoMetrics:
+    profile = False
+
+    def record(self, *args, **kwargs):
+        pass
+
+    @contextmanager
+    def stage(self, name, **fields):
+        yield {}
+
+    def profile_begin(self):
+        pass
+
+
+YD_NO_METRICS = _yd_NoMetrics()
+
+
+# ==============================================================
+# JOURNAL TEXTE (fichier gardé ouvert, une ligne horodatée par appel)
+# ==============================================================
+
+class yd_FileLog:
+    """log(msg) : console + fichier .log, ouvert une fois (écriture ligne à ligne)."""
+
+    def __init__(self, path, title=None):
+        self.path = path
+        self._file = open(path, "w", encoding="utf-8", buffering=1)
+        if title:
+            self._file.write(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] {title}\n")
+
+    def __call__(self, msg):
+        line = f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] {msg}"
+        print(line)
+        if self._file is not None:
+            self._file.write(line + "\n")
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
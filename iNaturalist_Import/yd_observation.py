@@ -0,0 +1,92 @@
+# ==============================================================
+# Plugin QGIS : iNaturalist Import
+# Module     : yd_observation
+# Version    : 1.0.0
+# Rôle       : Observation iNaturalist (JSON) → attributs de la couche
+# QGIS       : 3.40 (Bratislava)
+# ==============================================================
+
+from qgis.PyQt.QtCore import QVariant, QDateTime
+
+from .yd_columns import yd_large_photo_url, yd_compile_columns
+
+# Définition des champs non-photo : nom → (type, longueur)
+CHAMP_DEFS = {
+    "inat_id": (QVariant.LongLong, None),
+    "date_obs": (QVariant.DateTime, None),
+    "scientific_name": (QVariant.String, 100),
+    "vernacular_name_FR": (QVariant.String, 150),
+    "latitude": (QVariant.Double, None),
+    "longitude": (QVariant.Double, None),
+    "place_guess": (QVariant.String, 200),
+    "taxon_id": (QVariant.LongLong, None),
+    "taxon_rank": (QVariant.String, 30),
+    "url_obs": (QVariant.String, 200),
+    "url_taxon": (QVariant.String, 150),
+    "observateur_id": (QVariant.String, 50),
+    "observateur_name": (QVariant.String, 100),
+    "quality_grade": (QVariant.String, 20),
+    "precision": (QVariant.Int, None)
+}
+
+# Ordre global de référence
+BASE_ORDER = [
+    "inat_id",
+    "date_obs",
+    "scientific_name",
+    "vernacular_name_FR",
+    "latitude",
+    "longitude",
+    "place_guess",
+    "taxon_id",
+    "taxon_rank",
+    "url_obs",
+    "url_taxon",
+    "observateur_id",
+    "observateur_name",
+    "quality_grade",
+    "precision",
+]
+
+
+def yd_obs_coords(obs):
+    """(lon, lat) de l'observation, ou None si non géolocalisée."""
+    coords = (obs.get('geojson') or {}).get('coordinates')
+    if not coords:
+        return None
+    return coords[0], coords[1]
+
+
+def yd_photo_rows(obs):
+    """Lignes de la table des photos : (inat_id, position, url, license)."""
+    rows = []
+    position = 0
+    for p in obs.get('photos', []) or []:
+        if not p or not p.get('url'):
+            continue
+        position += 1
+        rows.append(
+            (obs.get('id'), position, yd_large_photo_url(p['url']), p.get('license_code'))
+        )
+    return rows
+
+
+def yd_photo_field_names(photo_mode, max_photos=0):
+    """Noms des champs photo ajoutés après ordered_fields."""
+    if photo_mode == "one":
+        return ["url_photo1"]
+    if photo_mode == "all":
+        return ["nb_photos"] + [f"url_photo{i}" for i in range(1, max_photos + 1)]
+    if photo_mode == "table":
+        return ["nb_photos"]
+    return []
+
+
+def yd_column_plan(ordered_fields, photo_mode):
+    """
+    Plan compilé une fois par import : row(obs, coords, max_photos) →
+    attributs dans l'ordre de la couche (ordered_fields puis champs photo).
+    """
+    return yd_compile_columns(
+        ordered_fields, photo_mode, QDateTime, QDateTime.currentDateTime
+    )
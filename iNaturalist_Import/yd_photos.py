@@ -0,0 +1,417 @@
+# ==============================================================
+# Plugin QGIS : iNaturalist Import
+# Module     : yd_photos
+# Version    : 1.0.0
+# Rôle       : Récolte des photos d'une couche iNat pour la consultation
+#              hors ligne : téléchargement concurrent (session HTTP à pool
+#              de connexions), cache adressé par contenu (SHA-256) dans le
+#              dossier iNat_photos à côté du GPKG, partagé par toutes les
+#              couches du dossier, borné en taille (éviction LRU) ; la
+#              couche reçoit le chemin local de chaque photo (photo_pathN)
+# QGIS       : 3.40 (Bratislava) — sqlite3 + requests, sans qgis.core
+# ==============================================================
+
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from .yd_api import TIMEOUT_S, USER_AGENT
+from .yd_fetch import yd_call_retry
+from .yd_gpkg import _q, yd_gpkg_functions
+from .yd_metrics import yd_Metrics, yd_metrics_path, yd_note_response
+from .yd_ratelimit import yd_RateLimiter
+
+# PARAMÈTRES
+PHOTO_WORKERS = 6                        # téléchargements simultanés
+PHOTO_DIR = "iNat_photos"                # dossier du cache, à côté du GPKG
+PHOTO_INDEX = "yd_photos.sqlite"         # index url → contenu, dans PHOTO_DIR
+PHOTO_MAX_BYTES = 2 * 1024 * 1024 * 1024  # taille max du cache (2 Go)
+PHOTO_RETRIES = 3
+PHOTO_EXTENSIONS = (".jpg", ".jpeg", ".png", ".gif", ".webp")
+
+# Colonnes des chemins locaux (relatifs au dossier du GPKG)
+PATH_PREFIX = "photo_path"   # modes one / all : photo_pathN en face de url_photoN
+PATH_COLUMN = "photo_path"   # mode table : colonne de <couche>_photos
+PATH_SQL_TYPE = "TEXT(120)"
+
+# Texte d'aide des cases « Télécharger les photos » (Scripts 1 et 5)
+YD_HARVEST_TOOLTIP = (
+    f"Photos are cached in {PHOTO_DIR} next to the GPKG, shared by all layers of the "
+    f"folder ({PHOTO_MAX_BYTES >> 30} GB max). When full, the least recently used photos are deleted: other "
+    "layers lose their local path and must be harvested again.\n"
+    f"Photos mises en cache dans {PHOTO_DIR} à côté du GPKG, partagé par toutes les "
+    f"couches du dossier ({PHOTO_MAX_BYTES >> 30} Go max). Une fois plein, les photos les moins récemment "
+    "utilisées sont supprimées : les autres couches perdent leur chemin local et "
+    "doivent être récoltées à nouveau."
+)
+
+# Serveur de médias distinct de l'API : limiteur propre, plus permissif
+yd_LIMITEUR_PHOTOS = yd_RateLimiter(rate=5.0, burst=10, min_rate=0.5, max_rate=10.0)
+
+_session_lock = threading.Lock()
+_session = None
+
+
+def _photo_session():
+    # Une session partagée, pool de connexions dimensionné pour les workers
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = requests.Session()
+            _session.headers["User-Agent"] = USER_AGENT
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=PHOTO_WORKERS * 2)
+            _session.mount("https://", adapter)
+            _session.mount("http://", adapter)
+        return _session
+
+
+def get_photo(url):
+    """GET d'une photo (octets) ; lève requests.HTTPError sur une erreur."""
+    resp = _photo_session().get(url, timeout=TIMEOUT_S)
+    resp.raise_for_status()
+    yd_note_response(len(resp.content), 0.0)
+    return resp.content
+
+
+def yd_photo_cache_dir(gpkg_path):
+    return os.path.join(os.path.dirname(os.path.abspath(gpkg_path)), PHOTO_DIR)
+
+
+def _extension(url):
+    ext = os.path.splitext(urlsplit(url).path)[1].lower()
+    return ext if ext in PHOTO_EXTENSIONS else ".jpg"
+
+
+class yd_PhotoCache:
+    """
+    Fichiers nommés par leur SHA-256 (ab/abcdef….jpg) : une photo servie
+    sous deux URL, ou importée par deux couches, n'est stockée qu'une fois.
+    Index SQLite url → sha et sha → taille / dernier accès (LRU).
+    evict(pinned) ramène le cache sous max_bytes sans toucher aux fichiers
+    épinglés (ceux de la couche en cours) ; les autres couches du dossier
+    peuvent y perdre des photos (yd_forget_photos). Utilisable depuis les workers.
+    """
+
+    def __init__(self, cache_dir, max_bytes=PHOTO_MAX_BYTES):
+        self.dir = cache_dir
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+        self._conn = sqlite3.connect(os.path.join(cache_dir, PHOTO_INDEX),
+                                     check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS blobs ("
+            " sha TEXT PRIMARY KEY,"
+            " ext TEXT NOT NULL,"
+            " size INTEGER NOT NULL,"
+            " last_access REAL NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS urls ("
+            " url TEXT PRIMARY KEY,"
+            " sha TEXT NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS blobs_lru ON blobs(last_access)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS urls_sha ON urls(sha)")
+        self._conn.commit()
+        self._size = self._conn.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM blobs"
+        ).fetchone()[0]
+
+    @staticmethod
+    def relpath(sha, ext):
+        return f"{sha[:2]}/{sha}{ext}"
+
+    def lookup(self, urls):
+        """{url: (sha, chemin relatif)} des URL déjà en cache (fichier présent)."""
+        found = {}
+        now = time.time()
+        urls = list(urls)
+        with self._lock:
+            for start in range(0, len(urls), 500):
+                chunk = urls[start:start + 500]
+                rows = self._conn.execute(
+                    "SELECT u.url, b.sha, b.ext FROM urls u JOIN blobs b ON b.sha = u.sha "
+                    f"WHERE u.url IN ({', '.join('?' * len(chunk))})", chunk
+                ).fetchall()
+                for url, sha, ext in rows:
+                    rel = self.relpath(sha, ext)
+                    if os.path.exists(os.path.join(self.dir, rel)):
+                        found[url] = (sha, rel)
+            self._conn.executemany(
+                "UPDATE blobs SET last_access = ? WHERE sha = ?",
+                [(now, sha) for sha, _ in found.values()],
+            )
+            self._conn.commit()
+        return found
+
+    def store(self, url, content):
+        """Enregistre le contenu d'une URL ; renvoie (sha, chemin relatif)."""
+        sha = hashlib.sha256(content).hexdigest()
+        ext = _extension(url)
+        with self._lock:
+            row = self._conn.execute("SELECT ext FROM blobs WHERE sha = ?", (sha,)).fetchone()
+            if row is not None:
+                ext = row[0]
+        rel = self.relpath(sha, ext)
+        path = os.path.join(self.dir, rel)
+        if not os.path.exists(path):
+            # Écriture hors verrou (workers en parallèle), remplacement atomique
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp = f"{path}.{threading.get_ident()}.tmp"
+            with open(tmp, "wb") as f:
+                f.write(content)
+            os.replace(tmp, path)
+        now = time.time()
+        with self._lock:
+            if row is None:
+                cur = self._conn.execute(
+                    "INSERT OR IGNORE INTO blobs (sha, ext, size, last_access) VALUES (?, ?, ?, ?)",
+                    (sha, ext, len(content), now),
+                )
+                self._size += len(content) if cur.rowcount else 0
+            else:
+                self._conn.execute("UPDATE blobs SET last_access = ? WHERE sha = ?", (now, sha))
+            self._conn.execute("INSERT OR REPLACE INTO urls (url, sha) VALUES (?, ?)", (url, sha))
+            self._conn.commit()
+        return sha, rel
+
+    def evict(self, pinned=()):
+        """
+        LRU : libère jusqu'à 90 % de la taille max ; renvoie les chemins
+        relatifs des fichiers supprimés (voir yd_forget_photos).
+        """
+        if self._size <= self.max_bytes:
+            return []
+        target = int(self.max_bytes * 0.9)
+        pinned = set(pinned)
+        freed = 0
+        with self._lock:
+            evicted = []
+            for sha, ext, size in self._conn.execute(
+                "SELECT sha, ext, size FROM blobs ORDER BY last_access"
+            ).fetchall():
+                if self._size - freed <= target:
+                    break
+                if sha in pinned:
+                    continue
+                evicted.append((sha, self.relpath(sha, ext)))
+                freed += size
+                try:
+                    os.remove(os.path.join(self.dir, evicted[-1][1]))
+                except OSError:
+                    pass
+            self._conn.executemany("DELETE FROM urls WHERE sha = ?", [(sha,) for sha, _ in evicted])
+            self._conn.executemany("DELETE FROM blobs WHERE sha = ?", [(sha,) for sha, _ in evicted])
+            self._conn.commit()
+            self._size -= freed
+        return [rel for _, rel in evicted]
+
+    def size(self):
+        return self._size
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def _url_columns(conn, layer_name, photo_mode):
+    """[(table, colonne url, colonne chemin)] selon le mode photo de la couche."""
+    if photo_mode == "table":
+        return [(f"{layer_name}_photos", "url", PATH_COLUMN)]
+    cols = [row[1] for row in conn.execute(f"PRAGMA table_info({_q(layer_name)})")]
+    pairs = []
+    for col in cols:
+        if col.startswith("url_photo"):
+            pairs.append((layer_name, col, PATH_PREFIX + col[len("url_photo"):]))
+    return pairs
+
+
+def yd_forget_photos(gpkg_dir, paths, log=print):
+    """
+    Efface (NULL) les photo_pathN / photo_path qui désignent des fichiers
+    supprimés du cache, dans toutes les couches des GPKG du dossier (le cache
+    est partagé) : le formulaire n'affiche plus d'image cassée et la
+    prochaine récolte de la couche les retélécharge.
+    paths : chemins relatifs au cache (yd_PhotoCache.evict).
+    Renvoie {(fichier GPKG, couche): nombre de chemins effacés}.
+    """
+    paths = [f"{PHOTO_DIR}/{rel}" for rel in paths]
+    lost = {}
+    if not paths:
+        return lost
+    for name in sorted(os.listdir(gpkg_dir)):
+        if not name.lower().endswith(".gpkg"):
+            continue
+        try:
+            conn = sqlite3.connect(os.path.join(gpkg_dir, name), timeout=5)
+        except sqlite3.Error:
+            continue
+        try:
+            # Triggers R-tree des couches : fonctions ST_* requises par l'UPDATE
+            yd_gpkg_functions(conn)
+            tables = [row[0] for row in conn.execute("SELECT table_name FROM gpkg_contents")]
+            conn.execute("CREATE TEMP TABLE yd_photo_gone (path TEXT PRIMARY KEY)")
+            conn.executemany("INSERT OR IGNORE INTO yd_photo_gone VALUES (?)",
+                             ((p,) for p in paths))
+            for table in tables:
+                cols = [row[1] for row in conn.execute(f"PRAGMA table_info({_q(table)})")
+                        if row[1].startswith(PATH_PREFIX)]
+                n = 0
+                for col in cols:
+                    n += conn.execute(
+                        f"UPDATE {_q(table)} SET {_q(col)} = NULL "
+                        f"WHERE {_q(col)} IN (SELECT path FROM yd_photo_gone)"
+                    ).rowcount
+                if n:
+                    lost[(name, table)] = n
+            conn.commit()
+        except sqlite3.Error as e:
+            # GPKG non conforme, ou verrouillé par une édition en cours
+            log(f"⚠️ {name} : chemins des photos supprimées non effacés ({e})")
+        finally:
+            conn.close()
+    for (name, table), n in lost.items():
+        log(f"⚠️ {table} ({name}) : {n} photos locales supprimées du cache — "
+            "relancer la récolte de cette couche pour les retélécharger")
+    return lost
+
+
+def yd_has_photo_paths(gpkg_path, layer_name, photo_mode):
+    """True si la couche a déjà reçu des chemins locaux (récolte antérieure)."""
+    conn = sqlite3.connect(gpkg_path)
+    try:
+        for table, _, path_col in _url_columns(conn, layer_name, photo_mode):
+            cols = [row[1] for row in conn.execute(f"PRAGMA table_info({_q(table)})")]
+            if path_col in cols:
+                return True
+        return False
+    finally:
+        conn.close()
+
+
+def yd_harvest_photos(gpkg_path, layer_name, photo_mode, workers=PHOTO_WORKERS,
+                      max_bytes=PHOTO_MAX_BYTES, progress=None, is_canceled=None,
+                      log=print, metrics=None):
+    """
+    Télécharge les photos référencées par la couche (url_photoN, ou url de la
+    table <couche>_photos) dans le cache du dossier du GPKG, puis écrit dans
+    photo_pathN / photo_path le chemin relatif au dossier du GPKG
+    (iNat_photos/ab/….jpg). Les photos déjà en cache ne sont pas
+    retéléchargées. À appeler GPKG fermé par l'import (tâche de fond, CLI).
+    Si le cache dépasse sa taille, les photos les moins récemment utilisées
+    par les autres couches du dossier sont supprimées et leurs chemins
+    effacés (yd_forget_photos).
+    Renvoie {n_urls, n_cached, n_downloaded, n_errors, bytes, canceled, lost}.
+    """
+    is_canceled = is_canceled or (lambda: False)
+    run_metrics = None
+    if metrics is None:
+        metrics = run_metrics = yd_Metrics(yd_metrics_path(gpkg_path),
+                                           run={"layer_name": layer_name, "step": "photos"})
+        metrics.profile_begin()
+    result = {"n_urls": 0, "n_cached": 0, "n_downloaded": 0, "n_errors": 0, "bytes": 0,
+              "canceled": False, "lost": {}}
+    if photo_mode not in ("one", "all", "table"):
+        log("ℹ️ Couche sans photos : rien à récolter")
+        return result
+
+    conn = sqlite3.connect(gpkg_path)
+    yd_gpkg_functions(conn)
+    cache = yd_PhotoCache(yd_photo_cache_dir(gpkg_path), max_bytes)
+    try:
+        pairs = _url_columns(conn, layer_name, photo_mode)
+        urls = set()
+        for table, url_col, _ in pairs:
+            urls.update(row[0] for row in conn.execute(
+                f"SELECT DISTINCT {_q(url_col)} FROM {_q(table)} "
+                f"WHERE {_q(url_col)} IS NOT NULL AND {_q(url_col)} != ''"
+            ))
+        result["n_urls"] = len(urls)
+
+        with metrics.stage("photo_lookup") as m:
+            local = cache.lookup(urls)
+            m["items"] = len(local)
+        result["n_cached"] = len(local)
+        todo = sorted(urls - set(local))
+        log(f"📷 {len(urls)} photos : {len(local)} déjà en cache, {len(todo)} à télécharger "
+            f"({workers} simultanés)")
+
+        def download(url):
+            if is_canceled():
+                return url, None, None
+            try:
+                content = yd_call_retry(get_photo, retries=PHOTO_RETRIES, log=log,
+                                        limiter=yd_LIMITEUR_PHOTOS, metrics=metrics, url=url)
+            except Exception as e:
+                return url, None, e
+            with metrics.stage("photo_store") as m:
+                m["bytes"] = len(content)
+                stored = cache.store(url, content)
+            return url, stored, len(content)
+
+        done = 0
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+            futures = [pool.submit(download, url) for url in todo]
+            for future in as_completed(futures):
+                url, stored, info = future.result()
+                done += 1
+                if stored is not None:
+                    local[url] = stored
+                    result["n_downloaded"] += 1
+                    result["bytes"] += info
+                elif info is not None:
+                    result["n_errors"] += 1
+                    log(f"⚠️ Photo non téléchargée : {url} ({info})")
+                if progress is not None and todo:
+                    progress(100.0 * done / len(todo))
+        result["canceled"] = is_canceled()
+
+        # Chemins locaux : table temporaire url → chemin, une mise à jour par colonne
+        with metrics.stage("photo_paths") as m:
+            conn.execute("CREATE TEMP TABLE yd_photo_map (url TEXT PRIMARY KEY, path TEXT)")
+            conn.executemany(
+                "INSERT INTO yd_photo_map VALUES (?, ?)",
+                ((url, f"{PHOTO_DIR}/{rel}") for url, (_, rel) in local.items()),
+            )
+            for table, url_col, path_col in pairs:
+                cols = [row[1] for row in conn.execute(f"PRAGMA table_info({_q(table)})")]
+                if path_col not in cols:
+                    conn.execute(f"ALTER TABLE {_q(table)} ADD COLUMN {_q(path_col)} "
+                                 f"{PATH_SQL_TYPE}")
+                conn.execute(
+                    f"UPDATE {_q(table)} SET {_q(path_col)} = "
+                    f"(SELECT path FROM yd_photo_map WHERE url = {_q(table)}.{_q(url_col)})"
+                )
+            conn.commit()
+            m["items"] = len(local)
+
+        size = cache.size()
+        evicted = cache.evict(pinned=(sha for sha, _ in local.values()))
+        if evicted:
+            log(f"🧹 Cache photos : {len(evicted)} photos, "
+                f"{(size - cache.size()) / 1048576.0:.0f} Mo libérés (LRU)")
+            # Autres couches du dossier qui référençaient ces fichiers
+            result["lost"] = yd_forget_photos(os.path.dirname(os.path.abspath(gpkg_path)),
+                                              evicted, log=log)
+        if cache.size() > max_bytes:
+            log(f"⚠️ Cache photos au-delà de sa taille max ({cache.size() / 1048576.0:.0f} Mo) : "
+                "photos de cette couche conservées")
+    finally:
+        cache.close()
+        conn.close()
+        if run_metrics is not None:
+            run_metrics.close()
+
+    log(f"✅ Photos : {result['n_downloaded']} téléchargées "
+        f"({result['bytes'] / 1048576.0:.1f} Mo), {result['n_cached']} en cache, "
+        f"{result['n_errors']} erreurs — {yd_LIMITEUR_PHOTOS.stats()}")
+    return result
@@ -19,6 +19,15 @@ from .yd_Script_1 import yd_run as yd_run_script_1
 # Script 2
 from .yd_Script_2 import yd_run as yd_run_script_2
 
+# Script 3
+from .yd_Script_3 import yd_run as yd_run_script_3
+
+# Script 4
+from .yd_Script_4 import yd_run as yd_run_script_4
+
+# Script 5
+from .yd_Script_5 import yd_run as yd_run_script_5
+
 
 class yd_iNaturalistImportPlugin:
 
@@ -56,10 +65,43 @@ class yd_iNaturalistImportPlugin:
             lambda: yd_run_script_2(self.iface)
         )
 
+        # Action 3 : Script Mise à jour (même icône que l'import)
+        action_3 = QAction(
+            QIcon(icon_1_path),
+            "yd Script 3 – Mise à jour iNaturalist",
+            self.iface.mainWindow()
+        )
+        action_3.triggered.connect(
+            lambda: yd_run_script_3(self.iface)
+        )
+
+        # Action 4 : Reprise du dernier import interrompu (même icône que l'import)
+        action_4 = QAction(
+            QIcon(icon_1_path),
+            "yd Script 4 – Reprendre le dernier import",
+            self.iface.mainWindow()
+        )
+        action_4.triggered.connect(
+            lambda: yd_run_script_4(self.iface)
+        )
+
+        # Action 5 : Import par lot depuis la couche active (même icône que l'import)
+        action_5 = QAction(
+            QIcon(icon_1_path),
+            "yd Script 5 – Import par lot (couche de sites)",
+            self.iface.mainWindow()
+        )
+        action_5.triggered.connect(
+            lambda: yd_run_script_5(self.iface)
+        )
+
         self.iface.addToolBarIcon(action_1)
         self.iface.addToolBarIcon(action_2)
+        self.iface.addToolBarIcon(action_3)
+        self.iface.addToolBarIcon(action_4)
+        self.iface.addToolBarIcon(action_5)
 
-        self.actions.extend([action_1, action_2])
+        self.actions.extend([action_1, action_2, action_3, action_4, action_5])
 
     def unload(self):
         for action in self.actions:
@@ -0,0 +1,132 @@
+# ==============================================================
+# Plugin QGIS : iNaturalist Import
+# Module     : yd_ratelimit
+# Version    : 1.1.0
+# Rôle       : Limiteur de débit (token bucket) partagé par les appels API,
+#              débit adaptatif (AIMD) et respect de Retry-After
+# QGIS       : 3.40 (Bratislava)
+# ==============================================================
+
+import threading
+import time
+from email.utils import parsedate_to_datetime
+
+# PARAMÈTRES
+# iNaturalist demande de rester autour de 60 requêtes / minute
+# (refus au-delà de 100 / minute).
+REQUETES_PAR_SECONDE = 1.0
+RAFALE = 4
+# AIMD : +DEBIT_PAS req/s par succès jusqu'à DEBIT_MAX, débit × DEBIT_FACTEUR sur 429
+DEBIT_MIN = 0.2
+DEBIT_MAX = 1.5
+DEBIT_PAS = 0.02
+DEBIT_FACTEUR = 0.5
+# Pause appliquée sur 429 sans en-tête Retry-After
+PAUSE_429_S = 10.0
+PAUSE_MAX_S = 300.0
+
+
+def yd_retry_after(e):
+    """Délai Retry-After (secondes) de la réponse HTTP d'une exception, ou None."""
+    headers = getattr(getattr(e, 'response', None), 'headers', None)
+    value = headers.get("Retry-After") if headers else None
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        # Forme date HTTP : "Wed, 21 Oct 2026 07:28:00 GMT"
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class yd_RateLimiter:
+    """
+    Token bucket thread-safe : acquire() bloque jusqu'à obtenir un jeton.
+    Débit AIMD : success() l'augmente doucement, throttled() le divise
+    et suspend tous les appels (Retry-After) ; stats() résume les attentes.
+    """
+
+    def __init__(self, rate=REQUETES_PAR_SECONDE, burst=RAFALE,
+                 min_rate=DEBIT_MIN, max_rate=DEBIT_MAX):
+        self.rate = float(rate)
+        self.burst = float(burst)
+        self.min_rate = float(min_rate)
+        self.max_rate = max(float(max_rate), self.rate)
+        self._tokens = float(burst)
+        self._last = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.calls = 0
+        self.waits = 0
+        self.wait_s = 0.0
+        self.throttles = 0
+
+    def _refill(self, now):
+        elapsed = now - self._last
+        if elapsed > 0:
+            self._tokens = min(self.burst, self._tokens + elapsed * self.rate)
+            self._last = now
+
+    def acquire(self):
+        start = time.monotonic()
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    wait = self._paused_until - now
+                else:
+                    self._refill(now)
+                    if self._tokens >= 1.0:
+                        self._tokens -= 1.0
+                        waited = now - start
+                        self.calls += 1
+                        if waited > 0.001:
+                            self.waits += 1
+                            self.wait_s += waited
+                        return
+                    wait = (1.0 - self._tokens) / self.rate
+            time.sleep(wait)
+
+    def success(self):
+        # Augmentation additive
+        with self._lock:
+            self.rate = min(self.max_rate, self.rate + DEBIT_PAS)
+
+    def throttled(self, retry_after=None):
+        """429 reçu : débit divisé, jetons vidés, pause de tous les appels."""
+        pause = PAUSE_429_S if retry_after is None else min(PAUSE_MAX_S, retry_after)
+        with self._lock:
+            now = time.monotonic()
+            self.throttles += 1
+            self.rate = max(self.min_rate, self.rate * DEBIT_FACTEUR)
+            self._tokens = 0.0
+            self._last = now + pause
+            self._paused_until = max(self._paused_until, now + pause)
+        return pause
+
+    def snapshot(self):
+        """Compteurs à un instant donné, pour stats(since=...) d'un seul run."""
+        with self._lock:
+            return (self.calls, self.wait_s, self.throttles)
+
+    def stats(self, since=None):
+        # Instance partagée par des runs concurrents : pas de remise à zéro,
+        # différence avec l'instantané pris au début du run
+        calls, wait_s, throttles = self.snapshot()
+        if since is not None:
+            calls, wait_s, throttles = calls - since[0], wait_s - since[1], throttles - since[2]
+        mean = wait_s / calls if calls else 0.0
+        return (f"Limiteur : {calls} appels, attente {wait_s:.1f}s "
+                f"({mean:.2f}s/appel), {throttles} × 429, "
+                f"débit {self.rate:.2f} req/s")
+
+
+# Instance partagée par tout le process (toutes les couches, tous les threads)
+yd_LIMITEUR = yd_RateLimiter()
@@ -0,0 +1,293 @@
+# ==============================================================
+# Plugin QGIS : iNaturalist Import
+# Module     : yd_taxa
+# Version    : 1.0.0
+# Rôle       : Résolution taxonomique sans QGIS : taxons et ancêtres par
+#              requêtes groupées à l'API (référentiel persistant d'abord),
+#              ou hors ligne depuis l'archive DwC-A → taxo_map des 7 rangs
+#              Utilisé par yd_taxonomy (couches) et les tests
+# QGIS       : 3.40 (Bratislava) — sans qgis
+# ==============================================================
+
+import time
+
+from .yd_fetch import _status, yd_call_retry
+from .yd_metrics import YD_NO_METRICS
+from .yd_ratelimit import yd_LIMITEUR
+
+# PARAMÈTRES
+TAX_FIELDS = ["kingdom", "phylum", "class", "order", "family", "genus", "species"]
+
+# Throttling : limiteur partagé (yd_ratelimit), tentatives sur 429 / 5xx
+MAX_RETRIES_429 = 3
+# GET /taxa/{id,id,...} : 30 taxons au plus par requête
+TAXA_BATCH = 30
+# rank_level iNaturalist des rangs écrits (les rangs intermédiaires s'intercalent)
+RANK_LEVELS = {"kingdom": 70, "phylum": 60, "class": 50, "order": 40,
+               "family": 30, "genus": 20, "species": 10}
+LIFE_TAXON_ID = 48460   # racine « Life », jamais écrite
+
+
+def _taxon_info(t):
+    rank = t.get("rank")
+    return {
+        "rank": rank,
+        "rank_level": t.get("rank_level", RANK_LEVELS.get(rank)),
+        "name": t.get("name"),
+        "ancestor_ids": t.get("ancestor_ids") or [],
+        "common_name": t.get("preferred_common_name"),
+    }
+
+
+def yd_fetch_taxa(get_taxa, ids, taxon_cache, log=print, is_canceled=None,
+                  on_batch=None, metrics=None, store=None, refresh=False):
+    """
+    Remplit taxon_cache {id: {"rank", "rank_level", "name", "ancestor_ids",
+    "common_name"} ou None} pour les ids absents : référentiel persistant
+    store (yd_taxo_store) d'abord, sauf refresh=True, puis API par requêtes
+    groupées de TAXA_BATCH ids
+    (get_taxa_by_id(taxon_id=[...]) ou équivalent). Un lot refusé (erreur
+    HTTP 4xx hors 429) est redécoupé en deux pour isoler l'id fautif ; toute
+    autre erreur (réseau, 5xx, 429 après les tentatives) interrompt la
+    résolution et est relevée. Les ancêtres détaillés
+    (clé "ancestors") fournis par l'API sont mis en cache au passage.
+    Les taxons reçus de l'API sont ajoutés au référentiel.
+    on_batch(nb_traités, total, id) après chaque lot. Renvoie le nombre
+    d'ids sans résultat.
+    """
+    metrics = metrics or YD_NO_METRICS
+    unique = list(dict.fromkeys(ids))
+    missing = [tid for tid in unique if tid not in taxon_cache]
+    n_hits = len(unique) - len(missing)
+    if n_hits > 0:
+        metrics.record("taxon_cache_hit", items=n_hits, event=False)
+    if store is not None and missing and not refresh:
+        t = time.perf_counter()
+        known = store.get_many(missing)
+        metrics.record("taxon_store_hit", time.perf_counter() - t, items=len(known),
+                       event=False)
+        taxon_cache.update(known)
+        missing = [tid for tid in missing if tid not in known]
+    received = {}
+
+    def fetch(group):
+        try:
+            resp = yd_call_retry(get_taxa, retries=MAX_RETRIES_429, metrics=metrics,
+                                 log=log, taxon_id=list(group))
+        except Exception as e:
+            status = _status(e)
+            if status is None or status == 429 or not 400 <= status < 500:
+                # Réseau, 5xx, 429 : tentatives déjà épuisées par yd_call_retry,
+                # redécouper le lot referait les mêmes attentes pour chaque moitié
+                log(f"❌ API /taxa indisponible ({e}) : résolution interrompue")
+                raise
+            if len(group) > 1:
+                # Erreur client (id refusé) : on isole l'id fautif
+                half = len(group) // 2
+                fetch(group[:half])
+                fetch(group[half:])
+                return
+            log(f"❌ HTTP {status} pour taxon_id={group[0]} : {e}")
+            resp = None
+        for t in (resp or {}).get("results", []) or []:
+            taxon_cache[t.get("id")] = received[t.get("id")] = _taxon_info(t)
+            for a in t.get("ancestors") or []:
+                if a.get("id") is not None and not taxon_cache.get(a["id"]):
+                    taxon_cache[a["id"]] = received[a["id"]] = _taxon_info(a)
+        for tid in group:
+            taxon_cache.setdefault(tid, None)
+
+    done = 0
+    try:
+        for i in range(0, len(missing), TAXA_BATCH):
+            if is_canceled is not None and is_canceled():
+                break
+            group = missing[i:i + TAXA_BATCH]
+            fetch(group)
+            done += len(group)
+            if on_batch is not None:
+                on_batch(done, len(missing), group[-1])
+    finally:
+        # Même interrompue, la résolution garde ce qui a été reçu
+        if store is not None:
+            store.put_many(received)
+    return sum(1 for tid in missing[:done] if taxon_cache.get(tid) is None)
+
+
+def _ancestor_gaps(tid, taxon_cache):
+    """
+    Ancêtres inconnus de tid qui peuvent porter un rang manquant de
+    TAX_FIELDS : la chaîne racine → feuille est découpée par les ancêtres
+    déjà connus (rank_level) ; une suite d'inconnus n'est retenue que si
+    un rang manquant s'intercale entre ses deux bornes.
+    """
+    info = taxon_cache[tid]
+    chain = [a for a in info["ancestor_ids"] if a not in (tid, LIFE_TAXON_ID)]
+    own = info.get("rank_level") or 0
+    found = {taxon_cache[a].get("rank") for a in chain if taxon_cache.get(a)}
+    missing = [level for rank, level in RANK_LEVELS.items()
+               if rank not in found and level > own]
+    gaps = set()
+    upper, run = 100, []
+    for a in chain + [None]:
+        if a is not None and a not in taxon_cache:
+            run.append(a)
+            continue
+        level = own if a is None else (taxon_cache[a] or {}).get("rank_level")
+        if level is None:
+            continue   # sans résultat ou sans rank_level : pas une borne
+        if run and any(level < m < upper for m in missing):
+            gaps.update(run)
+        upper, run = level, []
+    return gaps
+
+
+def yd_plan_ancestors(get_taxa, taxa, taxon_cache, log=print, is_canceled=None,
+                      on_batch=None, metrics=None, store=None, refresh=False):
+    """
+    Résout en un seul tour les ancêtres utiles des taxons (déjà dans
+    taxon_cache) : référentiel store d'abord (sauf refresh), puis, pour
+    chaque taxon, seuls les ancêtres inconnus situés là où un rang manquant
+    de TAX_FIELDS peut se trouver (_ancestor_gaps), tous taxons confondus
+    et dédoublonnés, en requêtes groupées. Les ancêtres détaillés renvoyés
+    par l'API avec les taxons (clé "ancestors") évitent souvent ce tour.
+    store / refresh : cf. yd_fetch_taxa. Renvoie le nombre d'ancêtres demandés.
+    """
+    layer = [tid for tid in dict.fromkeys(taxa) if taxon_cache.get(tid)]
+    if store is not None and not refresh:
+        unknown = {a for tid in layer for a in taxon_cache[tid]["ancestor_ids"]
+                   if a not in taxon_cache}
+        if unknown:
+            taxon_cache.update(store.get_many(unknown))
+    step = set()
+    for tid in layer:
+        step.update(_ancestor_gaps(tid, taxon_cache))
+    if step and not (is_canceled is not None and is_canceled()):
+        # refresh=True : le référentiel vient d'être lu pour ces ids
+        yd_fetch_taxa(get_taxa, sorted(step), taxon_cache, log=log, is_canceled=is_canceled,
+                      on_batch=on_batch, metrics=metrics, store=store, refresh=True)
+    return len(step)
+
+
+def yd_build_taxonomy(get_taxa, taxa, log=print, on_taxon=None, is_canceled=None,
+                      metrics=None, store=None, refresh=False):
+    """
+    taxo_map {taxon_id: {rang: nom}} pour les 7 rangs de TAX_FIELDS,
+    via l'API (requêtes groupées, cf. yd_fetch_taxa, + limiteur partagé) :
+    tous les taxons de la couche, puis leurs ancêtres utiles en un tour
+    (yd_plan_ancestors), enfin toutes les lignes de taxo_map en une passe.
+    store (yd_TaxonStore) : référentiel persistant lu avant l'API, sauf
+    refresh=True (taxons redemandés puis mis à jour).
+    Renvoie (taxo_map, errors).
+    on_taxon(courant, total, tid), is_canceled() et metrics (yd_Metrics)
+    sont optionnels.
+    """
+    metrics = metrics or YD_NO_METRICS
+    limiter_snap = yd_LIMITEUR.snapshot()
+    store_snap = store.snapshot() if store is not None else None
+    taxon_cache = {}  # id -> {"rank", "rank_level", "name", "ancestor_ids", "common_name"}
+    taxo_map = {}
+    errors = 0
+
+    def canceled():
+        if is_canceled is not None and is_canceled():
+            log("⚠️ Traitement taxonomique annulé par l'utilisateur.")
+            return True
+        return False
+
+    t = time.perf_counter()
+    yd_fetch_taxa(get_taxa, taxa, taxon_cache, log=log, is_canceled=is_canceled,
+                  on_batch=on_taxon, metrics=metrics, store=store, refresh=refresh)
+    n_layer = len(taxon_cache)
+    n_asked = 0
+    if not canceled():
+        n_asked = yd_plan_ancestors(get_taxa, taxa, taxon_cache, log=log,
+                                    is_canceled=is_canceled, on_batch=on_taxon,
+                                    metrics=metrics, store=store, refresh=refresh)
+        log(f"🌳 {len(taxon_cache) - n_layer} ancêtres résolus, "
+            f"{n_asked} demandés à l'API en un tour")
+    metrics.record("taxa_fetch", time.perf_counter() - t, items=len(taxon_cache),
+                   event=False, rounds=1 if n_asked else 0)
+    if canceled():
+        return taxo_map, errors
+
+    for tid in taxa:
+        info = taxon_cache.get(tid)
+        if not info:
+            log(f"⚠️ Aucun résultat pour taxon_id={tid}")
+            errors += 1
+            taxo_map[tid] = {field: "" for field in TAX_FIELDS}
+            continue
+
+        rank_to_name = {}
+        for aid in info["ancestor_ids"]:
+            ainfo = taxon_cache.get(aid)
+            if not ainfo:
+                continue
+            r = ainfo.get("rank")
+            n = ainfo.get("name")
+            if r and n and r in TAX_FIELDS and r not in rank_to_name:
+                rank_to_name[r] = n
+
+        if info["rank"] in TAX_FIELDS and info["name"]:
+            rank_to_name[info["rank"]] = info["name"]
+
+        taxo_map[tid] = {field: rank_to_name.get(field, "") for field in TAX_FIELDS}
+
+    if store is not None:
+        log(f"🗄️ {store.stats(since=store_snap)}")
+    log(f"⏱️ {yd_LIMITEUR.stats(since=limiter_snap)}")
+    return taxo_map, errors
+
+
+def yd_build_taxonomy_offline(store, taxa, log=print, on_taxon=None, is_canceled=None,
+                              metrics=None):
+    """
+    Même résultat que yd_build_taxonomy, sans réseau : les taxons et leurs
+    parents sont lus dans la taxonomie DwC-A importée dans store
+    (yd_TaxonStore.import_dwca), un niveau de parenté par requête.
+    Renvoie (taxo_map, errors) ; errors = taxons absents de l'archive.
+    """
+    metrics = metrics or YD_NO_METRICS
+    taxo_map = {}
+    errors = 0
+    if store.offline_info() is None:
+        log("❌ Aucune taxonomie hors ligne : importer d'abord l'archive DwC-A")
+        return taxo_map, len(taxa)
+
+    t = time.perf_counter()
+    nodes = {}   # id -> (parent_id, rang, nom, nom vernaculaire)
+    pending = set(taxa)
+    rounds = 0
+    while pending:
+        if is_canceled is not None and is_canceled():
+            log("⚠️ Traitement taxonomique annulé par l'utilisateur.")
+            return taxo_map, errors
+        found = store.offline_lookup(sorted(pending))
+        nodes.update(found)
+        rounds += 1
+        if on_taxon is not None and found:
+            on_taxon(sum(1 for tid in taxa if tid in nodes), len(taxa), max(found))
+        pending = {
+            parent for parent, *_ in found.values()
+            if parent and parent not in nodes and parent != LIFE_TAXON_ID
+        }
+    metrics.record("taxa_offline", time.perf_counter() - t, items=len(nodes),
+                   event=False, rounds=rounds)
+    log(f"🌳 {len(nodes)} taxons lus hors ligne en {rounds} niveaux")
+
+    for tid in taxa:
+        if tid not in nodes:
+            log(f"⚠️ taxon_id={tid} absent de la taxonomie hors ligne")
+            errors += 1
+            taxo_map[tid] = {field: "" for field in TAX_FIELDS}
+            continue
+        rank_to_name = {}
+        node = tid
+        while node in nodes:
+            parent, rank, name, _common = nodes[node]
+            if rank in TAX_FIELDS and name and rank not in rank_to_name:
+                rank_to_name[rank] = name
+            node = parent
+        taxo_map[tid] = {field: rank_to_name.get(field, "") for field in TAX_FIELDS}
+    return taxo_map, errors
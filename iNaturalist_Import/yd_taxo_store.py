@@ -0,0 +1,287 @@
+# ==============================================================
+# Plugin QGIS : iNaturalist Import
+# Module     : yd_taxo_store
+# Version    : 1.0.0
+# Rôle       : Référentiel taxonomique persistant (SQLite) partagé par
+#              toutes les couches et toutes les sessions : taxon_id →
+#              rang, nom, ancêtres, nom vernaculaire (TTL, éviction LRU)
+#              + taxonomie complète hors ligne importée de l'archive
+#              DwC-A publiée par iNaturalist (inaturalist-taxonomy.dwca.zip)
+# QGIS       : 3.40 (Bratislava)
+# ==============================================================
+
+import csv
+import io
+import os
+import sqlite3
+import sys
+import threading
+import time
+import zipfile
+from datetime import datetime
+
+from .yd_cache import CACHE_DIR
+
+# PARAMÈTRES
+TAXO_FILE = "yd_taxonomie.sqlite"
+TAXO_TTL_S = 30 * 24 * 3600     # un taxon est redemandé après 30 jours
+TAXO_MAX_ROWS = 500000          # taxons gardés au plus (les moins utilisés partent)
+_SQL_VARS = 500                 # ids par requête IN (...)
+
+# Archive DwC-A : https://www.inaturalist.org/taxa/inaturalist-taxonomy.dwca.zip
+DWCA_TAXA_FILE = "taxa.csv"
+DWCA_VERNACULAR_FILE = "VernacularNames-{}.csv"
+DWCA_LANGUAGE = "french"        # noms vernaculaires importés (fichier de l'archive)
+DWCA_BATCH = 50000              # lignes par transaction
+
+
+def _dwca_id(value):
+    # id numérique, ou URI https://www.inaturalist.org/taxa/<id>
+    value = (value or "").strip().rstrip("/")
+    tail = value.rsplit("/", 1)[-1]
+    return int(tail) if tail.isdigit() else None
+
+
+def _dwca_rows(archive, name):
+    # Lignes (dict) d'un fichier CSV de l'archive, quel que soit son dossier
+    member = next((m for m in archive.namelist() if os.path.basename(m) == name), None)
+    if member is None:
+        return None
+    csv.field_size_limit(min(sys.maxsize, 2 ** 31 - 1))
+    return csv.DictReader(io.TextIOWrapper(archive.open(member), encoding="utf-8", newline=""))
+
+
+class yd_TaxonStore:
+    """
+    taxon_id → {"rank", "rank_level", "name", "ancestor_ids", "common_name"},
+    même forme que le cache mémoire de yd_taxonomy. Les taxons plus vieux
+    que ttl_s sont ignorés (puis remplacés au prochain put_many) ; au-delà
+    de max_rows, les moins récemment lus sont supprimés.
+    """
+
+    def __init__(self, path, ttl_s=TAXO_TTL_S, max_rows=TAXO_MAX_ROWS):
+        self.path = path
+        self.ttl_s = ttl_s
+        self.max_rows = max_rows
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS taxa ("
+            " id INTEGER PRIMARY KEY,"
+            " rank TEXT,"
+            " rank_level REAL,"
+            " name TEXT,"
+            " ancestor_ids TEXT NOT NULL,"
+            " common_name TEXT,"
+            " fetched REAL NOT NULL,"
+            " last_access REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS taxa_lru ON taxa(last_access)")
+        self._conn.commit()
+        self._rows = self._conn.execute("SELECT COUNT(*) FROM taxa").fetchone()[0]
+
+    def get_many(self, ids):
+        """Taxons connus et encore valides parmi ids : {id: info}."""
+        ids = list(ids)
+        now = time.time()
+        found = {}
+        with self._lock:
+            for i in range(0, len(ids), _SQL_VARS):
+                chunk = ids[i:i + _SQL_VARS]
+                rows = self._conn.execute(
+                    "SELECT id, rank, rank_level, name, ancestor_ids, common_name, fetched "
+                    f"FROM taxa WHERE id IN ({','.join('?' * len(chunk))})",
+                    chunk,
+                ).fetchall()
+                for tid, rank, level, name, ancestors, common, fetched in rows:
+                    if self.ttl_s is not None and now - fetched > self.ttl_s:
+                        continue
+                    found[tid] = {
+                        "rank": rank,
+                        "rank_level": level,
+                        "name": name,
+                        "ancestor_ids": [int(a) for a in ancestors.split(",") if a],
+                        "common_name": common,
+                    }
+            self._conn.executemany(
+                "UPDATE taxa SET last_access = ? WHERE id = ?", [(now, tid) for tid in found]
+            )
+            self._conn.commit()
+            self.hits += len(found)
+            self.misses += len(ids) - len(found)
+        return found
+
+    def put_many(self, infos):
+        """Enregistre {id: info} (les None sont ignorés)."""
+        now = time.time()
+        rows = [
+            (tid, info.get("rank"), info.get("rank_level"), info.get("name"),
+             ",".join(str(a) for a in info.get("ancestor_ids") or []),
+             info.get("common_name"), now, now)
+            for tid, info in infos.items() if info
+        ]
+        if not rows:
+            return
+        with self._lock:
+            self._conn.executemany(
+                "INSERT INTO taxa VALUES (?, ?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT(id) DO UPDATE SET rank = excluded.rank, "
+                "rank_level = excluded.rank_level, name = excluded.name, "
+                "ancestor_ids = excluded.ancestor_ids, common_name = excluded.common_name, "
+                "fetched = excluded.fetched, last_access = excluded.last_access",
+                rows,
+            )
+            self._rows = self._conn.execute("SELECT COUNT(*) FROM taxa").fetchone()[0]
+            if self._rows > self.max_rows:
+                self._evict()
+            self._conn.commit()
+
+    def _evict(self):
+        # LRU : on libère jusqu'à 90 % du nombre max de taxons
+        excess = self._rows - int(self.max_rows * 0.9)
+        self._conn.execute(
+            "DELETE FROM taxa WHERE id IN "
+            "(SELECT id FROM taxa ORDER BY last_access LIMIT ?)",
+            (excess,),
+        )
+        self._rows -= excess
+
+    # ---------- Taxonomie hors ligne (archive DwC-A) ----------
+
+    def import_dwca(self, zip_path, language=DWCA_LANGUAGE, progress=None,
+                    is_canceled=None, log=print):
+        """
+        Charge taxa.csv (id, parentNameUsageID, scientificName, taxonRank) et
+        les noms vernaculaires de la langue choisie dans la table dwca_taxa,
+        remplacée d'un bloc en fin d'import (l'ancienne reste utilisable en
+        cas d'annulation). progress(nb_lignes) tous les DWCA_BATCH.
+        Renvoie le nombre de taxons, None si annulé.
+        """
+        with zipfile.ZipFile(zip_path) as archive:
+            rows = _dwca_rows(archive, DWCA_TAXA_FILE)
+            if rows is None:
+                raise ValueError(f"{DWCA_TAXA_FILE} absent de l'archive {zip_path}")
+            with self._lock:
+                c = self._conn
+                c.execute("DROP TABLE IF EXISTS dwca_taxa_new")
+                c.execute(
+                    "CREATE TABLE dwca_taxa_new ("
+                    " id INTEGER PRIMARY KEY,"
+                    " parent_id INTEGER,"
+                    " rank TEXT,"
+                    " name TEXT,"
+                    " common_name TEXT)"
+                )
+                n = 0
+                batch = []
+                for row in rows:
+                    tid = _dwca_id(row.get("id") or row.get("taxonID"))
+                    if tid is None:
+                        continue
+                    batch.append((tid, _dwca_id(row.get("parentNameUsageID")),
+                                  row.get("taxonRank") or None, row.get("scientificName") or None))
+                    if len(batch) >= DWCA_BATCH:
+                        c.executemany("INSERT OR REPLACE INTO dwca_taxa_new "
+                                      "(id, parent_id, rank, name) VALUES (?, ?, ?, ?)", batch)
+                        c.commit()
+                        n += len(batch)
+                        batch.clear()
+                        if progress is not None:
+                            progress(n)
+                        if is_canceled is not None and is_canceled():
+                            c.execute("DROP TABLE dwca_taxa_new")
+                            c.commit()
+                            log("⚠️ Import DwC-A annulé, taxonomie hors ligne inchangée")
+                            return None
+                c.executemany("INSERT OR REPLACE INTO dwca_taxa_new "
+                              "(id, parent_id, rank, name) VALUES (?, ?, ?, ?)", batch)
+                n += len(batch)
+
+                names = _dwca_rows(archive, DWCA_VERNACULAR_FILE.format(language))
+                n_names = 0
+                if names is None:
+                    log(f"ℹ️ Pas de noms vernaculaires « {language} » dans l'archive")
+                else:
+                    # Premier nom de chaque taxon
+                    cur = c.executemany(
+                        "UPDATE dwca_taxa_new SET common_name = ? "
+                        "WHERE id = ? AND common_name IS NULL",
+                        ((r.get("vernacularName"), _dwca_id(r.get("id")))
+                         for r in names if r.get("vernacularName")),
+                    )
+                    n_names = cur.rowcount
+
+                c.execute("DROP TABLE IF EXISTS dwca_taxa")
+                c.execute("ALTER TABLE dwca_taxa_new RENAME TO dwca_taxa")
+                c.execute("CREATE TABLE IF NOT EXISTS dwca_info (key TEXT PRIMARY KEY, value TEXT)")
+                c.executemany("INSERT OR REPLACE INTO dwca_info VALUES (?, ?)", [
+                    ("source", os.path.basename(zip_path)),
+                    ("imported", datetime.now().strftime("%Y-%m-%d %H:%M")),
+                    ("n_taxa", str(n)),
+                    ("language", language),
+                ])
+                c.commit()
+        log(f"✅ Taxonomie hors ligne : {n} taxons, {n_names} noms vernaculaires ({language})")
+        return n
+
+    def offline_info(self):
+        """{source, imported, n_taxa, language} de l'archive importée, ou None."""
+        with self._lock:
+            try:
+                info = dict(self._conn.execute("SELECT key, value FROM dwca_info").fetchall())
+            except sqlite3.OperationalError:
+                return None
+        return info or None
+
+    def offline_lookup(self, ids):
+        """{id: (parent_id, rang, nom, nom vernaculaire)} depuis la table dwca_taxa."""
+        ids = list(ids)
+        found = {}
+        with self._lock:
+            for i in range(0, len(ids), _SQL_VARS):
+                chunk = ids[i:i + _SQL_VARS]
+                for tid, parent, rank, name, common in self._conn.execute(
+                    "SELECT id, parent_id, rank, name, common_name FROM dwca_taxa "
+                    f"WHERE id IN ({','.join('?' * len(chunk))})",
+                    chunk,
+                ):
+                    found[tid] = (parent, rank, name, common)
+        return found
+
+    def reset_stats(self):
+        self.hits = 0
+        self.misses = 0
+
+    def snapshot(self):
+        """Compteurs à un instant donné, pour stats(since=...) d'un seul run."""
+        with self._lock:
+            return (self.hits, self.misses)
+
+    def stats(self, since=None):
+        hits, misses = self.snapshot()
+        if since is not None:
+            hits, misses = hits - since[0], misses - since[1]
+        total = hits + misses
+        rate = (100.0 * hits / total) if total else 0.0
+        return (f"référentiel taxonomique : {hits} hits, {misses} misses "
+                f"({rate:.0f} %), {self._rows} taxons")
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+_yd_store = None
+
+
+def yd_taxo_store_partage():
+    """Référentiel unique du process, ouvert à la première utilisation."""
+    global _yd_store
+    if _yd_store is None:
+        _yd_store = yd_TaxonStore(os.path.join(CACHE_DIR, TAXO_FILE))
+    return _yd_store
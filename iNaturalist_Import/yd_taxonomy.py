@@ -0,0 +1,264 @@
+# ==============================================================
+# Plugin QGIS : iNaturalist Import
+# Module     : yd_taxonomy
+# Version    : 1.0.0
+# Rôle       : Moteur taxonomique indépendant de l'interface (ETAPE 9) :
+#              taxon_id → 7 niveaux (yd_taxa) → intégration dans la couche
+#              (GPKG : table de correspondance + UPDATE SQL par blocs)
+#              Utilisé par Script 2 (dialogues) et par yd_cli (sans GUI)
+# QGIS       : 3.40 (Bratislava) — qgis.core uniquement
+# ==============================================================
+
+from qgis.core import QgsVectorLayer, QgsField
+from qgis.PyQt.QtCore import QVariant
+
+import csv
+import sqlite3
+import time
+
+from .yd_gpkg import _q, yd_gpkg_functions
+from .yd_metrics import YD_NO_METRICS, yd_Metrics, yd_metrics_path
+from .yd_taxa import TAX_FIELDS, yd_build_taxonomy, yd_build_taxonomy_offline
+
+# PARAMÈTRES
+taxon_field = "taxon_id"
+# Écriture GPKG : entités (plage de fid) par UPDATE, entre deux progressions
+TAXO_UPDATE_CHUNK = 50000
+
+
+def yd_unique_taxa(vl):
+    """taxon_id uniques de la couche → scientific_name (ou None)."""
+    taxon_idx = vl.fields().indexOf(taxon_field)
+    sci_idx = vl.fields().indexOf("scientific_name")
+
+    taxon_set = {}
+    for f in vl.getFeatures():
+        tid = f[taxon_idx]
+        if tid is None:
+            continue
+        try:
+            tid_int = int(tid)
+        except (TypeError, ValueError):
+            continue
+        if tid_int not in taxon_set:
+            sci = f[sci_idx] if sci_idx != -1 else None
+            taxon_set[tid_int] = sci
+    return taxon_set
+
+
+def yd_write_taxa_csv(path, taxa, taxon_set):
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f, delimiter=";")
+        writer.writerow(["taxon_id", "scientific_name"])
+        for tid in taxa:
+            writer.writerow([tid, taxon_set[tid] or ""])
+
+
+def yd_write_taxo_csv(path, taxa, taxo_map):
+    with open(path, "w", newline="", encoding="utf-8") as out_f:
+        writer = csv.writer(out_f, delimiter=";")
+        header = ["taxon_id"] + TAX_FIELDS
+        writer.writerow(header)
+        for tid in taxa:
+            row = [tid] + [taxo_map[tid].get(field, "") for field in TAX_FIELDS]
+            writer.writerow(row)
+
+
+def yd_add_taxonomy_fields(vl, log=print):
+    """Ajoute à la couche les champs de TAX_FIELDS absents."""
+    provider = vl.dataProvider()
+    existing_fields = [f.name() for f in vl.fields()]
+    new_fields = []
+
+    for field_name in TAX_FIELDS:
+        if field_name not in existing_fields:
+            new_fields.append(QgsField(field_name, QVariant.String, len=150))
+
+    if new_fields:
+        log(
+            "➕ Ajout de "
+            f"{len(new_fields)} champs taxonomiques : "
+            f"{', '.join(f.name() for f in new_fields)}"
+        )
+        provider.addAttributes(new_fields)
+        vl.updateFields()
+    else:
+        log("ℹ️ Tous les champs taxonomiques existent déjà")
+
+
+def yd_write_taxonomy(vl, taxo_map, log=print, on_feature=None, is_canceled=None,
+                      metrics=None):
+    """
+    Écrit taxo_map dans les entités de la couche (champs déjà créés), entité
+    par entité via le tampon d'édition : pour les couches hors GPKG, sinon
+    préférer yd_write_taxonomy_gpkg.
+    Renvoie (commit_ok, n_updated, n_not_found).
+    """
+    metrics = metrics or YD_NO_METRICS
+    t = time.perf_counter()
+    taxon_idx = vl.fields().indexOf(taxon_field)
+    idx_map = {name: vl.fields().indexOf(name) for name in TAX_FIELDS}
+
+    if not vl.isEditable():
+        vl.startEditing()
+
+    n_updated = 0
+    n_not_found = 0
+    total_feats = vl.featureCount()
+
+    i_feat = 0
+    for feat in vl.getFeatures():
+        i_feat += 1
+
+        if is_canceled is not None and is_canceled():
+            log("⚠️ Mise à jour des entités annulée par l'utilisateur.")
+            break
+
+        if on_feature is not None:
+            on_feature(i_feat, total_feats, feat.id())
+
+        tid_val = feat[taxon_idx]
+        try:
+            tid_int = int(tid_val)
+        except (TypeError, ValueError):
+            n_not_found += 1
+            continue
+
+        taxo = taxo_map.get(tid_int)
+        if not taxo:
+            n_not_found += 1
+            continue
+
+        for field_name in TAX_FIELDS:
+            idx = idx_map[field_name]
+            feat[idx] = taxo.get(field_name, "")
+
+        if not vl.updateFeature(feat):
+            log(f"⚠️ Échec updateFeature pour FID={feat.id()}")
+        else:
+            n_updated += 1
+
+    metrics.record("attribute_update", time.perf_counter() - t, items=n_updated)
+    with metrics.stage("commit"):
+        commit_ok = vl.commitChanges()
+    if commit_ok:
+        return True, n_updated, n_not_found
+    vl.rollBack()
+    return False, n_updated, n_not_found
+
+
+def yd_write_taxonomy_gpkg(gpkg_path, layer_name, taxo_map, log=print, progress=None,
+                           is_canceled=None, metrics=None):
+    """
+    Écrit taxo_map dans la couche du GPKG (champs déjà créés, cf.
+    yd_add_taxonomy_fields) sans passer par le tampon d'édition : table
+    temporaire taxon_id → 7 rangs puis UPDATE par blocs de TAXO_UPDATE_CHUNK
+    fid, une seule transaction (annulation = rien d'écrit).
+    progress(entités traitées, total) après chaque bloc. Recharger ensuite
+    les couches QGIS ouvertes sur ce fichier.
+    Renvoie (commit_ok, n_updated, n_not_found).
+    """
+    metrics = metrics or YD_NO_METRICS
+    t = time.perf_counter()
+    conn = sqlite3.connect(gpkg_path, timeout=30)
+    # Triggers R-tree du GPKG (ST_*) même si seule la table attributaire change
+    yd_gpkg_functions(conn)
+    try:
+        table = _q(layer_name)
+        info = conn.execute(f"PRAGMA table_info({table})").fetchall()
+        cols = [row[1] for row in info]
+        missing = [name for name in [taxon_field] + TAX_FIELDS if name not in cols]
+        if missing:
+            log(f"❌ Champs absents de la couche : {', '.join(missing)}")
+            return False, 0, 0
+        fid = _q(next((row[1] for row in info if row[5] == 1), "fid"))
+
+        conn.execute(
+            "CREATE TEMP TABLE yd_taxo_map (taxon_id INTEGER PRIMARY KEY, "
+            + ", ".join(f"{_q(name)} TEXT" for name in TAX_FIELDS) + ")"
+        )
+        conn.executemany(
+            f"INSERT INTO yd_taxo_map VALUES ({', '.join('?' * (len(TAX_FIELDS) + 1))})",
+            ([tid] + [taxo.get(name, "") for name in TAX_FIELDS]
+             for tid, taxo in taxo_map.items() if taxo),
+        )
+
+        total, fid_min, fid_max = conn.execute(
+            f"SELECT COUNT(*), MIN({fid}), MAX({fid}) FROM {table}"
+        ).fetchone()
+        targets = ", ".join(_q(name) for name in TAX_FIELDS)
+        tid_expr = f"CAST({table}.{_q(taxon_field)} AS INTEGER)"
+        sql = (
+            f"UPDATE {table} SET ({targets}) = "
+            f"(SELECT {targets} FROM yd_taxo_map WHERE yd_taxo_map.taxon_id = {tid_expr}) "
+            f"WHERE {fid} BETWEEN ? AND ? "
+            f"AND {tid_expr} IN (SELECT taxon_id FROM yd_taxo_map)"
+        )
+        n_updated = 0
+        if total:
+            span = fid_max - fid_min + 1
+            for lo in range(fid_min, fid_max + 1, TAXO_UPDATE_CHUNK):
+                if is_canceled is not None and is_canceled():
+                    conn.rollback()
+                    log("⚠️ Mise à jour des entités annulée par l'utilisateur.")
+                    return False, 0, total
+                hi = lo + TAXO_UPDATE_CHUNK - 1
+                n_updated += conn.execute(sql, (lo, hi)).rowcount
+                if progress is not None:
+                    progress(min(total, total * (hi - fid_min + 1) // span), total)
+        metrics.record("attribute_update", time.perf_counter() - t, items=n_updated)
+        with metrics.stage("commit"):
+            conn.commit()
+    except sqlite3.Error as e:
+        conn.rollback()
+        log(f"❌ Écriture de la taxonomie dans le GPKG : {e}")
+        return False, 0, 0
+    finally:
+        conn.close()
+    return True, n_updated, total - n_updated
+
+
+def yd_enrich_layer(get_taxa, gpkg_path, layer_name, log=print, store=None,
+                    refresh=False, offline=False):
+    """
+    ETAPE 9 complète sans interface, sur une couche d'un GPKG
+    (store / refresh : référentiel taxonomique, cf. yd_build_taxonomy ;
+    offline=True : taxonomie DwC-A de store, get_taxa inutilisé).
+    """
+    vl = QgsVectorLayer(f"{gpkg_path}|layername={layer_name}", layer_name, "ogr")
+    if not vl.isValid():
+        log("❌ Couche GPKG invalide")
+        return False
+    if vl.fields().indexOf(taxon_field) == -1:
+        log(f"❌ Champ '{taxon_field}' introuvable")
+        return False
+
+    metrics = yd_Metrics(yd_metrics_path(gpkg_path), run={"layer_name": layer_name,
+                                                          "step": "taxonomy"})
+    metrics.profile_begin()
+    with metrics.stage("unique_taxa") as m:
+        taxon_set = yd_unique_taxa(vl)
+        m["items"] = len(taxon_set)
+    taxa = sorted(taxon_set.keys())
+    log(f"✅ {len(taxa)} taxon_id uniques extraits")
+
+    if offline:
+        taxo_map, errors = yd_build_taxonomy_offline(store, taxa, log=log, metrics=metrics)
+    else:
+        taxo_map, errors = yd_build_taxonomy(get_taxa, taxa, log=log, metrics=metrics,
+                                             store=store, refresh=refresh)
+    log(f"✅ Taxonomie construite pour {len(taxo_map)} taxon_id, erreurs : {errors}")
+
+    yd_add_taxonomy_fields(vl, log=log)
+    ok, n_updated, n_not_found = yd_write_taxonomy_gpkg(gpkg_path, layer_name, taxo_map,
+                                                        log=log, metrics=metrics)
+    metrics.close(status="ok" if ok else "erreur", n_taxa=len(taxa), errors=errors)
+    log(metrics.text())
+    if ok:
+        log(
+            "✅ Intégration terminée dans le fichier : "
+            f"{n_updated} entités MAJ, {n_not_found} sans taxonomie"
+        )
+    else:
+        log("❌ Erreur lors du commit sur fichier, annulation")
+    return ok
@@ -0,0 +1,213 @@
+# ==============================================================
+# Plugin QGIS : iNaturalist Import
+# Module     : yd_tiling
+# Version    : 1.0.0
+# Rôle       : Découpage d'un grand cercle ou d'une zone (bbox d'un
+#              polygone) en tuiles dimensionnées par sondage du nombre
+#              d'observations, récupération concurrente, découpe exacte
+#              au cercle, dédoublonnage inat_id
+# QGIS       : 3.40 (Bratislava)
+# ==============================================================
+
+import math
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from .yd_fetch import PER_PAGE, yd_call_retry, yd_fetch_pages
+
+# PARAMÈTRES
+TILE_MAX_RESULTS = 5000   # une tuile plus dense est redécoupée en 4
+TILE_MAX_DEPTH = 6        # profondeur max du quadtree
+TILE_WORKERS = 4          # tuiles récupérées simultanément
+# Zone (polygone) : une tuile de plus d'une page, couverte à moins de
+# AREA_FILL_MIN par le polygone, est redécoupée pour ne pas tout télécharger
+AREA_FILL_MIN = 0.5
+EARTH_RADIUS_M = 6371008.8
+
+_FIN = object()
+
+
+def yd_haversine_m(lat1, lng1, lat2, lng2):
+    p1 = math.radians(lat1)
+    p2 = math.radians(lat2)
+    dp = p2 - p1
+    dl = math.radians(lng2 - lng1)
+    a = math.sin(dp / 2) ** 2 + math.cos(p1) * math.cos(p2) * math.sin(dl / 2) ** 2
+    return 2 * EARTH_RADIUS_M * math.asin(min(1.0, math.sqrt(a)))
+
+
+def _circle_bbox(lat, lng, rayon_m):
+    dlat = math.degrees(rayon_m / EARTH_RADIUS_M)
+    dlng = dlat / max(1e-6, math.cos(math.radians(lat)))
+    return (lat - dlat, lng - dlng, lat + dlat, lng + dlng)
+
+
+def _tile_touches_circle(tile, lat, lng, rayon_m):
+    swlat, swlng, nelat, nelng = tile
+    # Point de la tuile le plus proche du centre
+    plat = min(max(lat, swlat), nelat)
+    plng = min(max(lng, swlng), nelng)
+    return yd_haversine_m(lat, lng, plat, plng) <= rayon_m
+
+
+def _split(tile):
+    swlat, swlng, nelat, nelng = tile
+    mlat = (swlat + nelat) / 2.0
+    mlng = (swlng + nelng) / 2.0
+    return [
+        (swlat, swlng, mlat, mlng),
+        (swlat, mlng, mlat, nelng),
+        (mlat, swlng, nelat, mlng),
+        (mlat, mlng, nelat, nelng),
+    ]
+
+
+def _root_tile(params):
+    # Zone : bbox swlat/swlng/nelat/nelng ; cercle : bbox du cercle
+    if 'swlat' in params:
+        return (params['swlat'], params['swlng'], params['nelat'], params['nelng'])
+    return _circle_bbox(params['lat'], params['lng'], params['radius'] * 1000.0)
+
+
+def _circle_coverage(params):
+    if 'swlat' in params:
+        return lambda tile: 1.0
+    lat, lng, rayon_m = params['lat'], params['lng'], params['radius'] * 1000.0
+    return lambda tile: 1.0 if _tile_touches_circle(tile, lat, lng, rayon_m) else 0.0
+
+
+def _tile_params(params, tile):
+    swlat, swlng, nelat, nelng = tile
+    tp = {k: v for k, v in params.items() if k not in ('lat', 'lng', 'radius')}
+    tp.update(swlat=swlat, swlng=swlng, nelat=nelat, nelng=nelng)
+    return tp
+
+
+def yd_count(get_observations, params, cache=None, refresh=False, limiter=None,
+             metrics=None, log=print):
+    """Sondage : per_page=0 → total_results seul, sans observation."""
+    resp = yd_call_retry(get_observations, limiter=limiter, cache=cache, refresh=refresh,
+                         metrics=metrics, log=log, **dict(params, per_page=0))
+    return resp.get('total_results') or 0
+
+
+def yd_plan_tiles(get_observations, params, cache=None, refresh=False,
+                  max_results=TILE_MAX_RESULTS, max_depth=TILE_MAX_DEPTH,
+                  workers=TILE_WORKERS, coverage=None, metrics=None, log=print):
+    """
+    Quadtree sur la bbox du cercle (params lat/lng/radius en km) ou de la
+    zone (params swlat/swlng/nelat/nelng) : les tuiles denses sont
+    redécoupées, les vides et celles hors de la zone sont écartées.
+    coverage(tuile) → part de la tuile dans la zone (0 à 1, cercle par
+    défaut) : une tuile mal couverte de plus d'une page est aussi redécoupée.
+    Renvoie [(tuile, nombre)], les sondages d'un même niveau étant faits
+    en parallèle.
+    """
+    coverage = coverage or _circle_coverage(params)
+
+    def probe(tile):
+        return yd_count(get_observations, _tile_params(params, tile), cache, refresh,
+                        metrics=metrics, log=log)
+
+    leaves = []
+    level = [_root_tile(params)]
+    depth = 0
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        while level:
+            counts = list(executor.map(probe, level))
+            next_level = []
+            for tile, count in zip(level, counts):
+                if count == 0:
+                    continue
+                split = count > max_results or (
+                    count > PER_PAGE and coverage(tile) < AREA_FILL_MIN
+                )
+                if split and depth < max_depth:
+                    next_level.extend(t for t in _split(tile) if coverage(t) > 0)
+                else:
+                    leaves.append((tile, count))
+            level = next_level
+            depth += 1
+    return leaves
+
+
+def yd_fetch_tiled(get_observations, params, cache=None, refresh=False,
+                   on_total=None, workers=TILE_WORKERS, max_results=TILE_MAX_RESULTS,
+                   coverage=None, metrics=None, log=print):
+    """
+    Générateur de pages (listes d'observations) pour un cercle ou une zone
+    découpés en tuiles : TILE_WORKERS tuiles en parallèle, chacune paginée
+    par yd_fetch_pages. Les observations hors du cercle exact et les
+    doublons (bords de tuiles) sont écartés ; la découpe au polygone d'une
+    zone est faite par l'appelant. L'ordre des pages n'est pas garanti.
+    """
+    circle = None
+    if 'swlat' not in params:
+        circle = (params['lat'], params['lng'], params['radius'] * 1000.0)
+    tiles = yd_plan_tiles(get_observations, params, cache, refresh, max_results,
+                          workers=workers, coverage=coverage, metrics=metrics, log=log)
+    log(f"🧩 {len(tiles)} tuiles planifiées")
+    if on_total is not None:
+        on_total(sum(count for _, count in tiles))
+    if not tiles:
+        return
+
+    # File bornée : les workers attendent si le consommateur prend du retard
+    pages = queue.Queue(maxsize=max(1, workers) * 2)
+    stop = threading.Event()
+
+    def put(item):
+        while not stop.is_set():
+            try:
+                pages.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def worker(tile):
+        try:
+            for results in yd_fetch_pages(get_observations, _tile_params(params, tile),
+                                          max_workers=1, cache=cache, refresh=refresh,
+                                          metrics=metrics, log=log):
+                if not put(results):
+                    return
+        except Exception as e:
+            put(e)
+
+    executor = ThreadPoolExecutor(max_workers=max(1, workers))
+    futures = [executor.submit(worker, tile) for tile, _ in tiles]
+
+    def closer():
+        for fut in futures:
+            fut.result()
+        put(_FIN)
+
+    threading.Thread(target=closer, daemon=True).start()
+
+    seen = set()
+    try:
+        while True:
+            item = pages.get()
+            if item is _FIN:
+                break
+            if isinstance(item, Exception):
+                raise item
+            kept = []
+            for obs in item:
+                oid = obs.get('id')
+                if oid in seen:
+                    continue
+                coords = (obs.get('geojson') or {}).get('coordinates')
+                if circle and coords and yd_haversine_m(
+                    circle[0], circle[1], coords[1], coords[0]
+                ) > circle[2]:
+                    continue
+                seen.add(oid)
+                kept.append(obs)
+            if kept:
+                yield kept
+    finally:
+        stop.set()
+        executor.shutdown(wait=False)
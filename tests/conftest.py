@@ -0,0 +1,9 @@
+# ==============================================================
+# Tests des modules du plugin sans QGIS (sqlite3 / Python pur)
+# Lancer depuis la racine du dépôt : python -m pytest -q tests
+# ==============================================================
+
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
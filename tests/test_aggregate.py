@@ -0,0 +1,163 @@
+# ==============================================================
+# yd_aggregate : mailles hexagonales (aller-retour point → maille →
+# centre), taille au sol, clé d'espèce de la richesse spécifique,
+# couches de synthèse écrites dans le GPKG puis recalculées
+# ==============================================================
+
+import math
+import random
+import sqlite3
+
+import pytest
+
+from iNaturalist_Import.yd_aggregate import (
+    AGG_SCALE_FACTOR, _SQRT3, _hex_cell, _hex_ring, _lonlat, _mercator, _species_key,
+    yd_aggregate_layer_name, yd_aggregate_rows, yd_aggregate_scales, yd_read_aggregate_info,
+    yd_rebuild_aggregates, yd_write_aggregate_info, yd_write_aggregates
+)
+from iNaturalist_Import.yd_gpkg import yd_GpkgWriter
+
+
+def _center(cell, r):
+    ring = _hex_ring(cell, r)[:-1]
+    return (sum(x for x, _ in ring) / 6, sum(y for _, y in ring) / 6)
+
+
+def _inside(x, y, ring):
+    # Hexagone convexe, sommets dans le sens direct
+    return all((x2 - x1) * (y - y1) - (y2 - y1) * (x - x1) >= -1e-6
+               for (x1, y1), (x2, y2) in zip(ring, ring[1:]))
+
+
+@pytest.mark.parametrize("r", [1.0, 288.7, 5773.5])
+def test_hex_cell_round_trip(r):
+    rng = random.Random(42)
+    for _ in range(2000):
+        x, y = rng.uniform(-50 * r, 50 * r), rng.uniform(-50 * r, 50 * r)
+        cell = _hex_cell(x, y, r)
+        ring = _hex_ring(cell, r)
+        # Le point tombe dans l'hexagone de sa maille…
+        assert _inside(x, y, ring)
+        # …dont le centre est la maille la plus proche
+        cx, cy = _center(cell, r)
+        assert math.hypot(x - cx, y - cy) <= r + 1e-6
+        assert _hex_cell(cx, cy, r) == cell
+
+
+def test_hex_ring_is_closed_regular_hexagon():
+    r = 10.0
+    ring = _hex_ring((3, -2), r)
+    assert len(ring) == 7 and ring[0] == ring[-1]
+    cx, cy = _center((3, -2), r)
+    assert all(math.hypot(x - cx, y - cy) == pytest.approx(r) for x, y in ring)
+    # Largeur entre côtés opposés = r √3
+    assert max(x for x, _ in ring) - min(x for x, _ in ring) == pytest.approx(r * _SQRT3)
+
+
+def test_mercator_round_trip():
+    for lon, lat in [(0, 0), (5.72, 45.19), (-122.4, 37.8), (179.9, -60.0)]:
+        assert _lonlat(*_mercator(lon, lat)) == pytest.approx((lon, lat))
+
+
+@pytest.mark.parametrize("name, rank, key", [
+    ("Bufo bufo", "species", "Bufo bufo"),
+    ("Parus major major", "subspecies", "Parus major"),
+    ("Quercus robur var. pedunculata", "variety", "Quercus robur"),
+    ("Mentha × piperita", "hybrid", "Mentha piperita"),
+    ("Bufo", "genus", None),
+    ("Anura", "order", None),
+    ("", "species", None),
+    (None, "species", None),
+])
+def test_species_key(name, rank, key):
+    assert _species_key(name, rank) == key
+
+
+def test_aggregate_rows_counts_and_richness():
+    points = [
+        (5.7200, 45.1900, "Bufo bufo", "species", "2024-05-01T10:00:00"),
+        (5.7201, 45.1901, "Bufo bufo", "species", "2024-06-01"),
+        (5.7202, 45.1900, "Parus major major", "subspecies", "2023-01-01"),
+        (5.7200, 45.1902, "Parus", "genus", None),
+    ]
+    rows = yd_aggregate_rows(points, "hex", sizes=(5000,))[5000]
+    assert len(rows) == 1
+    ring, (cell_id, size_m, n_obs, n_species, last_obs) = rows[0]
+    assert cell_id.startswith("hex5000_") and size_m == 5000
+    assert (n_obs, n_species, last_obs) == (4, 2, "2024-06-01")
+    assert ring[0] == ring[-1]
+    assert yd_aggregate_rows([], "grid", sizes=(500, 2000)) == {500: [], 2000: []}
+    with pytest.raises(ValueError):
+        yd_aggregate_rows(points, "triangle")
+
+
+def _ground_m(lon1, lat1, lon2, lat2):
+    # Haversine sur la sphère du Web Mercator
+    p1, p2 = math.radians(lat1), math.radians(lat2)
+    a = (math.sin((p2 - p1) / 2) ** 2
+         + math.cos(p1) * math.cos(p2) * math.sin(math.radians(lon2 - lon1) / 2) ** 2)
+    return 2 * 6378137.0 * math.asin(math.sqrt(a))
+
+
+@pytest.mark.parametrize("lat", [0.0, 45.19, 68.0])
+def test_grid_cell_size_on_the_ground(lat):
+    points = [(5.72, lat, "Bufo bufo", "species", None)]
+    ring, _ = yd_aggregate_rows(points, "grid", sizes=(2000,))[2000][0]
+    (x0, y0), (x1, _), _, (_, y3) = ring[:4]
+    assert _ground_m(x0, y0, x1, y0) == pytest.approx(2000, rel=0.01)
+    assert _ground_m(x0, y0, x0, y3) == pytest.approx(2000, rel=0.01)
+
+
+def test_scales_hand_over_from_fine_to_coarse():
+    scales = yd_aggregate_scales((10000, 500, 2000))
+    assert scales == [(2000 * AGG_SCALE_FACTOR, 500 * AGG_SCALE_FACTOR),
+                      (10000 * AGG_SCALE_FACTOR, 2000 * AGG_SCALE_FACTOR),
+                      (0, 10000 * AGG_SCALE_FACTOR)]
+
+
+def _obs_layer(path, n):
+    writer = yd_GpkgWriter(path)
+    writer.create_layer("obs", [("inat_id", "INTEGER"), ("scientific_name", "TEXT(100)"),
+                                ("taxon_rank", "TEXT(20)"), ("date_obs", "TEXT(30)")])
+    writer.insert("obs", [(5.72 + i * 0.004, 45.19, [i, f"Espèce {i % 3}", "species",
+                                                     f"2024-05-{1 + i % 28:02d}"])
+                          for i in range(n)])
+    return writer
+
+
+def _count(path, name):
+    conn = sqlite3.connect(path)
+    try:
+        return conn.execute(f'SELECT SUM(n_obs) FROM "{name}"').fetchone()[0]
+    finally:
+        conn.close()
+
+
+def test_write_then_rebuild_aggregates(tmp_path):
+    path = str(tmp_path / "obs.gpkg")
+    writer = _obs_layer(path, 40)
+    levels = yd_write_aggregates(writer, "obs", "hex", sizes=(2000, 500), log=lambda msg: None)
+    writer.close()
+    yd_write_aggregate_info(path, "obs", levels)
+    info = yd_read_aggregate_info(path, "obs")
+    assert [lv["name"] for lv in info] == [yd_aggregate_layer_name("obs", "hex", 500),
+                                           yd_aggregate_layer_name("obs", "hex", 2000)]
+    assert all(_count(path, lv["name"]) == 40 for lv in info)
+
+    # Mise à jour de la couche (Script 3) : mailles recalculées sur place
+    writer = yd_GpkgWriter(path, resume=True)
+    writer.insert("obs", [(5.9, 45.3, [99, "Espèce 9", "species", "2024-06-30"])])
+    writer.close()
+    rebuilt = yd_rebuild_aggregates(path, "obs", log=lambda msg: None)
+    assert [lv["size_m"] for lv in rebuilt] == [500, 2000]
+    assert all(_count(path, lv["name"]) == 41 for lv in rebuilt)
+    assert yd_rebuild_aggregates(path, "autre") == []
+
+
+def test_aggregates_need_their_columns(tmp_path):
+    writer = yd_GpkgWriter(str(tmp_path / "obs.gpkg"))
+    writer.create_layer("obs", [("inat_id", "INTEGER")])
+    logs = []
+    assert yd_write_aggregates(writer, "obs", "grid", log=logs.append) == []
+    assert "date_obs" in logs[0]
+    writer.close()
@@ -0,0 +1,70 @@
+# ==============================================================
+# yd_taxa : ancêtres utiles (_ancestor_gaps), résolus en un seul tour
+# groupé (yd_plan_ancestors), référentiel lu d'abord
+# ==============================================================
+
+from iNaturalist_Import.yd_taxa import (
+    LIFE_TAXON_ID, RANK_LEVELS, _ancestor_gaps, yd_plan_ancestors
+)
+from iNaturalist_Import.yd_taxo_store import yd_TaxonStore
+
+# Life > Animalia > Chordata > Vertebrata (subphylum) > Amphibia > Anura
+# > Bufonidae > Bufo > Bufo bufo
+CHAIN = [
+    (1, "kingdom"), (2, "phylum"), (355675, "subphylum"), (20978, "class"),
+    (20979, "order"), (21008, "family"), (21009, "genus"), (64968, "species"),
+]
+LEVELS = dict(RANK_LEVELS, subphylum=57)
+
+
+def _info(tid):
+    ids = [tid for tid, _ in CHAIN]
+    rank = dict(CHAIN)[tid]
+    return {"rank": rank, "rank_level": LEVELS[rank], "name": f"{rank} {tid}",
+            "ancestor_ids": [LIFE_TAXON_ID] + ids[:ids.index(tid) + 1],
+            "common_name": None}
+
+
+def test_gaps_skip_known_ranks():
+    # Rien de connu : tous les ancêtres peuvent porter un rang manquant
+    cache = {64968: _info(64968)}
+    assert _ancestor_gaps(64968, cache) == {1, 2, 355675, 20978, 20979, 21008, 21009}
+
+    # Classe et genre connus : le sous-embranchement est entre deux bornes
+    # (classe 50 … règne/embranchement manquants) et reste demandé
+    cache.update({20978: _info(20978), 21009: _info(21009)})
+    assert _ancestor_gaps(64968, cache) == {1, 2, 355675, 20979, 21008}
+
+    # Tous les rangs écrits connus : le sous-embranchement ne sert plus
+    cache.update({tid: _info(tid) for tid in (1, 2, 20979, 21008)})
+    assert _ancestor_gaps(64968, cache) == set()
+
+
+def test_gaps_ignore_runs_without_missing_rank():
+    cache = {tid: _info(tid) for tid, _ in CHAIN if tid != 355675}
+    # Entre embranchement (60) et classe (50) : aucun rang écrit manquant
+    assert _ancestor_gaps(64968, cache) == set()
+
+
+def test_plan_ancestors_one_grouped_round(tmp_path):
+    calls = []
+
+    def get_taxa(taxon_id):
+        calls.append(list(taxon_id))
+        return {"results": [dict(_info(tid), id=tid) for tid in taxon_id]}
+
+    store = yd_TaxonStore(str(tmp_path / "t.sqlite"))
+    store.put_many({20978: _info(20978)})
+    cache = {64968: _info(64968), 21009: _info(21009)}
+    n = yd_plan_ancestors(get_taxa, [64968, 21009, 64968], cache, log=lambda msg: None,
+                          store=store)
+    # Classe lue dans le référentiel, le reste en une requête dédoublonnée
+    assert n == 5
+    assert calls == [sorted([1, 2, 355675, 20979, 21008])]
+    assert all(cache[tid] for tid, _ in CHAIN)
+    assert set(store.get_many([1, 2, 21008])) == {1, 2, 21008}
+
+    # Tout est connu : aucun appel
+    assert yd_plan_ancestors(get_taxa, [64968], cache, log=lambda msg: None, store=store) == 0
+    assert len(calls) == 1
+    store.close()
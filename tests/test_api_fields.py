@@ -0,0 +1,127 @@
+# ==============================================================
+# Projection fields de l'API v2 : RISON, couverture de toutes les
+# colonnes, pages en cache partagées entre sélections de champs
+# ==============================================================
+
+import pytest
+
+from iNaturalist_Import.yd_cache import yd_ResponseCache
+from iNaturalist_Import.yd_columns import (
+    API_FIELDS, API_FIELDS_ALL, API_FIELDS_ID, COLUMN_EXTRACTORS, PHOTO_COLUMNS,
+    _rison, yd_api_fields, yd_compile_columns
+)
+from iNaturalist_Import.yd_fetch import yd_fetch_pages
+from iNaturalist_Import.yd_ratelimit import yd_RateLimiter
+
+ALL_COLUMNS = list(COLUMN_EXTRACTORS)
+
+
+def _parse(text):
+    """RISON (a:!t,b:(c:!t)) → {"a": {}, "b": {"c": {}}}."""
+    def node(i):
+        assert text[i] == "("
+        tree, i = {}, i + 1
+        while text[i] != ")":
+            j = text.index(":", i)
+            key = text[i:j]
+            if text[j + 1] == "(":
+                tree[key], i = node(j + 1)
+            else:
+                assert text[j + 1:j + 3] == "!t"
+                tree[key], i = {}, j + 3
+            if text[i] == ",":
+                i += 1
+        return tree, i + 1
+    tree, end = node(0)
+    assert end == len(text)
+    return tree
+
+
+def _project(value, tree):
+    # Ce que renvoie le serveur : seuls les chemins demandés
+    if not tree:
+        return value
+    if isinstance(value, list):
+        return [_project(v, tree) for v in value]
+    return {k: _project(value[k], sub) for k, sub in tree.items() if k in value}
+
+
+def _observation(i):
+    return {
+        "id": 300000000 + i,
+        "time_observed_at": "2024-05-01T10:20:30+02:00",
+        "observed_on": "2024-05-01",
+        "place_guess": "Grenoble",
+        "quality_grade": "research",
+        "positional_accuracy": 12,
+        "description": "non demandé",
+        "geojson": {"type": "Point", "coordinates": [5.72 + i * 1e-4, 45.19]},
+        "taxon": {"id": 64968, "name": "Bufo bufo", "rank": "species",
+                  "preferred_common_name": "Crapaud commun", "ancestor_ids": [48460, 1]},
+        "user": {"login": "yd", "name": "Yves", "icon": "non demandé"},
+        "photos": [{"url": f"https://static.inaturalist.org/photos/{i}/square.jpg",
+                    "license_code": "cc-by", "attribution": "non demandé"}],
+    }
+
+
+def test_rison():
+    assert _rison({"id": {}, "taxon": {"name": {}, "id": {}}}) == "(id:!t,taxon:(id:!t,name:!t))"
+    assert yd_api_fields(["scientific_name", "taxon_id"], "none") == \
+        "(geojson:!t,id:!t,taxon:(id:!t,name:!t))"
+    assert yd_api_fields([], "table") == \
+        "(geojson:!t,id:!t,photos:(license_code:!t,url:!t))"
+    assert _parse(API_FIELDS_ID) == {"id": {}}
+
+
+def test_union_projection_covers_every_column_and_photo_mode():
+    assert set(API_FIELDS) == set(COLUMN_EXTRACTORS)
+    union = _parse(API_FIELDS_ALL)
+    for champ in ALL_COLUMNS:
+        for mode in list(PHOTO_COLUMNS) + ["none"]:
+            narrow = _parse(yd_api_fields([champ], mode))
+            assert _project(narrow, union) == narrow
+    assert "description" not in _project(_observation(0), union)
+
+
+def _api(n):
+    """Faux yd_get_observations_v2 : projection par défaut API_FIELDS_ALL."""
+    calls = []
+    full = [_observation(i) for i in range(n)]
+
+    def get_observations(per_page, order_by, order, page=1, fields=None, **params):
+        calls.append(page)
+        tree = _parse(fields or API_FIELDS_ALL)
+        start = (page - 1) * per_page
+        return {"total_results": n,
+                "results": [_project(o, tree) for o in full[start:start + per_page]]}
+
+    return get_observations, calls, full
+
+
+def _rows(pages, fields, photo_mode):
+    row = yd_compile_columns(fields, photo_mode, lambda *parts: parts, lambda: None)
+    return [row(o, tuple(o["geojson"]["coordinates"]), max_photos=1) for o in pages]
+
+
+@pytest.mark.parametrize("photo_mode", ["one", "all", "table"])
+def test_selections_share_cached_pages(tmp_path, photo_mode):
+    get_observations, calls, full = _api(120)
+    cache = yd_ResponseCache(str(tmp_path / "c.sqlite"))
+    # Comme yd_engine : les paramètres ne dépendent pas des champs choisis
+    params = {"lat": 45.19, "lng": 5.72, "radius": 2}
+
+    def run():
+        return [o for page in yd_fetch_pages(
+            get_observations, params, per_page=50, cache=cache, max_workers=1,
+            limiter=yd_RateLimiter(rate=1e6, burst=1e6, max_rate=1e6),
+            log=lambda msg: None) for o in page]
+
+    first = run()
+    assert _rows(first, ["inat_id", "date_obs"], "none") == _rows(full, ["inat_id", "date_obs"], "none")
+    n_calls = len(calls)
+
+    # Autre sélection sur la même zone : tout vient du cache
+    second = run()
+    assert len(calls) == n_calls
+    assert _rows(second, ALL_COLUMNS, photo_mode) == _rows(full, ALL_COLUMNS, photo_mode)
+    cache.close()
@@ -0,0 +1,98 @@
+# ==============================================================
+# yd_batch : file de travaux par site (statuts, GPKG déjà présent,
+# erreur d'un site), rapport CSV, couche combinée avec site_id
+# (nécessite QGIS : yd_batch importe qgis.core)
+# ==============================================================
+
+import csv
+import os
+import sqlite3
+
+import pytest
+
+pytest.importorskip("qgis.core")
+pytest.importorskip("requests")
+
+from iNaturalist_Import import yd_batch  # noqa: E402
+from iNaturalist_Import.yd_engine import yd_layer_name  # noqa: E402
+from iNaturalist_Import.yd_gpkg import yd_GpkgWriter  # noqa: E402
+
+PROFILE = {"ordered_fields": ["inat_id", "taxon_id"], "photo_mode": "none"}
+SITES = [
+    {"site_id": "col", "lat": 45.2, "lon": 5.7, "radius_m": 500, "clip": None},
+    {"site_id": "lac", "lat": 45.3, "lon": 5.8, "radius_m": 800, "clip": None},
+    {"site_id": "panne", "lat": 45.4, "lon": 5.9, "radius_m": 300, "clip": None},
+]
+
+
+def _write_site(path, layer_name, lon, lat, n):
+    writer = yd_GpkgWriter(path)
+    writer.create_layer(layer_name, [("inat_id", "INTEGER"), ("taxon_id", "INTEGER")])
+    writer.insert(layer_name, [(lon, lat, [int(lat * 1000) + i, 64968]) for i in range(n)])
+    writer.close()
+
+
+@pytest.fixture
+def imports(monkeypatch):
+    calls = []
+
+    def fake_import(get_observations, params, ordered_fields, photo_mode, layer_name,
+                    gpkg_path=None, **kwargs):
+        calls.append(layer_name)
+        if "panne" in layer_name:
+            raise OSError("503 Server Error")
+        n = int(params["radius"] * 10)
+        _write_site(gpkg_path, layer_name, params["lng"], params["lat"], n)
+        return {"n_obs": n, "n_feats": n, "canceled": False,
+                "error": yd_batch.QgsVectorFileWriter.NoError}
+
+    monkeypatch.setattr(yd_batch, "yd_import_observations", fake_import)
+    return calls
+
+
+def _report(result):
+    with open(result["report_path"], encoding="utf-8") as f:
+        return list(csv.DictReader(f, delimiter=";"))
+
+
+def test_one_gpkg_per_site(tmp_path, imports):
+    # GPKG déjà présent : site ignoré, fichier intact
+    done = str(tmp_path / f"{yd_layer_name('col', 500)}.gpkg")
+    _write_site(done, yd_layer_name("col", 500), 5.7, 45.2, 1)
+    progress = []
+    result = yd_batch.yd_run_batch(None, SITES, PROFILE, str(tmp_path), workers=2,
+                                   progress=progress.append, log=lambda msg: None)
+    statuses = {job["site_id"]: job["status"] for job in result["jobs"]}
+    assert statuses == {"col": yd_batch.STATUS_SKIPPED, "lac": yd_batch.STATUS_OK,
+                        "panne": yd_batch.STATUS_ERROR}
+    assert sorted(imports) == [yd_layer_name("lac", 800), yd_layer_name("panne", 300)]
+    assert progress[-1] == 100.0 and result["combined"] is None
+
+    rows = _report(result)
+    assert [row["site_id"] for row in rows] == ["col", "lac", "panne"]
+    assert rows[1]["n_feats"] == "8" and "503" in rows[2]["error"]
+    assert os.path.exists(rows[1]["gpkg_path"])
+
+
+def test_combined_layer_with_site_id(tmp_path, imports):
+    result = yd_batch.yd_run_batch(None, SITES, PROFILE, str(tmp_path), batch_name="Vercors 2024",
+                                   output=yd_batch.OUTPUT_COMBINED, log=lambda msg: None)
+    gpkg_path, layer_name = result["combined"]
+    assert layer_name == "iNat_Vercors_2024_sites"
+    conn = sqlite3.connect(gpkg_path)
+    counts = dict(conn.execute(
+        f'SELECT site_id, COUNT(*) FROM "{layer_name}" GROUP BY site_id').fetchall())
+    conn.close()
+    # Site en erreur absent, GPKG temporaires supprimés
+    assert counts == {"col": 5, "lac": 8}
+    assert sorted(os.listdir(tmp_path)) == sorted(
+        [os.path.basename(gpkg_path), os.path.basename(result["report_path"])])
+
+
+def test_canceled_batch(tmp_path, imports):
+    result = yd_batch.yd_run_batch(None, SITES, PROFILE, str(tmp_path),
+                                   output=yd_batch.OUTPUT_COMBINED, is_canceled=lambda: True,
+                                   log=lambda msg: None)
+    assert result["canceled"] and result["combined"] is None and imports == []
+    assert {job["status"] for job in result["jobs"]} == {yd_batch.STATUS_CANCELED}
+    assert os.listdir(tmp_path) == [os.path.basename(result["report_path"])]
@@ -0,0 +1,122 @@
+# ==============================================================
+# yd_cache : cache SQLite des réponses API — clé, TTL, éviction LRU,
+# compteurs d'un run
+# ==============================================================
+
+from datetime import date
+
+import pytest
+
+from iNaturalist_Import import yd_cache
+from iNaturalist_Import.yd_cache import yd_ResponseCache, yd_cache_key
+from iNaturalist_Import.yd_fetch import yd_call
+from iNaturalist_Import.yd_ratelimit import yd_RateLimiter
+
+
+class _Clock:
+    """Horloge manuelle : les dates d'accès LRU ne dépendent plus de la machine."""
+
+    def __init__(self):
+        self.now = 1_000_000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = _Clock()
+    monkeypatch.setattr(yd_cache.time, "time", clock)
+    return clock
+
+
+def _response(i, size=2000):
+    # Contenu peu compressible pour maîtriser la taille stockée
+    return {"results": [{"id": i, "blob": "".join(chr(33 + (i * 7 + k * k) % 90)
+                                                   for k in range(size))}]}
+
+
+def test_cache_key_ignores_order_and_empty_params():
+    assert (yd_cache_key("obs", {"a": 1, "b": "x", "c": None, "d": ""})
+            == yd_cache_key("obs", {"b": "x", "a": 1}))
+    assert yd_cache_key("obs", {"a": 1}) != yd_cache_key("taxa", {"a": 1})
+    # Dates converties par pyinaturalist : même clé que leur forme ISO 8601
+    assert yd_cache_key("obs", {"d1": date(2024, 5, 1)}) == yd_cache_key("obs", {"d1": "2024-05-01"})
+
+
+def test_response_cache_ttl(tmp_path, clock):
+    cache = yd_ResponseCache(str(tmp_path / "c.sqlite"), ttl_s=60)
+    cache.put("k", {"results": [1]})
+    clock.now += 59
+    assert cache.get("k") == {"results": [1]}
+    clock.now += 2
+    assert cache.get("k") is None
+    # L'entrée périmée est supprimée et sa taille décomptée
+    assert cache._size == 0
+    assert cache.stats() == "cache API : 1 hits, 1 misses (50 %)"
+    cache.close()
+
+
+def test_response_cache_lru_eviction(tmp_path, clock):
+    path = str(tmp_path / "c.sqlite")
+    cache = yd_ResponseCache(path, ttl_s=None, max_bytes=10 ** 9)
+    for i in range(10):
+        clock.now += 1
+        cache.put(f"k{i}", _response(i))
+    entry = cache._size // 10
+    # k0 relu : il devient le plus récent et survit à l'éviction
+    clock.now += 1
+    assert cache.get("k0") is not None
+
+    cache.max_bytes = entry * 10 - 1
+    clock.now += 1
+    cache.put("k10", _response(10))
+    kept = {key for key in (f"k{i}" for i in range(11)) if cache.get(key) is not None}
+    assert cache._size <= int(cache.max_bytes * 0.9)
+    assert {"k0", "k10"} <= kept
+    assert "k1" not in kept and "k2" not in kept
+    cache.close()
+
+    # La taille suivie est celle relue au démarrage
+    reopened = yd_ResponseCache(path, ttl_s=None)
+    assert reopened._size == cache._size
+    reopened.close()
+
+
+def test_cache_stats_since_snapshot(tmp_path):
+    cache = yd_ResponseCache(str(tmp_path / "c.sqlite"))
+    cache.put("k", {"results": []})
+    cache.get("k")
+    snap = cache.snapshot()
+    cache.get("k")
+    cache.get("absent")
+    assert cache.stats(since=snap) == "cache API : 1 hits, 1 misses (50 %)"
+    assert cache.stats() == "cache API : 2 hits, 1 misses (67 %)"
+    cache.close()
+
+
+
+def test_call_served_from_cache_without_limiter_token(tmp_path):
+    cache = yd_ResponseCache(str(tmp_path / "c.sqlite"))
+    limiter = yd_RateLimiter(rate=1e6, burst=1e6, max_rate=1e6)
+    acquired = []
+    acquire = limiter.acquire
+    limiter.acquire = lambda: acquired.append(1) or acquire()
+    calls = []
+
+    def get_observations(**params):
+        calls.append(params)
+        return {"total_results": 1, "results": [{"id": len(calls)}]}
+
+    query = dict(limiter=limiter, cache=cache, lat=45.19, lng=5.72, radius=2, page=1)
+    assert yd_call(get_observations, **query) == {"total_results": 1, "results": [{"id": 1}]}
+    assert yd_call(get_observations, **query)["results"] == [{"id": 1}]
+    assert (len(calls), len(acquired)) == (1, 1)
+
+    # Autre page : autre clé ; refresh=True : API rappelée et cache réécrit
+    assert yd_call(get_observations, **dict(query, page=2))["results"] == [{"id": 2}]
+    assert yd_call(get_observations, refresh=True, **query)["results"] == [{"id": 3}]
+    assert yd_call(get_observations, **query)["results"] == [{"id": 3}]
+    assert (len(calls), len(acquired)) == (3, 3)
+    assert "limiter" not in calls[0] and "cache" not in calls[0]
+    cache.close()
@@ -0,0 +1,91 @@
+# ==============================================================
+# yd_columns : attributs d'une observation selon les colonnes choisies
+# et le mode photo, extracteurs compilés, dates mémoïsées
+# ==============================================================
+
+from datetime import date, datetime, timezone
+
+from iNaturalist_Import.yd_columns import COLUMN_EXTRACTORS, yd_compile_columns, yd_date_parts
+
+NOW = datetime(2000, 1, 1)
+OBS = {
+    "id": 300000001,
+    "time_observed_at": "2024-05-01T10:20:30+02:00",
+    "place_guess": "Grenoble",
+    "quality_grade": "research",
+    "positional_accuracy": 12,
+    "taxon": {"id": 64968, "name": "Bufo bufo", "rank": "species",
+              "preferred_common_name": "Crapaud commun"},
+    "user": {"login": "yd", "name": "Yves"},
+    "photos": [{"url": "https://static.inaturalist.org/photos/1/square.jpg"},
+               {"url": "https://static.inaturalist.org/photos/2/square.png"}],
+}
+COORDS = (5.72, 45.19)
+
+
+def _row(fields, photo_mode=None, obs=OBS, max_photos=0):
+    return yd_compile_columns(fields, photo_mode, datetime, lambda: NOW)(obs, COORDS, max_photos)
+
+
+def test_columns_follow_requested_order():
+    fields = ["taxon_id", "inat_id", "url_obs", "latitude", "longitude", "url_taxon",
+              "observateur_id", "vernacular_name_FR", "precision", "inconnu"]
+    assert _row(fields) == [
+        64968, 300000001, "https://www.inaturalist.org/observations/300000001",
+        45.19, 5.72, "https://www.inaturalist.org/taxa/64968", "yd", "Crapaud commun", 12,
+    ]
+
+
+def test_date_obs_and_fallback():
+    assert _row(["date_obs"]) == [datetime(2024, 5, 1, 10, 20, 30)]
+    assert _row(["date_obs"], obs={"observed_on": "2023-07-14"}) == [datetime(2023, 7, 14)]
+    assert _row(["date_obs"], obs={}) == [NOW]
+    assert yd_date_parts("pas une date") is None
+
+
+def test_photo_modes():
+    large = ["https://static.inaturalist.org/photos/1/large.jpg",
+             "https://static.inaturalist.org/photos/2/large.png"]
+    assert _row(["inat_id"], "one") == [300000001, large[0]]
+    assert _row(["inat_id"], "all", max_photos=4) == [300000001, 2] + large + [None, None]
+    assert _row(["inat_id"], "table") == [300000001, 2]
+    assert _row(["inat_id"], "one", obs={"id": 1, "photos": []}) == [1, None]
+    # Sans taxon ni utilisateur : valeurs vides, pas d'erreur
+    assert _row(["scientific_name", "url_taxon", "observateur_name"], obs={"id": 1}) == \
+        [None, None, None]
+
+
+def test_every_column_on_an_empty_observation():
+    fields = list(COLUMN_EXTRACTORS)
+    row = _row(fields, "all", obs={"id": 7})
+    assert len(row) == len(fields) + 1
+    values = dict(zip(fields, row))
+    assert values["inat_id"] == 7 and values["date_obs"] == NOW
+    assert (values["latitude"], values["longitude"]) == (45.19, 5.72)
+    assert values["url_obs"] == "https://www.inaturalist.org/observations/7"
+    assert row[-1] == 0 and all(values[f] is None for f in ("scientific_name", "taxon_id",
+                                                            "observateur_id", "precision"))
+
+
+def test_date_values_built_once_per_date():
+    built = []
+
+    def make_datetime(*parts):
+        built.append(parts)
+        return datetime(*parts)
+
+    row = yd_compile_columns(["date_obs"], None, make_datetime, lambda: NOW)
+    stamps = ["2024-05-01T10:20:30+02:00", "2024-05-01T08:20:30Z", "2024-05-01T10:20:30+02:00"]
+    values = [row({"time_observed_at": stamps[i % 3]}, COORDS)[0] for i in range(300)]
+    assert len(built) == 2
+    # Heure locale de l'observation, fuseau ignoré
+    assert values[:2] == [datetime(2024, 5, 1, 10, 20, 30), datetime(2024, 5, 1, 8, 20, 30)]
+
+
+def test_date_parts_from_parsed_values():
+    # Réponses non mises en cache : pyinaturalist a déjà converti les dates
+    aware = datetime(2024, 5, 1, 10, 20, 30, tzinfo=timezone.utc)
+    assert yd_date_parts(aware) == (2024, 5, 1, 10, 20, 30)
+    assert yd_date_parts(date(2023, 7, 14)) == (2023, 7, 14, 0, 0, 0)
+    assert yd_date_parts("2023-07-14") == (2023, 7, 14, 0, 0, 0)
+    assert yd_date_parts("") is None and yd_date_parts(None) is None
@@ -0,0 +1,133 @@
+# ==============================================================
+# yd_gpkg : validité des GPKG écrits directement en sqlite3
+# (intégrité SQLite, métadonnées GPKG, cohérence des index R-tree ;
+# relecture OGR si GDAL est installé)
+# ==============================================================
+
+import sqlite3
+
+import pytest
+
+from iNaturalist_Import.yd_gpkg import (
+    GPKG_APPLICATION_ID, yd_GpkgWriter, yd_gpkg_functions, _envelope
+)
+
+BIG_ID = 300000000   # id iNat actuels : au-delà de 2**24
+COLUMNS = [("inat_id", "INTEGER"), ("scientific_name", "TEXT(100)"), ("nb", "MEDIUMINT")]
+
+
+def _points(n):
+    return [(5.0 + i * 0.001, 45.0 + i * 0.0005, [BIG_ID + i, f"Taxon {i}", i % 7])
+            for i in range(n)]
+
+
+def _square(x, y, d=0.01):
+    return [(x, y), (x + d, y), (x + d, y + d), (x, y + d), (x, y)]
+
+
+@pytest.fixture
+def gpkg(tmp_path):
+    path = str(tmp_path / "test.gpkg")
+    writer = yd_GpkgWriter(path, batch_rows=100)
+    writer.create_layer("obs", COLUMNS)
+    writer.insert("obs", _points(250))
+    writer.create_layer("cells", [("cell_id", "TEXT(40)")], geometry="POLYGON")
+    writer.insert("cells", [(_square(5 + i * 0.02, 45), [f"c{i}"]) for i in range(10)])
+    writer.create_layer("obs_photos", [("inat_id", "INTEGER"), ("url", "TEXT(250)")],
+                        spatial=False)
+    writer.insert("obs_photos", [(BIG_ID, "https://example.org/1.jpg")])
+    writer.close()
+    return path
+
+
+def _check_rtree(conn, name):
+    # Une entrée R-tree par géométrie, aux bornes de son enveloppe
+    rtree = f"rtree_{name}_geom"
+    assert conn.execute(f"SELECT rtreecheck('{rtree}')").fetchone()[0] == "ok"
+    boxes = {row[0]: row[1:] for row in conn.execute(
+        f"SELECT id, minx, maxx, miny, maxy FROM {rtree}")}
+    geoms = dict(conn.execute(f"SELECT fid, geom FROM {name}").fetchall())
+    assert set(boxes) == set(geoms)
+    for fid, blob in geoms.items():
+        env = _envelope(blob)
+        assert boxes[fid] == pytest.approx(env, abs=1e-5)
+
+
+def test_gpkg_integrity_and_metadata(gpkg):
+    conn = sqlite3.connect(gpkg)
+    try:
+        assert conn.execute("PRAGMA integrity_check").fetchone()[0] == "ok"
+        assert conn.execute("PRAGMA foreign_key_check").fetchall() == []
+        assert conn.execute("PRAGMA application_id").fetchone()[0] == GPKG_APPLICATION_ID
+        assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "delete"
+        contents = dict(conn.execute("SELECT table_name, data_type FROM gpkg_contents"))
+        assert contents["obs"] == "features"
+        assert contents["cells"] == "features"
+        assert contents["obs_photos"] == "attributes"
+        geoms = dict(conn.execute(
+            "SELECT table_name, geometry_type_name FROM gpkg_geometry_columns"))
+        assert geoms == {"obs": "POINT", "cells": "POLYGON"}
+        extent = conn.execute(
+            "SELECT min_x, max_x, min_y, max_y FROM gpkg_contents WHERE table_name = 'obs'"
+        ).fetchone()
+        assert extent == pytest.approx((5.0, 5.249, 45.0, 45.1245))
+    finally:
+        conn.close()
+
+
+def test_gpkg_ids_are_64_bit_integers(gpkg):
+    conn = sqlite3.connect(gpkg)
+    try:
+        types = {row[1]: row[2] for row in conn.execute("PRAGMA table_info(obs)")}
+        assert types["inat_id"] == "INTEGER"
+        assert conn.execute("SELECT max(inat_id) FROM obs").fetchone()[0] == BIG_ID + 249
+    finally:
+        conn.close()
+
+
+def test_gpkg_rtree_consistent(gpkg):
+    conn = sqlite3.connect(gpkg)
+    try:
+        _check_rtree(conn, "obs")
+        _check_rtree(conn, "cells")
+    finally:
+        conn.close()
+
+
+def test_gpkg_rtree_after_sql_updates(gpkg):
+    # Écritures SQL ultérieures (photos, taxonomie, synthèse) : triggers R-tree
+    # résolus par les fonctions ST_* du plugin
+    conn = sqlite3.connect(gpkg)
+    yd_gpkg_functions(conn)
+    try:
+        conn.execute("UPDATE obs SET scientific_name = 'x' WHERE fid <= 100")
+        conn.execute("DELETE FROM obs WHERE fid > 200")
+        conn.commit()
+        assert conn.execute("PRAGMA integrity_check").fetchone()[0] == "ok"
+        _check_rtree(conn, "obs")
+    finally:
+        conn.close()
+
+    writer = yd_GpkgWriter(gpkg, resume=True)
+    writer.insert("obs", _points(3))
+    writer.close()
+    conn = sqlite3.connect(gpkg)
+    try:
+        _check_rtree(conn, "obs")
+    finally:
+        conn.close()
+
+
+def test_gpkg_opens_with_ogr(gpkg):
+    ogr = pytest.importorskip("osgeo.ogr")
+    ds = ogr.Open(gpkg)
+    assert ds is not None
+    layer = ds.GetLayerByName("obs")
+    assert layer.GetFeatureCount() == 250
+    assert layer.GetGeomType() == ogr.wkbPoint
+    defn = layer.GetLayerDefn()
+    inat = defn.GetFieldDefn(defn.GetFieldIndex("inat_id"))
+    assert inat.GetType() == ogr.OFTInteger64
+    feat = layer.GetNextFeature()
+    assert feat.GetFieldAsInteger64("inat_id") == BIG_ID
+    assert ds.GetLayerByName("cells").GetGeomType() == ogr.wkbPolygon
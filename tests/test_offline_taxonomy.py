@@ -0,0 +1,127 @@
+# ==============================================================
+# Taxonomie hors ligne : import de l'archive DwC-A (table remplacée d'un
+# bloc, ancienne table conservée en cas d'annulation), recherche et
+# résolution des 7 rangs sans réseau (yd_build_taxonomy_offline)
+# ==============================================================
+
+import zipfile
+
+import pytest
+
+from iNaturalist_Import import yd_taxo_store
+from iNaturalist_Import.yd_taxa import TAX_FIELDS, yd_build_taxonomy_offline
+from iNaturalist_Import.yd_taxo_store import yd_TaxonStore
+
+TAXA_HEADER = "id,taxonID,parentNameUsageID,scientificName,taxonRank\n"
+URI = "https://www.inaturalist.org/taxa/{}"
+
+
+def _archive(path, taxa, vernacular=None, language="french"):
+    lines = [TAXA_HEADER] + [
+        f"{URI.format(tid)},{URI.format(tid)},{URI.format(parent) if parent else ''},{name},{rank}\n"
+        for tid, parent, name, rank in taxa
+    ]
+    with zipfile.ZipFile(path, "w") as archive:
+        archive.writestr("inaturalist-taxonomy.dwca/taxa.csv", "".join(lines))
+        if vernacular is not None:
+            archive.writestr(
+                f"inaturalist-taxonomy.dwca/VernacularNames-{language}.csv",
+                "id,vernacularName,language\n" + "".join(
+                    f"{URI.format(tid)},{name},fr\n" for tid, name in vernacular),
+            )
+    return str(path)
+
+
+TAXA = [
+    (48460, None, "Life", "stateofmatter"),
+    (1, 48460, "Animalia", "kingdom"),
+    (20978, 1, "Amphibia", "class"),
+    (64968, 20978, "Bufo bufo", "species"),
+]
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = yd_TaxonStore(str(tmp_path / "t.sqlite"))
+    yield store
+    store.close()
+
+
+def test_import_dwca_and_lookup(store, tmp_path):
+    zip_path = _archive(tmp_path / "v1.zip", TAXA,
+                        vernacular=[(64968, "Crapaud commun"), (64968, "Crapaud épineux"),
+                                    (1, "Animaux")])
+    logs = []
+    assert store.import_dwca(zip_path, log=logs.append) == 4
+    assert store.offline_lookup([64968, 1, 999]) == {
+        64968: (20978, "species", "Bufo bufo", "Crapaud commun"),   # premier nom gardé
+        1: (48460, "kingdom", "Animalia", "Animaux"),
+    }
+    info = store.offline_info()
+    assert info["source"] == "v1.zip" and info["n_taxa"] == "4" and info["language"] == "french"
+    assert "2 noms vernaculaires" in logs[-1]
+
+
+def test_import_dwca_without_vernacular(store, tmp_path):
+    zip_path = _archive(tmp_path / "v1.zip", TAXA)
+    logs = []
+    assert store.import_dwca(zip_path, language="english", log=logs.append) == 4
+    assert store.offline_lookup([64968])[64968][3] is None
+    assert any("english" in msg for msg in logs)
+
+
+def test_import_dwca_swap_and_cancel(store, tmp_path, monkeypatch):
+    assert store.offline_info() is None
+    store.import_dwca(_archive(tmp_path / "v1.zip", TAXA), log=lambda msg: None)
+
+    # Nouvelle archive : remplace entièrement l'ancienne table
+    v2 = TAXA[:2] + [(3, 1, "Aves", "class")]
+    store.import_dwca(_archive(tmp_path / "v2.zip", v2), log=lambda msg: None)
+    assert set(store.offline_lookup([48460, 1, 20978, 64968, 3])) == {48460, 1, 3}
+    assert store.offline_info()["source"] == "v2.zip"
+
+    # Annulation après le premier lot : la table v2 reste utilisable
+    monkeypatch.setattr(yd_taxo_store, "DWCA_BATCH", 2)
+    progress = []
+    assert store.import_dwca(_archive(tmp_path / "v3.zip", TAXA), progress=progress.append,
+                             is_canceled=lambda: True, log=lambda msg: None) is None
+    assert progress == [2]
+    assert set(store.offline_lookup([48460, 1, 20978, 64968, 3])) == {48460, 1, 3}
+    assert store.offline_info()["source"] == "v2.zip"
+    tables = {row[0] for row in store._conn.execute("SELECT name FROM sqlite_master")}
+    assert "dwca_taxa_new" not in tables
+
+
+def test_import_dwca_rejects_archive_without_taxa(store, tmp_path):
+    path = tmp_path / "vide.zip"
+    with zipfile.ZipFile(path, "w") as archive:
+        archive.writestr("README.txt", "rien")
+    with pytest.raises(ValueError):
+        store.import_dwca(str(path), log=lambda msg: None)
+
+
+def test_build_taxonomy_offline(store, tmp_path):
+    logs = []
+    taxo_map, errors = yd_build_taxonomy_offline(store, [64968], log=logs.append)
+    assert errors == 1 and taxo_map == {}
+    assert "DwC-A" in logs[-1]
+
+    # Rang sauté (pas d'embranchement) et rang intermédiaire (sous-ordre) ignoré
+    taxa = TAXA[:3] + [(20979, 20978, "Anura", "order"), (1107, 20979, "Neobatrachia", "suborder"),
+                       (21008, 1107, "Bufonidae", "family"), (21009, 21008, "Bufo", "genus"),
+                       (64968, 21009, "Bufo bufo", "species"), (7, 1, "Chordata incertae", "genus")]
+    store.import_dwca(_archive(tmp_path / "v1.zip", taxa), log=lambda msg: None)
+    progress = []
+    taxo_map, errors = yd_build_taxonomy_offline(
+        store, [64968, 20978, 7, 999], log=logs.append,
+        on_taxon=lambda done, total, tid: progress.append((done, total)))
+    assert errors == 1 and taxo_map[999] == {field: "" for field in TAX_FIELDS}
+    assert taxo_map[64968] == {"kingdom": "Animalia", "phylum": "", "class": "Amphibia",
+                               "order": "Anura", "family": "Bufonidae", "genus": "Bufo",
+                               "species": "Bufo bufo"}
+    assert taxo_map[20978] == dict.fromkeys(TAX_FIELDS, "") | {"kingdom": "Animalia",
+                                                               "class": "Amphibia"}
+    assert taxo_map[7]["kingdom"] == "Animalia" and taxo_map[7]["genus"] == "Chordata incertae"
+    # Un niveau de parenté par requête (Bufo bufo → Amphibia : 5 niveaux)
+    assert progress[0] == (3, 4) and progress[-1][0] == 3
+    assert "🌳 8 taxons lus hors ligne en 5 niveaux" in logs
@@ -0,0 +1,89 @@
+# ==============================================================
+# yd_photos : éviction LRU du cache partagé du dossier et chemins
+# photo_path des autres couches
+# ==============================================================
+
+import sqlite3
+
+import pytest
+
+pytest.importorskip("requests")
+
+from iNaturalist_Import.yd_gpkg import yd_GpkgWriter  # noqa: E402
+from iNaturalist_Import.yd_photos import (  # noqa: E402
+    PHOTO_DIR, yd_PhotoCache, yd_forget_photos, yd_photo_cache_dir
+)
+
+
+def _layer(path, name, paths):
+    writer = yd_GpkgWriter(str(path))
+    writer.create_layer(name, [("inat_id", "INTEGER"), ("url_photo1", "TEXT(250)"),
+                               ("photo_path1", "TEXT(120)")])
+    writer.insert(name, [(5.0, 45.0, [i, url, p]) for i, (url, p) in enumerate(paths)])
+    writer.create_layer(f"{name}_photos", [("inat_id", "INTEGER"), ("photo_path", "TEXT(120)")],
+                        spatial=False)
+    writer.insert(f"{name}_photos", [[i, p] for i, (_, p) in enumerate(paths)])
+    writer.close()
+
+
+def test_eviction_clears_paths_of_other_layers(tmp_path):
+    cache = yd_PhotoCache(yd_photo_cache_dir(str(tmp_path / "a.gpkg")), max_bytes=10 ** 9)
+    old = {f"https://x/{i}/large.jpg": cache.store(f"https://x/{i}/large.jpg", b"%d" % i * 1000)
+           for i in range(4)}
+    new = {f"https://y/{i}/large.jpg": cache.store(f"https://y/{i}/large.jpg", b"n%d" % i * 1000)
+           for i in range(4)}
+    _layer(tmp_path / "a.gpkg", "obs_a", [(url, f"{PHOTO_DIR}/{rel}") for url, (_, rel) in old.items()])
+    _layer(tmp_path / "b.gpkg", "obs_b", [(url, f"{PHOTO_DIR}/{rel}") for url, (_, rel) in new.items()])
+
+    # Récolte de obs_b : ses photos sont épinglées, celles de obs_a partent
+    cache.max_bytes = cache.size() - 1
+    evicted = cache.evict(pinned=(sha for sha, _ in new.values()))
+    assert evicted and set(evicted) <= {rel for _, rel in old.values()}
+    assert len(cache.lookup(old)) == 4 - len(evicted)
+    assert len(cache.lookup(new)) == 4
+
+    logs = []
+    lost = yd_forget_photos(str(tmp_path), evicted, log=logs.append)
+    assert lost == {("a.gpkg", "obs_a"): len(evicted), ("a.gpkg", "obs_a_photos"): len(evicted)}
+    assert any("obs_a" in msg for msg in logs)
+    conn = sqlite3.connect(str(tmp_path / "a.gpkg"))
+    gone = {f"{PHOTO_DIR}/{rel}" for rel in evicted}
+    kept = [row[0] for row in conn.execute("SELECT photo_path1 FROM obs_a")]
+    conn.close()
+    assert not gone & set(kept) and kept.count(None) == len(evicted)
+    conn = sqlite3.connect(str(tmp_path / "b.gpkg"))
+    assert None not in {row[0] for row in conn.execute("SELECT photo_path1 FROM obs_b")}
+    conn.close()
+    cache.close()
+
+
+def test_forget_photos_without_eviction(tmp_path):
+    assert yd_forget_photos(str(tmp_path), []) == {}
+
+
+def test_harvest_writes_paths_then_evicts_other_layer(tmp_path, monkeypatch):
+    from iNaturalist_Import import yd_photos
+
+    def get_photo(url):
+        return url.encode("utf-8") * 500
+
+    monkeypatch.setattr(yd_photos, "get_photo", get_photo)
+    quiet = dict(workers=2, log=lambda msg: None)
+    _layer(tmp_path / "a.gpkg", "obs_a", [(f"https://x/{i}/large.jpg", None) for i in range(3)])
+    _layer(tmp_path / "b.gpkg", "obs_b", [(f"https://y/{i}/large.jpg", None) for i in range(3)])
+
+    result = yd_photos.yd_harvest_photos(str(tmp_path / "a.gpkg"), "obs_a", "one", **quiet)
+    assert (result["n_downloaded"], result["lost"]) == (3, {})
+    # Cache trop petit pour les deux couches : obs_a perd ses photos
+    result = yd_photos.yd_harvest_photos(str(tmp_path / "b.gpkg"), "obs_b", "one",
+                                         max_bytes=4 * 8500, **quiet)
+    assert result["n_downloaded"] == 3
+    assert result["lost"] == {("a.gpkg", "obs_a"): 3}
+    for name, layer, expected in (("a.gpkg", "obs_a", {None}), ("b.gpkg", "obs_b", None)):
+        conn = sqlite3.connect(str(tmp_path / name))
+        paths = {row[0] for row in conn.execute(f"SELECT photo_path1 FROM {layer}")}
+        conn.close()
+        if expected is None:
+            assert None not in paths and all(p.startswith(PHOTO_DIR) for p in paths)
+        else:
+            assert paths == expected
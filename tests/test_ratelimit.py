@@ -0,0 +1,136 @@
+# ==============================================================
+# yd_ratelimit : lecture de Retry-After (secondes, date HTTP, invalide),
+# débit adaptatif (AIMD), pause partagée après un 429
+# ==============================================================
+
+import time
+from email.utils import formatdate
+
+import pytest
+
+from iNaturalist_Import import yd_ratelimit
+from iNaturalist_Import.yd_fetch import yd_call_retry
+from iNaturalist_Import.yd_ratelimit import (
+    DEBIT_FACTEUR, DEBIT_PAS, PAUSE_429_S, yd_RateLimiter, yd_retry_after
+)
+
+
+class _Response:
+    def __init__(self, headers):
+        self.headers = headers
+
+
+class _HTTPError(OSError):
+    def __init__(self, headers=None):
+        super().__init__("429 Too Many Requests")
+        self.response = _Response(headers) if headers is not None else None
+        if self.response is not None:
+            self.response.status_code = 429
+
+
+class _Clock:
+    """
+    Temps simulé : sleep() avance l'horloge au lieu d'attendre. Débits
+    en puissances de 2 : les jetons recalculés tombent juste.
+    """
+
+    def __init__(self):
+        self.now = 1_000.0
+        self.slept = []
+
+    def monotonic(self):
+        return self.now
+
+    def time(self):
+        return self.now
+
+    def sleep(self, s):
+        self.slept.append(s)
+        self.now += s
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = _Clock()
+    monkeypatch.setattr(yd_ratelimit, "time", clock)
+    return clock
+
+
+@pytest.mark.parametrize("value, expected", [
+    ("120", 120.0),
+    ("1.5", 1.5),
+    ("0", 0.0),
+    ("-3", 0.0),
+])
+def test_retry_after_seconds(value, expected):
+    assert yd_retry_after(_HTTPError({"Retry-After": value})) == expected
+
+
+def test_retry_after_http_date():
+    value = formatdate(time.time() + 90, usegmt=True)
+    assert yd_retry_after(_HTTPError({"Retry-After": value})) == pytest.approx(90, abs=2)
+    past = formatdate(time.time() - 3600, usegmt=True)
+    assert yd_retry_after(_HTTPError({"Retry-After": past})) == 0.0
+
+
+@pytest.mark.parametrize("error", [
+    _HTTPError({"Retry-After": "bientôt"}),
+    _HTTPError({"Retry-After": ""}),
+    _HTTPError({}),
+    _HTTPError(),
+    ValueError("pas une erreur HTTP"),
+])
+def test_retry_after_missing_or_invalid(error):
+    assert yd_retry_after(error) is None
+
+
+def test_token_bucket_burst_then_rate(clock):
+    limiter = yd_RateLimiter(rate=2.0, burst=3)
+    for _ in range(3):
+        limiter.acquire()
+    assert clock.slept == []
+    limiter.acquire()
+    assert sum(clock.slept) == pytest.approx(0.5)
+    assert (limiter.calls, limiter.waits) == (4, 1)
+
+
+def test_aimd_rate_between_bounds(clock):
+    limiter = yd_RateLimiter(rate=1.0, min_rate=0.2, max_rate=1.5)
+    for _ in range(100):
+        limiter.success()
+    assert limiter.rate == 1.5
+    limiter.throttled(0)
+    assert limiter.rate == pytest.approx(1.5 * DEBIT_FACTEUR)
+    limiter.success()
+    assert limiter.rate == pytest.approx(1.5 * DEBIT_FACTEUR + DEBIT_PAS)
+    for _ in range(10):
+        limiter.throttled(0)
+    assert limiter.rate == 0.2
+
+
+def test_throttled_pauses_every_caller(clock):
+    limiter = yd_RateLimiter(rate=4.0, burst=10)
+    assert limiter.throttled(None) == PAUSE_429_S
+    assert limiter.throttled(12.0) == 12.0
+    start = clock.now
+    limiter.acquire()
+    # Pause la plus longue en cours, jetons vidés
+    assert clock.now - start >= PAUSE_429_S
+    assert limiter.stats().endswith(f"2 × 429, débit {limiter.rate:.2f} req/s")
+
+
+def test_call_retry_waits_retry_after_then_succeeds(clock):
+    limiter = yd_RateLimiter(rate=4.0, burst=10)
+    answers = [_HTTPError({"Retry-After": "7"}), {"results": [1]}]
+    logs = []
+
+    def get_observations(**params):
+        answer = answers.pop(0)
+        if isinstance(answer, Exception):
+            raise answer
+        return answer
+
+    assert yd_call_retry(get_observations, retries=2, log=logs.append,
+                         limiter=limiter) == {"results": [1]}
+    assert limiter.throttles == 1 and sum(clock.slept) >= 7
+    assert "pause 7s" in logs[0]
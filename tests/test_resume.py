@@ -0,0 +1,122 @@
+# ==============================================================
+# Reprise d'un import interrompu : curseur id_above, coupure réseau en
+# cours de pagination, lignes écrites après le point de reprise, journal
+# ==============================================================
+
+import pytest
+
+from iNaturalist_Import import yd_fetch, yd_journal
+from iNaturalist_Import.yd_fetch import MODE_ID_ABOVE, MODE_PAGES, yd_fetch_pages
+from iNaturalist_Import.yd_gpkg import yd_GpkgWriter
+from iNaturalist_Import.yd_ratelimit import yd_RateLimiter
+
+N_OBS = 1000
+PER_PAGE = 50
+
+
+def _limiter():
+    # Pas d'attente entre les appels simulés
+    return yd_RateLimiter(rate=1e6, burst=1e6, max_rate=1e6)
+
+
+def _api(ids):
+    """Faux get_observations : tri par id croissant, id_above ou page."""
+    calls = []
+
+    def get_observations(per_page, order_by, order, page=1, id_above=None, **params):
+        assert (order_by, order) == ("id", "asc")
+        calls.append(dict(page=page, id_above=id_above))
+        rest = [i for i in ids if id_above is None or i > id_above]
+        start = (page - 1) * per_page if id_above is None else 0
+        return {"total_results": len(rest),
+                "results": [{"id": i} for i in rest[start:start + per_page]]}
+
+    return get_observations, calls
+
+
+def _fetch(get_observations, **kwargs):
+    return [obs["id"] for page in yd_fetch_pages(
+        get_observations, {}, per_page=PER_PAGE, limiter=_limiter(),
+        log=lambda msg: None, **kwargs) for obs in page]
+
+
+def test_id_above_resumes_strictly_after_cursor():
+    ids = list(range(10, 10 + 3 * N_OBS, 3))
+    get_observations, calls = _api(ids)
+    cursor = ids[437]
+    assert _fetch(get_observations, id_above=cursor, mode=MODE_PAGES) == ids[438:]
+    # La reprise impose la pagination par curseur, même si on demande des pages
+    assert all(c["page"] == 1 and c["id_above"] is not None for c in calls)
+
+
+def test_resume_after_interruption_writes_each_id_once(tmp_path):
+    ids = list(range(1, N_OBS + 1))
+    get_observations, _ = _api(ids)
+    path = str(tmp_path / "reprise.gpkg")
+
+    # Premier import : interrompu après le point de reprise validé, avec des
+    # lignes (et photos) écrites au-delà du curseur
+    cursor = 420
+    writer = yd_GpkgWriter(path)
+    writer.create_layer("obs", [("inat_id", "INTEGER")])
+    writer.create_layer("obs_photos", [("inat_id", "INTEGER")], spatial=False)
+    fetched = _fetch(get_observations)[:cursor + 37]
+    writer.insert("obs", [(5.0, 45.0, [i]) for i in fetched])
+    writer.insert("obs_photos", [[i] for i in fetched])
+    writer.commit()
+    writer._conn.close()   # arrêt brutal : ni index R-tree ni close()
+
+    # Reprise : comme yd_engine, on supprime ce qui suit le curseur puis
+    # on repart de id_above=cursor
+    writer = yd_GpkgWriter(path, resume=True)
+    for name in ("obs", "obs_photos"):
+        writer.delete_above(name, "inat_id", cursor)
+        assert writer.ids(name, "inat_id") == set(ids[:cursor])
+    rest = _fetch(get_observations, id_above=cursor)
+    writer.insert("obs", [(5.0, 45.0, [i]) for i in rest])
+    written = sorted(row[2] for row in writer.rows("obs", ["inat_id"]))
+    writer.close()
+    assert written == ids
+
+
+@pytest.mark.parametrize("mode", [MODE_PAGES, MODE_ID_ABOVE])
+def test_network_error_mid_pagination_resumes_from_last_page(monkeypatch, mode):
+    monkeypatch.setattr(yd_fetch, "BACKOFF_S", 0)
+    ids = list(range(1, N_OBS + 1))
+    get_observations, calls = _api(ids)
+
+    def flaky(**params):
+        # Réseau coupé après 7 pages : toutes les tentatives échouent
+        if len(calls) >= 7:
+            raise ConnectionError("connexion perdue")
+        return get_observations(**params)
+
+    flaky.__name__ = "get_observations"
+    received = []
+    with pytest.raises(ConnectionError):
+        for page in yd_fetch_pages(flaky, {}, per_page=PER_PAGE, limiter=_limiter(), mode=mode,
+                                   max_workers=1, log=lambda msg: None):
+            received.extend(obs["id"] for obs in page)
+    # Pages rendues dans l'ordre : le dernier id reçu est un curseur sûr
+    assert received == ids[:len(received)] and 0 < len(received) < N_OBS
+    assert _fetch(get_observations, id_above=received[-1]) == ids[len(received):]
+
+
+@pytest.fixture
+def journal_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(yd_journal, "JOURNAL_DIR", str(tmp_path / "journaux"))
+    return tmp_path
+
+
+def test_journal_keeps_last_cursor_of_existing_gpkg(journal_dir):
+    gone = str(journal_dir / "supprime.gpkg")
+    kept = journal_dir / "garde.gpkg"
+    kept.write_bytes(b"")
+    yd_journal.yd_journal_write({"gpkg_path": str(kept), "cursor": 100})
+    yd_journal.yd_journal_write({"gpkg_path": str(kept), "cursor": 250})
+    yd_journal.yd_journal_write({"gpkg_path": gone, "cursor": 999})
+    last = yd_journal.yd_journal_last()
+    assert last["gpkg_path"] == str(kept) and last["cursor"] == 250
+
+    yd_journal.yd_journal_clear(str(kept))
+    assert yd_journal.yd_journal_last() is None
@@ -0,0 +1,66 @@
+# ==============================================================
+# yd_gpkg : informations de synchro de la mise à jour delta (Script 3) —
+# aller-retour, compteur de mises à jour sans balayage, table ancienne
+# ==============================================================
+
+import json
+import sqlite3
+
+from iNaturalist_Import.yd_gpkg import (
+    SYNC_TABLE, yd_GpkgWriter, yd_read_sync_info, yd_sync_timestamp, yd_write_sync_info
+)
+
+PARAMS = {"lat": 45.19, "lng": 5.72, "radius": 2, "quality_grade": "research"}
+FIELDS = ["inat_id", "scientific_name"]
+
+
+def _gpkg(tmp_path):
+    path = str(tmp_path / "obs.gpkg")
+    writer = yd_GpkgWriter(path)
+    writer.create_layer("obs", [("inat_id", "INTEGER")])
+    writer.close()
+    return path
+
+
+def test_sync_info_round_trip(tmp_path):
+    path = _gpkg(tmp_path)
+    assert yd_read_sync_info(path, "obs") is None
+    stamp = yd_sync_timestamp()
+    yd_write_sync_info(path, "obs", stamp, PARAMS, FIELDS, "one", clip="POLYGON((0 0,1 0,1 1,0 0))")
+    assert yd_read_sync_info(path, "obs") == {
+        "last_sync": stamp, "params": PARAMS, "fields": FIELDS, "photo_mode": "one",
+        "clip": "POLYGON((0 0,1 0,1 1,0 0))", "n_refresh": 0,
+    }
+    assert yd_read_sync_info(path, "autre") is None
+    conn = sqlite3.connect(path)
+    assert conn.execute("SELECT data_type FROM gpkg_contents WHERE table_name = ?",
+                        (SYNC_TABLE,)).fetchone() == ("attributes",)
+    conn.close()
+
+
+def test_refresh_count_until_sweep(tmp_path):
+    path = _gpkg(tmp_path)
+    yd_write_sync_info(path, "obs", "2024-01-01T00:00:00+00:00", PARAMS, FIELDS, "none")
+    # Comme le Script 3 : +1 par mise à jour sans balayage, 0 après un balayage
+    for expected in (1, 2, 3):
+        n_refresh = yd_read_sync_info(path, "obs")["n_refresh"] + 1
+        yd_write_sync_info(path, "obs", yd_sync_timestamp(), PARAMS, FIELDS, "none",
+                           n_refresh=n_refresh)
+        assert yd_read_sync_info(path, "obs")["n_refresh"] == expected
+    yd_write_sync_info(path, "obs", yd_sync_timestamp(), PARAMS, FIELDS, "none", n_refresh=0)
+    assert yd_read_sync_info(path, "obs")["n_refresh"] == 0
+
+
+def test_sync_table_from_older_version(tmp_path):
+    path = _gpkg(tmp_path)
+    conn = sqlite3.connect(path)
+    conn.execute(f"CREATE TABLE {SYNC_TABLE} (layer_name TEXT PRIMARY KEY, last_sync TEXT NOT NULL,"
+                 " params TEXT NOT NULL, fields TEXT NOT NULL, photo_mode TEXT NOT NULL)")
+    conn.execute(f"INSERT INTO {SYNC_TABLE} VALUES (?, ?, ?, ?, ?)",
+                 ("obs", "2024-01-01T00:00:00+00:00", json.dumps(PARAMS), json.dumps(FIELDS), "one"))
+    conn.commit()
+    conn.close()
+    info = yd_read_sync_info(path, "obs")
+    assert (info["clip"], info["n_refresh"]) == (None, 0)
+    yd_write_sync_info(path, "obs", yd_sync_timestamp(), PARAMS, FIELDS, "one", n_refresh=4)
+    assert yd_read_sync_info(path, "obs")["n_refresh"] == 4
@@ -0,0 +1,97 @@
+# ==============================================================
+# yd_taxa : requêtes /taxa groupées, découpage d'un lot refusé (4xx),
+# arrêt sur API indisponible, référentiel persistant alimenté
+# ==============================================================
+
+import pytest
+
+from iNaturalist_Import import yd_fetch, yd_taxa
+from iNaturalist_Import.yd_ratelimit import yd_RateLimiter
+from iNaturalist_Import.yd_taxa import TAXA_BATCH, yd_build_taxonomy, yd_fetch_taxa
+from iNaturalist_Import.yd_taxo_store import yd_TaxonStore
+
+
+class _HTTPError(OSError):
+    # Comme requests.exceptions.HTTPError : OSError avec .response.status_code
+    def __init__(self, status):
+        super().__init__(f"{status} Error")
+        self.response = type("Response", (), {"status_code": status, "headers": {}})()
+
+
+@pytest.fixture(autouse=True)
+def fast(monkeypatch):
+    monkeypatch.setattr(yd_fetch, "yd_LIMITEUR", yd_RateLimiter(rate=1e6, burst=1e6, max_rate=1e6))
+    monkeypatch.setattr(yd_fetch, "BACKOFF_S", 0)
+    monkeypatch.setattr(yd_taxa, "MAX_RETRIES_429", 0)
+
+
+def _taxon(tid):
+    return {"id": tid, "rank": "species", "rank_level": 10, "name": f"Taxon {tid}",
+            "ancestor_ids": [48460, tid]}
+
+
+def _api(refused=(), error=None):
+    calls = []
+
+    def get_taxa(taxon_id):
+        calls.append(list(taxon_id))
+        if error is not None:
+            raise error
+        if set(refused) & set(taxon_id):
+            raise _HTTPError(422)
+        return {"results": [_taxon(tid) for tid in taxon_id]}
+
+    return get_taxa, calls
+
+
+def test_batches_of_at_most_taxa_batch_ids():
+    get_taxa, calls = _api()
+    cache = {}
+    assert yd_fetch_taxa(get_taxa, list(range(1, 71)) + [5], cache, log=lambda msg: None) == 0
+    assert [len(c) for c in calls] == [TAXA_BATCH, TAXA_BATCH, 10]
+    assert len(cache) == 70
+
+
+def test_client_error_bisects_to_the_refused_id():
+    get_taxa, calls = _api(refused={17})
+    cache, logs = {}, []
+    assert yd_fetch_taxa(get_taxa, list(range(1, 31)), cache, log=logs.append) == 1
+    assert cache[17] is None
+    assert all(cache[tid] for tid in range(1, 31) if tid != 17)
+    assert len(calls) <= 2 * 5 + 1   # une branche redécoupée jusqu'à l'id
+    assert any("HTTP 422" in msg and "17" in msg for msg in logs)
+
+
+@pytest.mark.parametrize("error", [_HTTPError(503), _HTTPError(429), OSError("réseau")])
+def test_unavailable_api_stops_without_bisect(tmp_path, error):
+    get_taxa, calls = _api(error=error)
+    store = yd_TaxonStore(str(tmp_path / "t.sqlite"))
+    logs = []
+    with pytest.raises(OSError):
+        yd_fetch_taxa(get_taxa, list(range(1, 61)), {}, log=logs.append, store=store)
+    assert calls == [list(range(1, 31))]
+    assert sum("indisponible" in msg for msg in logs) == 1
+    store.close()
+
+
+def test_received_taxa_are_kept_when_the_api_fails(tmp_path):
+    store = yd_TaxonStore(str(tmp_path / "t.sqlite"))
+    served = []
+
+    def get_taxa(taxon_id):
+        if served:
+            raise _HTTPError(502)
+        served.append(taxon_id)
+        return {"results": [_taxon(tid) for tid in taxon_id]}
+
+    with pytest.raises(OSError):
+        yd_build_taxonomy(get_taxa, list(range(1, 61)), log=lambda msg: None, store=store)
+    assert set(store.get_many(range(1, 61))) == set(range(1, 31))
+
+    # Relance : le premier lot vient du référentiel, l'API ne voit que le reste
+    get_taxa, calls = _api()
+    taxo_map, errors = yd_build_taxonomy(get_taxa, list(range(1, 61)), log=lambda msg: None,
+                                         store=store)
+    assert errors == 0 and len(taxo_map) == 60
+    assert calls[0] == list(range(31, 61))
+    store.close()
@@ -0,0 +1,74 @@
+# ==============================================================
+# yd_taxo_store : référentiel taxonomique persistant partagé par les
+# couches — TTL, éviction LRU, mise à jour, compteurs d'un run
+# ==============================================================
+
+import pytest
+
+from iNaturalist_Import import yd_taxo_store
+from iNaturalist_Import.yd_taxo_store import yd_TaxonStore
+
+INFO = {"rank": "species", "rank_level": 10, "name": "Bufo bufo",
+        "ancestor_ids": [48460, 1, 2], "common_name": "Crapaud commun"}
+
+
+class _Clock:
+    """Horloge manuelle : les dates d'accès LRU ne dépendent plus de la machine."""
+
+    def __init__(self):
+        self.now = 1_000_000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = _Clock()
+    monkeypatch.setattr(yd_taxo_store.time, "time", clock)
+    return clock
+
+
+def test_taxon_store_ttl_and_lru(tmp_path, clock):
+    store = yd_TaxonStore(str(tmp_path / "t.sqlite"), ttl_s=100, max_rows=10)
+    store.put_many({1: INFO, 2: None})
+    assert store.get_many([1, 2]) == {1: INFO}
+
+    clock.now += 101
+    assert store.get_many([1]) == {}
+
+    for i in range(10, 19):         # 1 (périmé) + 9 = 10 lignes : pas d'éviction
+        clock.now += 1
+        store.put_many({i: dict(INFO, name=f"T{i}")})
+    clock.now += 1
+    store.get_many([10])            # 10 relu : le plus récent
+    clock.now += 1
+    store.put_many({99: INFO})      # 11 lignes > 10 : 1 et 11 partent
+    kept = set(store.get_many(list(range(10, 19)) + [99]))
+    assert kept == {10, 99} | set(range(12, 19))
+    store.close()
+
+
+def test_stale_taxon_replaced_and_kept_across_sessions(tmp_path, clock):
+    path = str(tmp_path / "t.sqlite")
+    store = yd_TaxonStore(path, ttl_s=100)
+    store.put_many({1: INFO})
+    clock.now += 101
+    # Taxon redemandé à l'API (refresh) : nouvelle date, nouveau nom
+    store.put_many({1: dict(INFO, name="Bufo spinosus", ancestor_ids=[])})
+    store.close()
+
+    reopened = yd_TaxonStore(path, ttl_s=100)
+    assert reopened.get_many([1]) == {1: dict(INFO, name="Bufo spinosus", ancestor_ids=[])}
+    reopened.close()
+
+
+def test_stats_since_snapshot(tmp_path):
+    store = yd_TaxonStore(str(tmp_path / "t.sqlite"))
+    store.put_many({1: INFO, 2: INFO})
+    store.get_many([1, 3])
+    snap = store.snapshot()
+    store.get_many([1, 2, 4, 5])
+    assert store.stats(since=snap) == "référentiel taxonomique : 2 hits, 2 misses (50 %), 2 taxons"
+    assert store.stats() == "référentiel taxonomique : 3 hits, 3 misses (50 %), 2 taxons"
+    store.close()